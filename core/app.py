@@ -7,6 +7,9 @@ class App:
         self.services: Dict[str, Any] = {}
         self.systems = []
         self.entities: Dict[str, Any] = {}
+        # Set in processing worker processes; collectors and mounts belong to
+        # the main process.
+        self.worker_id = None
 
     def add_system(self, system_factory: Callable):
         self.systems.append(system_factory(self))
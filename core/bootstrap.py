@@ -0,0 +1,22 @@
+from core.app import App
+from core.config.config import Config
+from core.providers.app_entity_provider import AppEntityProvider
+from core.providers.app_service_provider import AppServiceProvider
+from core.providers.app_system_provider import AppSystemProvider
+
+
+async def create_app(worker_id=None) -> App:
+    config = Config()
+    app = App()
+    app.worker_id = worker_id
+
+    app.bind('config', lambda: config)
+    app.configuration = config
+
+    await app.register(AppServiceProvider)
+    await app.register(AppEntityProvider)
+    await app.register(AppSystemProvider)
+
+    await app.boot()
+
+    return app
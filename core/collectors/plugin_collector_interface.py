@@ -1,6 +1,26 @@
-from abc import ABC, abstractmethod
+from abc import ABC
+from typing import AsyncIterator, List
+
+from core.entities.scrap import Scrap
+
 
 class PluginCollectorInterface(ABC):
-    @abstractmethod
-    async def collect(self):
+    # Collectors implement either stream(), yielding scraps as they are found,
+    # or collect(), returning one cycle's scraps as a list. Each has a default
+    # built on the other, so list-returning collectors keep working unchanged.
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.stream is PluginCollectorInterface.stream and cls.collect is PluginCollectorInterface.collect:
+            raise TypeError(f"{cls.__name__} must implement stream() or collect().")
+
+    async def stream(self) -> AsyncIterator[Scrap]:
+        for scrap in await self.collect() or []:
+            yield scrap
+
+    async def collect(self) -> List[Scrap]:
+        return [scrap async for scrap in self.stream()]
+
+    # Called once when collection stops, to release watchers, connections and
+    # the like.
+    async def close(self):
         pass
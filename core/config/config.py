@@ -92,6 +92,31 @@ class Config:
             "port": self.get('postgres.port', '5432'),
         }
 
+    def get_write_buffer_config(self):
+        return {
+            "flush_interval_ms": int(self.get('write_buffer.flush_interval_ms', 200)),
+            "max_rows": int(self.get('write_buffer.max_rows', 500)),
+        }
+
+    def get_dedup_config(self):
+        return {
+            "enabled": str(self.get('dedup.enabled', True)).lower() == 'true',
+            "capacity": int(self.get('dedup.capacity', 10_000_000)),
+            "error_rate": float(self.get('dedup.error_rate', 0.001)),
+            "lru_size": int(self.get('dedup.lru_size', 100_000)),
+            "refresh_interval": float(self.get('dedup.refresh_interval', 30)),
+            "snapshot_path": self.get('dedup.snapshot_path', 'data/dedup_snapshot.bin'),
+            "snapshot_interval": float(self.get('dedup.snapshot_interval', 300)),
+        }
+
+    def get_hashing_config(self):
+        return {
+            "algorithm": str(self.get('hashing.algorithm', 'sha256')).lower(),
+            "prefix_fingerprint": str(self.get('hashing.prefix_fingerprint', True)).lower() == 'true',
+            "prefix_size": int(self.get('hashing.prefix_size', 64 * 1024)),
+            "report_sha256": str(self.get('hashing.report_sha256', True)).lower() == 'true',
+        }
+
     def get_elasticsearch_config(self):
         return {
             "host": self.get('elasticsearch.host', 'localhost'),
@@ -99,13 +124,99 @@ class Config:
             "scheme": self.get('elasticsearch.scheme', 'http'),
             "user": self.get('elasticsearch.user', 'elastic'),
             "password": self.get('elasticsearch.password', 'password'),
+            "chunk_size": int(self.get('elasticsearch.chunk_size', 1_000_000)),
+            "max_pending_chunks": int(self.get('elasticsearch.max_pending_chunks', 2)),
+            "lookup_batch_size": int(self.get('elasticsearch.lookup_batch_size', 1000)),
+            "lookup_max_wait_ms": float(self.get('elasticsearch.lookup_max_wait_ms', 5)),
+            "chunking": self.get('elasticsearch.chunking', 'content_defined'),
+            "fingerprint_cache_size": int(self.get('elasticsearch.fingerprint_cache_size', 100_000)),
+            "reference_batch_size": int(self.get('elasticsearch.reference_batch_size', 1000)),
+            "bulk_max_docs": int(self.get('elasticsearch.bulk_max_docs', 500)),
+            "bulk_max_bytes": int(self.get('elasticsearch.bulk_max_bytes', 10_000_000)),
+            "bulk_concurrency": int(self.get('elasticsearch.bulk_concurrency', 4)),
+            "bulk_max_retries": int(self.get('elasticsearch.bulk_max_retries', 3)),
+            "bulk_flush_interval": float(self.get('elasticsearch.bulk_flush_interval', 1.0)),
         }
 
     def get_kafka_config(self):
         return {
             "bootstrap_servers": self.get('kafka.bootstrap_servers', 'localhost:9092'),
             "topic": self.get('kafka.topic', 'scrap_topic'),
-            "notification_topic": self.get('kafka.processed_topic', 'processed_topic')
+            "notification_topic": self.get('kafka.processed_topic', 'processed_topic'),
+            "max_in_flight": int(self.get('kafka.max_in_flight', 100)),
+            "max_poll_records": int(self.get('kafka.max_poll_records', 100)),
+            "commit_interval": float(self.get('kafka.commit_interval', 5)),
+            "message_format": self.get('kafka.message_format', 'msgpack'),
+            "compression_type": self.get('kafka.compression_type', 'zstd'),
+            "linger_ms": int(self.get('kafka.linger_ms', 5)),
+            "max_batch_size": int(self.get('kafka.max_batch_size', 65536)),
+            "publish_max_in_flight": int(self.get('kafka.publish_max_in_flight', 10000)),
+        }
+
+    def get_lanes_config(self):
+        lanes = self.config_data.get("lanes") or [{
+            "name": "default",
+            "topic": self.get('kafka.topic', 'scrap_topic'),
+            "concurrency": int(self.get('kafka.max_in_flight', 100)),
+        }]
+
+        return [{
+            "name": lane.get("name", f"lane{index}"),
+            "topic": lane.get("topic", self.get('kafka.topic', 'scrap_topic')),
+            "max_size": int(lane["max_size"]) if lane.get("max_size") is not None else None,
+            "concurrency": int(lane.get("concurrency", 10)),
+            "memory_budget": int(lane.get("memory_budget", 0)),
+            "latency_slo": float(lane.get("latency_slo", 0)),
+        } for index, lane in enumerate(lanes)]
+
+    def get_collector_config(self):
+        return {
+            "queue_size": int(self.get('collector.queue_size', 100)),
+            "max_concurrent_collectors": int(self.get('collector.max_concurrent_collectors', 10)),
+            "publish_workers": int(self.get('collector.publish_workers', 4)),
+            "hash_workers": int(self.get('collector.hash_workers', 4)),
+            "inline_max_size": int(self.get('collector.inline_max_size', 65536)),
+            "inline_compression_level": int(self.get('collector.inline_compression_level', 3)),
+        }
+
+    def get_adaptive_concurrency_config(self):
+        # kafka.max_in_flight, the former fixed limit, is the default ceiling.
+        return {
+            "initial_limit": int(self.get('adaptive_concurrency.initial_limit', 20)),
+            "min_limit": int(self.get('adaptive_concurrency.min_limit', 4)),
+            "max_limit": int(self.get('adaptive_concurrency.max_limit', self.get('kafka.max_in_flight', 100))),
+            "interval": float(self.get('adaptive_concurrency.interval', 5)),
+            "increase": float(self.get('adaptive_concurrency.increase', 2)),
+            "decrease": float(self.get('adaptive_concurrency.decrease', 0.7)),
+            "error_rate": float(self.get('adaptive_concurrency.error_rate', 0.05)),
+            "min_samples": int(self.get('adaptive_concurrency.min_samples', 5)),
+            "history": int(self.get('adaptive_concurrency.history', 20)),
+            "latency_targets": {
+                "postgres": float(self.get('adaptive_concurrency.postgres_latency_target', 0.2)),
+                "elasticsearch": float(self.get('adaptive_concurrency.elasticsearch_latency_target', 5)),
+            },
+        }
+
+    def get_worker_pool_config(self):
+        return {
+            "processes": int(self.get('worker_pool.processes', 0)),
+            "restart_backoff": float(self.get('worker_pool.restart_backoff', 1)),
+            "max_restart_backoff": float(self.get('worker_pool.max_restart_backoff', 60)),
+            "health_interval": float(self.get('worker_pool.health_interval', 10)),
+            "health_timeout": float(self.get('worker_pool.health_timeout', 120)),
+        }
+
+    def get_scanner_config(self):
+        return {
+            "mode": self.get('scanner.mode', 'extract'),
+            "confidence": int(self.get('scanner.confidence', 100)),
+            "match_budget": int(self.get('scanner.match_budget', 10000)),
+            "pattern_refresh_interval": float(self.get('scanner.pattern_refresh_interval', 60)),
+            "mmap": str(self.get('scanner.mmap', True)).lower() == 'true',
+            "parallel_threshold": int(self.get('scanner.parallel_threshold', 256 * 1024 * 1024)),
+            "workers": int(self.get('scanner.workers', 0)),
+            "max_samples": int(self.get('scanner.max_samples', 100)),
+            "match_batch_size": int(self.get('scanner.match_batch_size', 1000)),
         }
         
     def get_smb_servers_config(self):
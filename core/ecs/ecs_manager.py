@@ -1,21 +1,31 @@
 import asyncio
 import logging
 from core.app import App
+from core.ecs.worker_supervisor import WorkerSupervisor
 
 class ECSManager:
     def __init__(self, app: App):
         self.app = app
 
     async def run(self):
+        systems = []
+
         if self.app.configuration.get('collecting', True):
             collector_system = self.app.get_system('CollectorSystem')
+            systems.append(collector_system.run())
             logging.info("Collector system enabled.")
-            
+
         if self.app.configuration.get('processing', True):
-            processing_system = self.app.get_system('ProcessingSystem')
-            logging.info("Processing system enabled.")
+            worker_pool_config = self.app.configuration.get_worker_pool_config()
+            if worker_pool_config['processes'] > 0:
+                # Processing moves out to worker processes; this process only
+                # supervises them.
+                supervisor = WorkerSupervisor(worker_pool_config)
+                systems.append(supervisor.run())
+                logging.info(f"Processing system enabled with {worker_pool_config['processes']} worker processes.")
+            else:
+                processing_system = self.app.get_system('ProcessingSystem')
+                systems.append(processing_system.run())
+                logging.info("Processing system enabled.")
 
-        await asyncio.gather(
-            collector_system.run(),
-            processing_system.run()
-        )
\ No newline at end of file
+        await asyncio.gather(*systems)
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+
+def run_processing_worker(worker_id: int, health_queue, health_interval: float):
+    logging.basicConfig(level=logging.INFO, format=f"[worker {worker_id}] %(levelname)s:%(name)s:%(message)s")
+    asyncio.run(_run_processing_worker(worker_id, health_queue, health_interval))
+
+
+async def _run_processing_worker(worker_id: int, health_queue, health_interval: float):
+    from core.bootstrap import create_app
+
+    # Heartbeats start before boot, so a slow dedup warm-up does not look
+    # like a hung worker.
+    state = {"system": None}
+    reporter = asyncio.create_task(_report_health(worker_id, health_queue, health_interval, state))
+
+    try:
+        app = await create_app(worker_id)
+        state["system"] = app.get_system('ProcessingSystem')
+
+        run_task = asyncio.create_task(state["system"].run())
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, run_task.cancel)
+        except NotImplementedError:
+            pass
+
+        try:
+            await run_task
+        except asyncio.CancelledError:
+            logging.getLogger(__name__).info(f"Worker {worker_id} stopped.")
+    finally:
+        reporter.cancel()
+
+
+async def _report_health(worker_id: int, health_queue, health_interval: float, state):
+    while True:
+        system = state["system"]
+        health = system.get_health() if system is not None else {"booting": True}
+        try:
+            health_queue.put_nowait({"worker_id": worker_id, "pid": os.getpid(), "time": time.time(), **health})
+        except Exception:
+            pass
+        await asyncio.sleep(health_interval)
+
+
+class WorkerSupervisor:
+    # Runs the processing system in separate processes. Every worker boots its
+    # own app, so it has its own event loop, connection pools and consumer in
+    # processing_group; Kafka spreads the partitions over the workers, and as
+    # messages are keyed by hash, the same content always lands on the same
+    # worker. Workers that exit are restarted with an exponential backoff, and
+    # workers that stop sending heartbeats are killed and restarted.
+    def __init__(self, config):
+        self.logger = logging.getLogger(__name__)
+        self.processes = config.get('processes', 0)
+        self.restart_backoff = config.get('restart_backoff', 1)
+        self.max_restart_backoff = config.get('max_restart_backoff', 60)
+        self.health_interval = config.get('health_interval', 10)
+        self.health_timeout = config.get('health_timeout', 120)
+
+        self.context = multiprocessing.get_context('spawn')
+        self.health_queue = self.context.Queue()
+        self.workers = {}
+        self.started_at = {}
+        self.restart_at = {}
+        self.failures = {}
+        self.restarts = 0
+        self.health = {}
+        self.health_logged_at = 0.0
+
+    async def run(self):
+        self.logger.info(f"Starting {self.processes} processing workers.")
+        for worker_id in range(self.processes):
+            self._start_worker(worker_id)
+
+        try:
+            while True:
+                await asyncio.sleep(1)
+                self._drain_health()
+                self._check_workers()
+                self._log_health_if_due()
+        finally:
+            await asyncio.to_thread(self._stop_workers)
+
+    def get_health(self):
+        workers = [self.health.get(worker_id, {}) for worker_id in self.workers]
+        return {
+            "workers": self.processes,
+            "alive": sum(1 for process in self.workers.values() if process.is_alive()),
+            "restarts": self.restarts,
+            "in_flight": sum(health.get("in_flight", 0) for health in workers),
+            "uncommitted": sum(health.get("uncommitted", 0) for health in workers),
+            "processed": sum(health.get("processed", 0) for health in workers),
+            "failed": sum(health.get("failed", 0) for health in workers),
+            "concurrency_limit": sum(health.get("concurrency", {}).get("limit", 0) for health in workers),
+            "lanes": self._lane_health(workers),
+        }
+
+    def _lane_health(self, workers):
+        lanes = {}
+        for health in workers:
+            for name, metrics in health.get("lanes", {}).items():
+                lane = lanes.setdefault(name, {"in_flight": 0, "processed": 0, "slo_breaches": 0, "max_queue_ms": 0.0})
+                lane["in_flight"] += metrics["in_flight"]
+                lane["processed"] += metrics["processed"]
+                lane["slo_breaches"] += metrics["slo_breaches"]
+                lane["max_queue_ms"] = max(lane["max_queue_ms"], metrics["max_queue_ms"])
+        return lanes
+
+    def _start_worker(self, worker_id: int):
+        process = self.context.Process(
+            target=run_processing_worker,
+            args=(worker_id, self.health_queue, self.health_interval),
+            name=f"processing-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = process
+        self.started_at[worker_id] = time.time()
+        self.restart_at.pop(worker_id, None)
+        self.health.pop(worker_id, None)
+        self.logger.info(f"Started processing worker {worker_id} with pid {process.pid}.")
+
+    def _drain_health(self):
+        while True:
+            try:
+                health = self.health_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            worker_id = health["worker_id"]
+            process = self.workers.get(worker_id)
+            if process is None or process.pid != health["pid"]:
+                continue
+            self.health[worker_id] = health
+            if not health.get("booting"):
+                self.failures[worker_id] = 0
+
+    def _check_workers(self):
+        now = time.time()
+        for worker_id, process in list(self.workers.items()):
+            if process.is_alive():
+                last_seen = self.health.get(worker_id, {}).get("time", self.started_at[worker_id])
+                if now - last_seen > self.health_timeout:
+                    self.logger.error(
+                        f"Processing worker {worker_id} sent no heartbeat for {now - last_seen:.0f}s, killing it."
+                    )
+                    process.kill()
+                continue
+
+            if worker_id not in self.restart_at:
+                failures = self.failures.get(worker_id, 0)
+                backoff = min(self.max_restart_backoff, self.restart_backoff * 2 ** failures)
+                self.failures[worker_id] = failures + 1
+                self.restart_at[worker_id] = now + backoff
+                process.join(0)
+                self.logger.error(
+                    f"Processing worker {worker_id} exited with code {process.exitcode}, restarting in {backoff:g}s."
+                )
+            elif now >= self.restart_at[worker_id]:
+                self.restarts += 1
+                self._start_worker(worker_id)
+
+    def _log_health_if_due(self):
+        if time.monotonic() - self.health_logged_at < self.health_interval:
+            return
+        self.health_logged_at = time.monotonic()
+        self.logger.info(f"Processing workers: {self.get_health()}")
+
+    def _stop_workers(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for worker_id, process in self.workers.items():
+            process.join(timeout=30)
+            if process.is_alive():
+                self.logger.warning(f"Processing worker {worker_id} did not stop in time, killing it.")
+                process.kill()
+                process.join()
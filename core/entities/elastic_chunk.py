@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class ElasticChunk:
@@ -7,3 +8,4 @@ class ElasticChunk:
     chunk_content: str
     title: str
     hash: str
+    fingerprint: Optional[str] = None
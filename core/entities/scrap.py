@@ -7,27 +7,42 @@ from datetime import datetime
 class Scrap:
     id: Optional[int] = None
     hash: Optional[str] = None
+    hash_algorithm: Optional[str] = None
+    prefix_fingerprint: Optional[str] = None
+    sha256: Optional[str] = None
     source: Optional[str] = None
     filename: Optional[str] = None
     file_path: Optional[str] = None
+    size: Optional[int] = None
     state: str = 'PROCESSING'
     timestamp: Optional[datetime] = None
     occurrence_time: Optional[datetime] = None
     attachments: List = field(default_factory=list)
+    # Content of scraps shipped inline in the Kafka message rather than on the
+    # upstream share. Never serialized with the scrap itself.
+    content: Optional[bytes] = field(default=None, repr=False)
 
-    def to_json(self):
+    def to_dict(self):
         dict_data = asdict(self)
+        dict_data.pop('content')
         if dict_data['timestamp']:
             dict_data['timestamp'] = dict_data['timestamp'].isoformat()
         if dict_data['occurrence_time']:
             dict_data['occurrence_time'] = dict_data['occurrence_time'].isoformat()
-        return json.dumps(dict_data)
+        return dict_data
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
 
     @staticmethod
-    def from_json(data):
-        dict_data = json.loads(data)
+    def from_dict(dict_data):
+        dict_data = dict(dict_data)
         if dict_data.get('timestamp'):
             dict_data['timestamp'] = datetime.fromisoformat(dict_data['timestamp'])
         if dict_data.get('occurrence_time'):
             dict_data['occurrence_time'] = datetime.fromisoformat(dict_data['occurrence_time'])
         return Scrap(**dict_data)
+
+    @staticmethod
+    def from_json(data):
+        return Scrap.from_dict(json.loads(data))
@@ -0,0 +1 @@
+ALTER TABLE scrapes ALTER COLUMN hash DROP NOT NULL;
@@ -0,0 +1,7 @@
+ALTER TABLE classifier_patterns ADD COLUMN IF NOT EXISTS literals TEXT[];
+
+UPDATE classifier_patterns SET literals = ARRAY['@', ':']
+WHERE class = 'CREDENTIAL' AND pattern = '(?P<username>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}):(?P<password>.*)';
+
+UPDATE classifier_patterns SET literals = ARRAY['@', '|']
+WHERE class = 'CREDENTIAL' AND pattern = '(?P<username>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\|(?P<password>.*)';
@@ -0,0 +1,7 @@
+ALTER TABLE scrapes ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
+
+UPDATE scrapes
+SET processed_at = COALESCE(processing_start_time, scrape_time)
+WHERE state = 'PROCESSED' AND processed_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_scrapes_processed_at ON scrapes(processed_at);
@@ -0,0 +1,3 @@
+ALTER TABLE elastic_chunks ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS idx_elastic_chunks_fingerprint ON elastic_chunks(fingerprint);
@@ -0,0 +1,7 @@
+ALTER TABLE scrapes ADD COLUMN IF NOT EXISTS hash_algorithm VARCHAR(16) NOT NULL DEFAULT 'sha256';
+ALTER TABLE scrapes ADD COLUMN IF NOT EXISTS prefix_fingerprint VARCHAR(32);
+ALTER TABLE scrapes ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64);
+
+UPDATE scrapes SET sha256 = hash WHERE hash_algorithm = 'sha256' AND sha256 IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_scrapes_sha256 ON scrapes(sha256);
@@ -1,44 +1,74 @@
 import logging
+import time
 from core.entities.scrap import Scrap
 from core.repositories.elastic_repository import ElasticRepository
 from core.repositories.postgres_repository import PostgresRepository
-from rust_bindings import process_scrap_in_rust
+from core.services.hash_dedup_cache import HashDedupCache
+from core.services.hashing_service import HashingService
+from rust_bindings import PatternEngine
 import asyncio
 
 
 class CoreProcessor:
-    def __init__(self, postgres_repository: PostgresRepository, elastic_repository: ElasticRepository):
+    def __init__(
+        self,
+        postgres_repository: PostgresRepository,
+        elastic_repository: ElasticRepository,
+        scanner_config=None,
+        dedup_cache: HashDedupCache = None,
+        hashing_service: HashingService = None
+    ):
         self.logger = logging.getLogger(__name__)
         self.postgres_repository = postgres_repository
         self.elastic_repository = elastic_repository
-        self.patterns = None
+        self.dedup_cache = dedup_cache
+        self.hashing_service = hashing_service
+        self.hash_algorithm = hashing_service.algorithm if hashing_service else 'sha256'
+        scanner_config = scanner_config or {}
+        self.scan_mode = scanner_config.get('mode', 'extract')
+        self.confidence = scanner_config.get('confidence', 100)
+        self.match_budget = scanner_config.get('match_budget', 10000)
+        self.pattern_refresh_interval = scanner_config.get('pattern_refresh_interval', 60)
+        self.use_mmap = scanner_config.get('mmap', True)
+        self.parallel_threshold = scanner_config.get('parallel_threshold', 256 * 1024 * 1024)
+        self.scan_workers = scanner_config.get('workers', 0)
+        self.max_samples = scanner_config.get('max_samples', 100)
+        self.match_batch_size = scanner_config.get('match_batch_size', 1000)
+        self.pattern_engine = None
+        self.patterns_checked_at = 0.0
+        self.pattern_lock = asyncio.Lock()
 
     async def process_scrap(self, scrap: Scrap):
         try:
+            if not scrap.prefix_fingerprint and self.hashing_service:
+                if scrap.content is not None:
+                    scrap.prefix_fingerprint = await self.hashing_service.fingerprint_content(scrap.content)
+                else:
+                    scrap.prefix_fingerprint = await self.hashing_service.fingerprint_file(scrap.file_path)
+
             scrap.id = await self._initialize_scrap(scrap)
 
             scrap_hash_task = self._ensure_scrap_hash(scrap)
             load_patterns_task = self._load_patterns_if_needed()
-            scrap.hash, _ = await asyncio.gather(scrap_hash_task, load_patterns_task)
-            
-            if not scrap.hash:
-                return
+            scrap.hash, pattern_engine = await asyncio.gather(scrap_hash_task, load_patterns_task)
             
-            is_hash_processed = await self.hash_exists(scrap.hash)
+            if scrap.hash:
+                is_hash_processed = await self.hash_exists(scrap.hash, scrap.hash_algorithm, scrap.prefix_fingerprint)
 
-            result = await asyncio.to_thread(
-                process_scrap_in_rust,
-                scrap.file_path,
-                self.patterns,
-                is_hash_processed
-            )
+                result = await self._scan_scrap(scrap, pattern_engine, is_hash_processed)
+                chunk_bounds = None
+            else:
+                is_hash_processed, result, chunk_bounds = await self._process_scrap_single_pass(scrap, pattern_engine)
 
             if not result:
                 await self._handle_no_patterns(scrap, is_hash_processed)
                 return
 
-            scrap_class, matches = result
-            await self._handle_patterns_found(scrap, scrap_class) #, matches)
+            self.logger.info(
+                f"Scrap {scrap.id} matched {result.match_count} times: {result.class_counts} "
+                f"({result.bytes_scanned}/{result.total_bytes} bytes scanned)."
+            )
+            await self._handle_patterns_found(scrap, result.scrap_class, chunk_bounds)
 
             await self._finalize_scrap(scrap, 'PROCESSED')
 
@@ -58,22 +88,177 @@ class CoreProcessor:
         existing_scrap = await self.postgres_repository.get_scrap_by_id(scrap.id)
         if existing_scrap and existing_scrap.hash:
             self.logger.info(f"Recovered hash for scrap {scrap.id}.")
+            scrap.hash_algorithm = existing_scrap.hash_algorithm
             return existing_scrap.hash
 
-        self.logger.warning(f"Hash missing for scrap {scrap.id}, marking as failed.")
-        await self._finalize_scrap(scrap, 'FAILED')
+        self.logger.info(f"Hash missing for scrap {scrap.id}, computing it while scanning.")
         return None
 
+    async def _scan_scrap(self, scrap: Scrap, pattern_engine, is_hash_processed: bool):
+        # Inline scraps are scanned from the buffer that came with the message.
+        if scrap.content is not None:
+            if self.scan_mode == 'classify':
+                return await asyncio.to_thread(
+                    pattern_engine.classify_bytes,
+                    scrap.content,
+                    is_hash_processed,
+                    self.confidence,
+                    self.match_budget
+                )
+            return await asyncio.to_thread(pattern_engine.process_scrap_bytes, scrap.content, is_hash_processed)
+
+        if self.scan_mode == 'classify':
+            return await asyncio.to_thread(
+                pattern_engine.classify,
+                scrap.file_path,
+                is_hash_processed,
+                self.confidence,
+                self.match_budget
+            )
+
+        return await asyncio.to_thread(
+            pattern_engine.process_scrap,
+            scrap.file_path,
+            is_hash_processed
+        )
+
+    async def _process_scrap_single_pass(self, scrap: Scrap, pattern_engine):
+        # Hash, scan and chunk boundaries come out of one read of the file, but
+        # only for content the fingerprint filter proves new. Anything that may
+        # be a duplicate is hashed first so its scan can be skipped.
+        if not await self._is_known_new(scrap):
+            return await self._process_scrap_hash_first(scrap, pattern_engine)
+
+        if scrap.content is not None:
+            scrap.hash, result, chunk_bounds = await asyncio.to_thread(
+                pattern_engine.process_bytes,
+                scrap.content,
+                self.elastic_repository.chunk_size,
+                self.hash_algorithm
+            )
+        else:
+            scrap.hash, result, chunk_bounds = await asyncio.to_thread(
+                pattern_engine.process_file,
+                scrap.file_path,
+                self.elastic_repository.chunk_size,
+                self.hash_algorithm
+            )
+        scrap.hash_algorithm = self.hash_algorithm
+        await self.postgres_repository.update_scrap_hash(scrap.id, scrap.hash, scrap.hash_algorithm)
+
+        is_hash_processed = await self.hash_exists(scrap.hash, scrap.hash_algorithm, scrap.prefix_fingerprint)
+        if is_hash_processed:
+            return is_hash_processed, None, None
+
+        return is_hash_processed, result, chunk_bounds
+
+    async def _process_scrap_hash_first(self, scrap: Scrap, pattern_engine):
+        if scrap.content is not None:
+            scrap.hash = await self.hashing_service.hash_content(scrap.content)
+        else:
+            scrap.hash = await self.hashing_service.hash_file(scrap.file_path)
+        scrap.hash_algorithm = self.hash_algorithm
+        await self.postgres_repository.update_scrap_hash(scrap.id, scrap.hash, scrap.hash_algorithm)
+
+        is_hash_processed = await self.hash_exists(scrap.hash, scrap.hash_algorithm, scrap.prefix_fingerprint)
+        if is_hash_processed:
+            self.logger.info(f"Scrap {scrap.id} is a duplicate, skipping the scan.")
+            return is_hash_processed, None, None
+
+        result = await self._scan_scrap(scrap, pattern_engine, is_hash_processed)
+        return is_hash_processed, result, None
+
+    async def _is_known_new(self, scrap: Scrap) -> bool:
+        # Without a hashing service there is nothing to hash first with.
+        if not self.hashing_service:
+            return True
+        if self.dedup_cache is None or self.hash_algorithm != self.dedup_cache.hash_algorithm:
+            return False
+        return await self.dedup_cache.is_new(scrap.prefix_fingerprint)
+
     async def _load_patterns_if_needed(self):
-        if not self.patterns:
-            self.patterns = await self._load_patterns()
-        return self.patterns
+        if self.pattern_engine is not None and not self._pattern_refresh_due():
+            return self.pattern_engine
+
+        async with self.pattern_lock:
+            if self.pattern_engine is not None and not self._pattern_refresh_due():
+                return self.pattern_engine
+
+            version = await self.postgres_repository.get_classifier_patterns_version()
+            if self.pattern_engine is None or (version and version != self.pattern_engine.version):
+                pattern_engine = await self._load_patterns(version)
+                if pattern_engine is None:
+                    # A failed load is retried with the next scrap; until then
+                    # the previous engine, if any, keeps scanning.
+                    if self.pattern_engine is None:
+                        raise RuntimeError("Classifier patterns could not be loaded.")
+                    self.logger.warning(f"Keeping patterns version {self.pattern_engine.version} after a failed reload.")
+                    return self.pattern_engine
+
+                # Scans in flight keep the engine they started with; swapping the
+                # reference makes every new scan pick up the rebuilt one.
+                if self.pattern_engine is not None:
+                    self._log_prefilter_stats(self.pattern_engine)
+                self.pattern_engine = pattern_engine
+
+            self.patterns_checked_at = time.monotonic()
+
+        return self.pattern_engine
+
+    def _pattern_refresh_due(self) -> bool:
+        return time.monotonic() - self.patterns_checked_at >= self.pattern_refresh_interval
 
-    async def _load_patterns(self):
+    async def _load_patterns(self, version):
         patterns = await self.postgres_repository.get_classifier_patterns()
-        self.logger.info(f"Loaded {len(patterns)} patterns.")
+        if patterns is None:
+            return None
 
-        return [(p[0], p[1]) for p in patterns]
+        pattern_engine = await asyncio.to_thread(
+            PatternEngine,
+            [(p[0], p[1], p[2]) for p in patterns],
+            version or '',
+            self.use_mmap,
+            self.parallel_threshold,
+            self.scan_workers,
+            self.max_samples
+        )
+        self.logger.info(f"Loaded {len(patterns)} patterns (version {version}).")
+
+        return pattern_engine
+
+    def _log_prefilter_stats(self, pattern_engine):
+        # One summary for the engine being replaced; per-pattern detail only
+        # at debug level.
+        stats = pattern_engine.prefilter_stats()
+        filtered = [stat for stat in stats if stat[2]]
+        lines = sum(stat[3] for stat in filtered)
+        passed = sum(stat[4] for stat in filtered)
+        skipped = 1 - passed / lines if lines else 0.0
+        self.logger.info(
+            f"Prefilter of patterns version {pattern_engine.version}: {len(filtered)}/{len(stats)} patterns "
+            f"with literals, {skipped:.2%} of their regex runs skipped."
+        )
+
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        for pattern, scrap_class, literals, lines, passed, matched in stats:
+            if not lines:
+                continue
+            self.logger.debug(
+                f"Prefilter {scrap_class} {literals or '-'}: {passed}/{lines} lines "
+                f"({passed / lines:.2%}) reached the regex, {matched} matched. Pattern: {pattern}"
+            )
+
+    async def _record_sha256(self, scrap: Scrap, streamed_sha256):
+        # SHA-256 is only kept for reporting, so it is recorded for scraps that
+        # are indexed: the content hash when that already is one, otherwise
+        # the digest taken by the chunking pass, which reads them anyway.
+        if scrap.sha256 or not self.hashing_service or not self.hashing_service.report_sha256:
+            return
+
+        scrap.sha256 = scrap.hash if scrap.hash_algorithm == 'sha256' else streamed_sha256
+        if scrap.sha256:
+            await self.postgres_repository.update_scrap_sha256(scrap.id, scrap.sha256)
 
     async def _handle_no_patterns(self, scrap: Scrap, is_hash_processed: bool):
         if is_hash_processed:
@@ -81,16 +266,35 @@ class CoreProcessor:
         else:
             await self._finalize_scrap(scrap, 'NO_PATTERNS_FOUND')
 
-    async def _handle_patterns_found(self, scrap: Scrap, scrap_class: str): #, matches: list):
-        await asyncio.gather(
+    async def _handle_patterns_found(self, scrap: Scrap, scrap_class: str, chunk_bounds=None):
+        _, streamed_sha256 = await asyncio.gather(
             self.postgres_repository.update_scrap_class(scrap.id, scrap_class),
-            self.elastic_repository.save_scrap_chunks(scrap) #, matches)
+            self.elastic_repository.save_scrap_chunks(scrap, chunk_bounds)
         )
+        await self._record_sha256(scrap, streamed_sha256)
         self.logger.info(f"Patterns found for scrap {scrap.id}, class updated to '{scrap_class}'.")
 
+    async def stream_matches(self, scrap: Scrap):
+        # Every match of a file-backed scrap, in file order and in batches of
+        # at most scanner.match_batch_size (match, class) pairs. The file is
+        # only scanned as far as the consumer has read.
+        pattern_engine = await self._load_patterns_if_needed()
+        stream = await asyncio.to_thread(pattern_engine.iter_matches, scrap.file_path, self.match_batch_size)
+        while True:
+            batch = await asyncio.to_thread(next, stream, None)
+            if batch is None:
+                return
+            yield batch
+
     async def _finalize_scrap(self, scrap: Scrap, state: str):
         await self.postgres_repository.update_scrap_state(scrap.id, state)
+        if state == 'PROCESSED' and self.dedup_cache is not None \
+                and scrap.hash_algorithm == self.dedup_cache.hash_algorithm:
+            self.dedup_cache.add(scrap.hash, scrap.prefix_fingerprint)
         self.logger.info(f"Scrap {scrap.id} marked as {state}.")
 
-    async def hash_exists(self, hash):
-        return await self.postgres_repository.is_hash_processed(hash)
\ No newline at end of file
+    async def hash_exists(self, hash, hash_algorithm=None, prefix_fingerprint=None):
+        hash_algorithm = hash_algorithm or 'sha256'
+        if self.dedup_cache is not None and hash_algorithm == self.dedup_cache.hash_algorithm:
+            return await self.dedup_cache.is_processed(hash, prefix_fingerprint)
+        return await self.postgres_repository.is_hash_processed(hash, hash_algorithm)
\ No newline at end of file
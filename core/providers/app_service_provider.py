@@ -2,6 +2,11 @@ from core.events.event_system import EventSystem
 from core.processors.core_processor import CoreProcessor
 from core.repositories.elastic_repository import ElasticRepository
 from core.repositories.postgres_repository import PostgresRepository
+from core.services.hash_dedup_cache import HashDedupCache
+from core.services.hashing_service import HashingService
+from core.services.kafka_publisher import KafkaPublisher
+from core.services.lanes import LaneRouter
+from core.services.message_codec import MessageCodec
 from core.services.migration_service import MigrationService
 
 
@@ -13,7 +18,8 @@ class AppServiceProvider:
         config = self.app.make('config')
 
         postgres_config = config.get_postgres_config()
-        self.app.bind('PostgresRepository', lambda: PostgresRepository(postgres_config))
+        write_buffer_config = config.get_write_buffer_config()
+        self.app.bind('PostgresRepository', lambda: PostgresRepository(postgres_config, write_buffer_config))
 
         elasticsearch_config = config.get_elasticsearch_config()
         self.app.bind('ElasticRepository', lambda: ElasticRepository(
@@ -26,9 +32,33 @@ class AppServiceProvider:
             "core/migrations"
         ))
         
+        kafka_config = config.get_kafka_config()
+        collector_config = config.get_collector_config()
+        self.app.bind('MessageCodec', lambda: MessageCodec(
+            kafka_config['message_format'],
+            collector_config['inline_compression_level']
+        ))
+        self.app.bind('KafkaPublisher', lambda: KafkaPublisher(kafka_config))
+        lanes_config = config.get_lanes_config()
+        self.app.bind('LaneRouter', lambda: LaneRouter.from_config(lanes_config))
+
+        hashing_config = config.get_hashing_config()
+        self.app.bind('HashingService', lambda: HashingService(collector_config['hash_workers'], hashing_config))
+
+        dedup_config = config.get_dedup_config()
+        self.app.bind('HashDedupCache', lambda: HashDedupCache(
+            self.app.make('PostgresRepository'),
+            dedup_config,
+            hashing_config
+        ))
+
+        scanner_config = config.get_scanner_config()
         self.app.bind('CoreProcessor', lambda: CoreProcessor(
             self.app.make('PostgresRepository'),
-            self.app.make('ElasticRepository')
+            self.app.make('ElasticRepository'),
+            scanner_config,
+            self.app.make('HashDedupCache'),
+            self.app.make('HashingService')
         ))
 
     async def boot(self):
@@ -38,3 +68,6 @@ class AppServiceProvider:
         migration_service = self.app.make('MigrationService')
         await migration_service.run_migrations_if_needed()
 
+        dedup_cache = self.app.make('HashDedupCache')
+        await dedup_cache.warm()
+
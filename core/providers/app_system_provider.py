@@ -14,15 +14,18 @@ class AppSystemProvider:
         self.app.bind('EventSystem', lambda: EventSystem())
 
     async def boot(self):
-        mount_upstream_smb(self.app.configuration)
-        mount_downstream_smb(self.app.configuration)
+        if self.app.worker_id is None:
+            mount_upstream_smb(self.app.configuration)
+            mount_downstream_smb(self.app.configuration)
         
         self.plugin_loader.load_plugins()
 
         collectors = self.plugin_loader.get_plugins('collector')
         processors = self.plugin_loader.get_plugins('processor')
 
-        collector_system = CollectorSystem(self.app, collectors)
+        if self.app.worker_id is None:
+            collector_system = CollectorSystem(self.app, collectors, self.app.make('HashDedupCache'))
+            self.app.add_system(lambda app: collector_system)
         
         postgres_repository = self.app.make('PostgresRepository')
         
@@ -32,7 +35,6 @@ class AppSystemProvider:
             postgres_repository
         )
 
-        self.app.add_system(lambda app: collector_system)
         self.app.add_system(lambda app: processing_system)
 
 
@@ -1,16 +1,19 @@
 import logging
-from elasticsearch import Elasticsearch, NotFoundError
+from collections import OrderedDict
+from elasticsearch import AsyncElasticsearch, NotFoundError
 from core.entities.elastic_chunk import ElasticChunk
 from core.entities.scrap import Scrap
 from core.repositories.postgres_repository import PostgresRepository
-from rust_bindings import split_file_into_chunks
+from core.services.bulk_indexer import BulkIndexer
+from core.services.fingerprint_lookup import FingerprintLookup
+from rust_bindings import iter_bytes_chunks, iter_file_chunks
 import asyncio
 
 class ElasticRepository:
     def __init__(self, config, repository: PostgresRepository):
         self.logger = logging.getLogger(__name__)
 
-        self.es = Elasticsearch(
+        self.es = AsyncElasticsearch(
             hosts=[{
                 'host': config['host'],
                 'port': config['port'],
@@ -21,56 +24,182 @@ class ElasticRepository:
             verify_certs=False
         )
 
+        self.index = "scrapes_chunks"
+        self.indexer = BulkIndexer(
+            self.es,
+            self.index,
+            max_docs=config.get('bulk_max_docs', 500),
+            max_bytes=config.get('bulk_max_bytes', 10_000_000),
+            concurrency=config.get('bulk_concurrency', 4),
+            max_retries=config.get('bulk_max_retries', 3),
+            flush_interval=config.get('bulk_flush_interval', 1.0)
+        )
+
         self.postgres_repository: PostgresRepository = repository
+        self.chunk_size = config.get('chunk_size', 1_000_000)
+        self.max_pending_chunks = max(1, config.get('max_pending_chunks', 2))
+        self.reference_batch_size = config.get('reference_batch_size', 1000)
+        self.content_defined_chunks = config.get('chunking', 'content_defined') == 'content_defined'
+        self.fingerprint_cache_size = config.get('fingerprint_cache_size', 100_000)
+        self.known_fingerprints = OrderedDict()
+        self.indexing_chunks = {}
+        self.fingerprint_lookup = FingerprintLookup(
+            repository,
+            max_batch=config.get('lookup_batch_size', 1000),
+            max_wait=config.get('lookup_max_wait_ms', 5) / 1000
+        )
 
-    async def save_scrap_chunks(self, scrap: Scrap):
+    async def save_scrap_chunks(self, scrap: Scrap, chunk_bounds=None):
         title = scrap.filename
         hash_value = scrap.hash
-        chunk_size = 1_000_000
+
+        # At most max_pending_chunks chunk bodies of a scrap are held at once;
+        # only their fingerprint lookups are batched, with those of every other
+        # scrap in flight.
+        pending = asyncio.Semaphore(self.max_pending_chunks)
+        tasks = []
+        references = []
 
         try:
-            chunks = split_file_into_chunks(scrap.file_path, chunk_size)
+            # Content-defined boundaries are found while streaming, so the fixed
+            # boundaries from the scan pass are only used for fixed chunking.
+            # Opening the file on the share and copying inline content both
+            # happen off the event loop, like every read of the stream.
+            if scrap.content is not None:
+                stream = await asyncio.to_thread(
+                    iter_bytes_chunks, scrap.content, self.chunk_size, chunk_bounds, self.content_defined_chunks
+                )
+            else:
+                stream = await asyncio.to_thread(
+                    iter_file_chunks, scrap.file_path, self.chunk_size, chunk_bounds, self.content_defined_chunks
+                )
 
-            tasks = []
+            while True:
+                if pending.locked():
+                    # Send the partial batches rather than wait for the timers
+                    # while this scrap is blocked on its own chunks.
+                    self.fingerprint_lookup.flush_nowait()
+                    self.indexer.flush_nowait()
+                await pending.acquire()
 
-            for chunk_number, chunk_content in chunks:
+                chunk = await asyncio.to_thread(next, stream, None)
+                if chunk is None:
+                    pending.release()
+                    break
+
+                chunk_number, _, _, chunk_content, fingerprint = chunk
                 elastic_chunk = ElasticChunk(
                     scrap_id=scrap.id,
                     chunk_number=chunk_number,
                     chunk_content=chunk_content,
                     title=title,
-                    hash=hash_value
+                    hash=hash_value,
+                    fingerprint=fingerprint
                 )
 
-                task = self.process_chunk(elastic_chunk, scrap.id, chunk_number, title)
+                task = asyncio.create_task(self.process_chunk(elastic_chunk))
+                task.add_done_callback(lambda _: pending.release())
                 tasks.append(task)
 
+                references.extend(self._collect_references(tasks))
+                if len(references) >= self.reference_batch_size:
+                    await self.postgres_repository.save_elastic_chunks(references)
+                    references = []
+
+            self.fingerprint_lookup.flush_nowait()
+            self.indexer.flush_nowait()
             await asyncio.gather(*tasks)
+            references.extend(self._collect_references(tasks))
+            await self.postgres_repository.save_elastic_chunks(references)
+
+            # SHA-256 of the whole scrap, taken while it was streamed.
+            return stream.sha256
 
         except Exception as e:
-            self.logger.error(f"Failed to read file {scrap.file_path}: {e}")
+            for task in tasks:
+                task.cancel()
+            self.logger.error(f"Failed to index scrap {scrap.id} from {scrap.file_path}: {e}")
             raise
 
-    async def process_chunk(self, elastic_chunk: ElasticChunk, scrap_id: int, chunk_number: int, title: str):
+    def _collect_references(self, tasks):
+        done = [task for task in tasks if task.done()]
+        for task in done:
+            tasks.remove(task)
+        return [task.result() for task in done]
+
+    async def process_chunk(self, elastic_chunk: ElasticChunk):
         try:
-            elastic_id = await self.save_scrap_chunk(elastic_chunk)
+            elastic_id = await self._find_indexed_chunk(elastic_chunk.fingerprint)
+            if elastic_id:
+                self.logger.info(
+                    f"Elastic chunk {elastic_chunk.chunk_number} for scrap {elastic_chunk.scrap_id} is already indexed as {elastic_id}."
+                )
+            else:
+                elastic_id = await self._index_chunk(elastic_chunk)
 
-            await self.postgres_repository.save_elastic_chunk(scrap_id, chunk_number, elastic_id, title)
+            return (
+                elastic_chunk.scrap_id,
+                elastic_chunk.chunk_number,
+                elastic_id,
+                elastic_chunk.title,
+                elastic_chunk.hash,
+                elastic_chunk.fingerprint
+            )
 
         except Exception as e:
-            self.logger.error(f"Error processing chunk {chunk_number} for scrap {scrap_id}: {e}")
+            self.logger.error(f"Error processing chunk {elastic_chunk.chunk_number} for scrap {elastic_chunk.scrap_id}: {e}")
             raise
 
+    async def _find_indexed_chunk(self, fingerprint):
+        if not fingerprint:
+            return None
+
+        elastic_id = self.known_fingerprints.get(fingerprint)
+        if elastic_id:
+            self.known_fingerprints.move_to_end(fingerprint)
+            return elastic_id
+
+        elastic_id = await self.fingerprint_lookup.find(fingerprint)
+        self._remember_fingerprint(fingerprint, elastic_id)
+        return elastic_id
+
+    async def _index_chunk(self, elastic_chunk: ElasticChunk):
+        # The same content in flight for another chunk, of this scrap or
+        # another one, is indexed once.
+        fingerprint = elastic_chunk.fingerprint
+        indexing = self.indexing_chunks.get(fingerprint) if fingerprint else None
+        if indexing is not None:
+            return await asyncio.shield(indexing)
+
+        indexing = asyncio.ensure_future(self.save_scrap_chunk(elastic_chunk))
+        if fingerprint:
+            self.indexing_chunks[fingerprint] = indexing
+        try:
+            elastic_id = await asyncio.shield(indexing)
+        finally:
+            if self.indexing_chunks.get(fingerprint) is indexing:
+                del self.indexing_chunks[fingerprint]
+        self._remember_fingerprint(fingerprint, elastic_id)
+        return elastic_id
+
+    def _remember_fingerprint(self, fingerprint, elastic_id):
+        if not fingerprint or not elastic_id:
+            return
+        self.known_fingerprints[fingerprint] = elastic_id
+        self.known_fingerprints.move_to_end(fingerprint)
+        while len(self.known_fingerprints) > self.fingerprint_cache_size:
+            self.known_fingerprints.popitem(last=False)
+
     async def save_scrap_chunk(self, elastic_chunk: ElasticChunk) -> str:
         try:
-            response = self.es.index(index="scrapes_chunks", document={
+            elastic_id = await self.indexer.index_document({
                 "scrap_id": elastic_chunk.scrap_id,
                 "chunk_number": elastic_chunk.chunk_number,
                 "content": elastic_chunk.chunk_content,
                 "title": elastic_chunk.title,
-                "hash": elastic_chunk.hash
+                "hash": elastic_chunk.hash,
+                "fingerprint": elastic_chunk.fingerprint
             })
-            elastic_id = response['_id']
             self.logger.info(
                 f"Elastic chunk {elastic_chunk.chunk_number} for scrap {elastic_chunk.scrap_id} indexed in Elasticsearch with ID {elastic_id}."
             )
@@ -83,3 +212,6 @@ class ElasticRepository:
                 f"Failed to index elastic chunk {elastic_chunk.chunk_number} for scrap {elastic_chunk.scrap_id}: {e}"
             )
             raise
+
+    async def close(self):
+        await self.indexer.close()
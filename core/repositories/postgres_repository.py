@@ -1,14 +1,36 @@
+import asyncio
 import logging
+import time
 import asyncpg
+from contextlib import asynccontextmanager
 from datetime import datetime
 from core.entities.scrap import Scrap
+from core.services.adaptive_limiter import LatencyStats
 
 class PostgresRepository:
-    def __init__(self, config):
+    def __init__(self, config, write_buffer_config=None):
         self.logger = logging.getLogger(__name__)
         self.config = config
         self.pool = None
 
+        write_buffer_config = write_buffer_config or {}
+        self.flush_interval = write_buffer_config.get('flush_interval_ms', 200) / 1000
+        self.flush_max_rows = write_buffer_config.get('max_rows', 500)
+        self.pending_updates = {}
+        self.flush_handle = None
+        self.flush_tasks = set()
+        self.flush_lock = asyncio.Lock()
+        self.flush_metrics = {
+            "updates_buffered": 0,
+            "updates_coalesced": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "failed_flushes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+        self.latency = LatencyStats()
+
     async def connect(self):
         try:
             self.pool = await asyncpg.create_pool(**self.config)
@@ -16,6 +38,19 @@ class PostgresRepository:
             self.logger.error(f"Error connecting to PostgreSQL: {e}")
             raise
 
+    @asynccontextmanager
+    async def _acquire(self):
+        # Time spent waiting for a connection counts too: a drained pool is
+        # the first sign of an overloaded database.
+        started = time.perf_counter()
+        try:
+            async with self.pool.acquire() as conn:
+                yield conn
+        except Exception:
+            self.latency.record(time.perf_counter() - started, error=True)
+            raise
+        self.latency.record(time.perf_counter() - started)
+
     async def save_elastic_chunk(self, scrap_id, chunk_number, elastic_id, title):
         query = """
         INSERT INTO elastic_chunks (scrap_id, chunk_number, elastic_id, title)
@@ -23,7 +58,7 @@ class PostgresRepository:
         RETURNING id
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 chunk_id = await conn.fetchval(query, scrap_id, chunk_number, elastic_id, title)
             self.logger.info(f"Elastic chunk {chunk_number} for scrap {scrap_id} saved successfully.")
             return chunk_id
@@ -31,17 +66,52 @@ class PostgresRepository:
             self.logger.error(f"Failed to save elastic chunk {chunk_number} for scrap {scrap_id}: {e}")
             return None
 
+    async def save_elastic_chunks(self, chunks):
+        if not chunks:
+            return 0
+
+        try:
+            async with self._acquire() as conn:
+                await conn.copy_records_to_table(
+                    'elastic_chunks',
+                    records=chunks,
+                    columns=['scrap_id', 'chunk_number', 'elastic_id', 'title', 'hash', 'fingerprint']
+                )
+            self.logger.info(f"Saved {len(chunks)} elastic chunks.")
+            return len(chunks)
+        except Exception as e:
+            # Raised, not swallowed: the scrap must not be marked processed
+            # without the references, which also serve as the fingerprint index.
+            self.logger.error(f"Failed to save {len(chunks)} elastic chunks: {e}")
+            raise
+
+    async def find_elastic_ids_by_fingerprints(self, fingerprints):
+        query = """
+        SELECT DISTINCT ON (fingerprint) fingerprint, elastic_id
+        FROM elastic_chunks
+        WHERE fingerprint = ANY($1::text[]) AND elastic_id IS NOT NULL
+        """
+        try:
+            async with self._acquire() as conn:
+                rows = await conn.fetch(query, fingerprints)
+            return {row['fingerprint']: row['elastic_id'] for row in rows}
+        except Exception as e:
+            self.logger.error(f"Failed to look up {len(fingerprints)} elastic chunks by fingerprint: {e}")
+            return {}
+
     async def save_scrap_reference(self, scrap, state='PROCESSING'):
         processing_start_time = datetime.now() if state == 'PROCESSING' else None
         query = """
-        INSERT INTO scrapes (hash, source, filename, scrape_time, file_path, state, timestamp, processing_start_time, occurrence_time)
-        VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7, $8)
+        INSERT INTO scrapes (hash, source, filename, scrape_time, file_path, state, timestamp, processing_start_time,
+            occurrence_time, hash_algorithm, prefix_fingerprint, sha256)
+        VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7, $8, COALESCE($9, 'sha256'), $10, $11)
         RETURNING id
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 scrap_id = await conn.fetchval(query, scrap.hash, scrap.source, scrap.filename,
-                    scrap.file_path, state, scrap.timestamp, processing_start_time, scrap.occurrence_time)
+                    scrap.file_path, state, scrap.timestamp, processing_start_time, scrap.occurrence_time,
+                    scrap.hash_algorithm, scrap.prefix_fingerprint, scrap.sha256)
             self.logger.info(f"Scrap {scrap.hash} saved successfully with state '{state}' and id '{scrap_id}'.")
             return scrap_id
         except Exception as e:
@@ -49,40 +119,137 @@ class PostgresRepository:
             return None
 
     async def update_scrap_state(self, scrap_id, state):
-        query = "UPDATE scrapes SET state = $1 WHERE id = $2"
+        self._buffer_update(scrap_id, state=state)
+
+    async def update_scrap_hash(self, scrap_id: int, scrap_hash: str, hash_algorithm: str = 'sha256'):
+        query = "UPDATE scrapes SET hash = $1, hash_algorithm = $2 WHERE id = $3"
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, state, scrap_id)
-            self.logger.info(f"Scrap {scrap_id} updated to state '{state}'.")
+            async with self._acquire() as conn:
+                await conn.execute(query, scrap_hash, hash_algorithm, scrap_id)
+            self.logger.info(f"Scrap ID {scrap_id} updated with {hash_algorithm} hash '{scrap_hash}'.")
         except Exception as e:
-            self.logger.error(f"Failed to update scrap {scrap_id}: {e}")
+            self.logger.error(f"Failed to update scrap hash for scrap ID {scrap_id}: {e}")
 
-    async def update_scrap_class(self, scrap_id: int, scrap_class: str):
-        query = """
-            UPDATE scrapes
-            SET class = $1
-            WHERE id = $2
-        """
+    async def update_scrap_sha256(self, scrap_id: int, sha256: str):
+        query = "UPDATE scrapes SET sha256 = $1 WHERE id = $2"
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, scrap_class, scrap_id)
-                self.logger.info(f"Scrap ID {scrap_id} updated with class '{scrap_class}'.")
+            async with self._acquire() as conn:
+                await conn.execute(query, sha256, scrap_id)
         except Exception as e:
-            self.logger.error(f"Failed to update scrap class for scrap ID {scrap_id}: {e}")
-            
+            self.logger.error(f"Failed to update SHA-256 for scrap ID {scrap_id}: {e}")
+
+    async def update_scrap_class(self, scrap_id: int, scrap_class: str):
+        self._buffer_update(scrap_id, scrap_class=scrap_class)
+
+    # State and class updates are written behind: the latest transition of
+    # every scrap is kept in memory and written in one batched UPDATE when the
+    # flush interval elapses or max_rows scraps are pending. Callers that must
+    # not lose updates, like the Kafka offset commit, await flush_updates().
+    def _buffer_update(self, scrap_id, state=None, scrap_class=None):
+        if scrap_id is None:
+            return
+
+        update = self.pending_updates.get(scrap_id)
+        if update is None:
+            update = self.pending_updates[scrap_id] = {"state": None, "class": None}
+        else:
+            self.flush_metrics["updates_coalesced"] += 1
+
+        if state is not None:
+            update["state"] = state
+        if scrap_class is not None:
+            update["class"] = scrap_class
+        self.flush_metrics["updates_buffered"] += 1
+
+        if len(self.pending_updates) >= self.flush_max_rows:
+            self._schedule_flush(0)
+        elif self.flush_handle is None:
+            self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.flush_handle = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        # The loop only keeps weak references to tasks, so the flush is held
+        # here until it is done.
+        task = asyncio.get_running_loop().create_task(self.flush_updates())
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def flush_updates(self):
+        async with self.flush_lock:
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+                self.flush_handle = None
+
+            if not self.pending_updates:
+                return True
+
+            updates = self.pending_updates
+            self.pending_updates = {}
+
+            query = """
+            UPDATE scrapes AS s
+            SET state = COALESCE(u.state, s.state),
+                class = COALESCE(u.class, s.class),
+                processed_at = CASE WHEN u.state = 'PROCESSED' THEN NOW() ELSE s.processed_at END
+            FROM unnest($1::int[], $2::text[], $3::text[]) AS u(id, state, class)
+            WHERE s.id = u.id
+            """
+            scrap_ids = list(updates)
+            started = time.perf_counter()
+            try:
+                async with self._acquire() as conn:
+                    await conn.execute(
+                        query,
+                        scrap_ids,
+                        [updates[scrap_id]["state"] for scrap_id in scrap_ids],
+                        [updates[scrap_id]["class"] for scrap_id in scrap_ids]
+                    )
+            except Exception as e:
+                self.flush_metrics["failed_flushes"] += 1
+                self.logger.error(f"Failed to flush {len(updates)} scrap updates, retrying: {e}")
+                self._restore_updates(updates)
+                return False
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flush_metrics["flushes"] += 1
+            self.flush_metrics["rows_flushed"] += len(updates)
+            self.flush_metrics["last_flush_ms"] = elapsed_ms
+            self.flush_metrics["max_flush_ms"] = max(self.flush_metrics["max_flush_ms"], elapsed_ms)
+            self.logger.info(f"Flushed updates for {len(updates)} scraps in {elapsed_ms:.1f} ms.")
+            return True
+
+    def _restore_updates(self, updates):
+        # Updates buffered while the flush was failing are newer and win.
+        for scrap_id, update in updates.items():
+            newer = self.pending_updates.get(scrap_id)
+            if newer is not None:
+                update = {key: newer[key] if newer[key] is not None else value for key, value in update.items()}
+            self.pending_updates[scrap_id] = update
+        self._schedule_flush(self.flush_interval)
+
+    def get_flush_metrics(self):
+        return {**self.flush_metrics, "pending": len(self.pending_updates)}
+
     async def get_scrap_by_id(self, scrap_id):
         query = """
-        SELECT id, hash, source, filename, file_path, state, timestamp, occurrence_time
+        SELECT id, hash, hash_algorithm, prefix_fingerprint, sha256, source, filename, file_path, state, timestamp, occurrence_time
         FROM scrapes
         WHERE id = $1
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 result = await conn.fetchrow(query, scrap_id)
                 if result:
                     return Scrap(
                         id=result['id'],
                         hash=result['hash'],
+                        hash_algorithm=result['hash_algorithm'],
+                        prefix_fingerprint=result['prefix_fingerprint'],
+                        sha256=result['sha256'],
                         source=result['source'],
                         filename=result['filename'],
                         file_path=result['file_path'],
@@ -97,17 +264,20 @@ class PostgresRepository:
 
     async def get_unprocessed_scraps(self):
         query = """
-        SELECT id, hash, source, filename, file_path, state, timestamp, occurrence_time
+        SELECT id, hash, hash_algorithm, prefix_fingerprint, sha256, source, filename, file_path, state, timestamp, occurrence_time
         FROM scrapes
         WHERE state IN ('NEW', 'PROCESSING')
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 rows = await conn.fetch(query)
                 return [
                     Scrap(
                         id=row['id'],
                         hash=row['hash'],
+                        hash_algorithm=row['hash_algorithm'],
+                        prefix_fingerprint=row['prefix_fingerprint'],
+                        sha256=row['sha256'],
                         source=row['source'],
                         filename=row['filename'],
                         file_path=row['file_path'],
@@ -127,7 +297,7 @@ class PostgresRepository:
         WHERE state = 'PROCESSING'
         """
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 rows = await conn.fetch(query)
                 return [row['filename'] for row in rows]
         except Exception as e:
@@ -135,25 +305,38 @@ class PostgresRepository:
             return []
 
     async def get_classifier_patterns(self):
-        query = "SELECT pattern, class FROM classifier_patterns"
+        query = "SELECT pattern, class, literals FROM classifier_patterns ORDER BY id"
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 rows = await conn.fetch(query)
-                return [(row['pattern'], row["class"]) for row in rows]
+                return [(row['pattern'], row["class"], row["literals"]) for row in rows]
         except Exception as e:
             self.logger.error(f"Failed to fetch credential patterns: {e}")
-            return []
+            return None
+
+    async def get_classifier_patterns_version(self):
+        query = """
+        SELECT md5(COALESCE(string_agg(id || ':' || class || ':' || pattern || ':' || COALESCE(array_to_string(literals, ','), ''), E'\\n' ORDER BY id), ''))
+        FROM classifier_patterns
+        """
+        try:
+            async with self._acquire() as conn:
+                return await conn.fetchval(query)
+        except Exception as e:
+            self.logger.error(f"Failed to fetch classifier patterns version: {e}")
+            return None
 
-    async def is_hash_processed(self, file_hash):
+    async def is_hash_processed(self, file_hash, hash_algorithm=None):
         query = """
         SELECT EXISTS (
             SELECT 1 FROM scrapes
             WHERE hash = $1 AND state = 'PROCESSED'
+              AND ($2::text IS NULL OR hash_algorithm = $2)
         )
         """
         try:
-            async with self.pool.acquire() as conn:
-                exists = await conn.fetchval(query, file_hash)
+            async with self._acquire() as conn:
+                exists = await conn.fetchval(query, file_hash, hash_algorithm)
             self.logger.info(f"Hash '{file_hash}' processed: {exists}")
             return bool(exists)
         except Exception as e:
@@ -164,8 +347,21 @@ class PostgresRepository:
     async def delete_processing_scraps(self):
         query = "DELETE FROM scrapes WHERE state = 'PROCESSING'"
         try:
-            async with self.pool.acquire() as conn:
+            async with self._acquire() as conn:
                 await conn.execute(query)
             self.logger.info("Deleted all scraps in 'PROCESSING' state.")
         except Exception as e:
             self.logger.error(f"Failed to delete scraps in 'PROCESSING' state: {e}")
+
+    async def iter_processed_hashes(self, since=None, hash_algorithm=None):
+        query = """
+        SELECT hash, prefix_fingerprint, processed_at
+        FROM scrapes
+        WHERE state = 'PROCESSED' AND hash IS NOT NULL
+          AND ($1::timestamp IS NULL OR processed_at >= $1)
+          AND ($2::text IS NULL OR hash_algorithm = $2)
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(query, since, hash_algorithm, prefetch=10_000):
+                    yield row['hash'], row['prefix_fingerprint'], row['processed_at']
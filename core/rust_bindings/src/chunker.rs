@@ -0,0 +1,409 @@
+use std::io::{self, Read};
+
+pub type ChunkBounds = (usize, usize, usize);
+
+/// Collects `(chunk_number, start, end)` byte ranges from the lines of a
+/// file, fed in order. The ranges are the ones `LineChunks::new` reads: at
+/// most `chunk_size` bytes, ending on a line boundary unless a single line is
+/// longer than a chunk, which is then split outside UTF-8 sequences.
+pub struct ChunkBoundaries {
+    chunk_size: usize,
+    start: usize,
+    offset: usize,
+    line_start: usize,
+    line_ended: bool,
+    chunks: Vec<ChunkBounds>,
+}
+
+impl ChunkBoundaries {
+    pub fn new(chunk_size: usize) -> ChunkBoundaries {
+        ChunkBoundaries {
+            chunk_size: chunk_size.max(1),
+            start: 0,
+            offset: 0,
+            line_start: 0,
+            line_ended: true,
+            chunks: Vec::new(),
+        }
+    }
+
+    /// Takes the next line of the file, including its line ending.
+    pub fn line(&mut self, line: &[u8]) {
+        let line_start = self.offset;
+        let end = line_start + line.len();
+
+        // The chunk so far ends on the previous line end if this line does not
+        // fit; a line that is longer than a chunk on its own is split.
+        if end - self.start > self.chunk_size && line_start > self.start {
+            self.cut(line_start);
+        }
+        while end - self.start > self.chunk_size {
+            let from = self.start - line_start;
+            self.cut(self.start + split_point(&line[from..from + self.chunk_size]));
+        }
+        self.offset = end;
+        self.line_start = line_start;
+        self.line_ended = line.ends_with(b"\n");
+    }
+
+    pub fn finish(mut self) -> Vec<ChunkBounds> {
+        // LineChunks only sees the end of the file once a read comes up
+        // short, so a final chunk of exactly chunk_size still ends on its last
+        // line end.
+        if self.offset - self.start == self.chunk_size && !self.line_ended && self.line_start > self.start {
+            self.cut(self.line_start);
+        }
+        if self.offset > self.start {
+            self.cut(self.offset);
+        }
+        self.chunks
+    }
+
+    fn cut(&mut self, offset: usize) {
+        self.chunks.push((self.chunks.len() + 1, self.start, offset));
+        self.start = offset;
+    }
+}
+
+const fn gear_table() -> [u64; 256] {
+    // splitmix64, so the table is fixed across builds and platforms; chunk
+    // boundaries, and with them fingerprints, must never change.
+    let mut table = [0u64; 256];
+    let mut state: u64 = 0;
+    let mut i = 0;
+    while i < 256 {
+        state = state.wrapping_add(0x9E37_79B9_7F4A_7C15);
+        let mut z = state;
+        z = (z ^ (z >> 30)).wrapping_mul(0xBF58_476D_1CE4_E5B9);
+        z = (z ^ (z >> 27)).wrapping_mul(0x94D0_49BB_1331_11EB);
+        table[i] = z ^ (z >> 31);
+        i += 1;
+    }
+    table
+}
+
+static GEAR: [u64; 256] = gear_table();
+
+/// FastCDC-style boundaries: a gear rolling hash picks cut points from the
+/// content itself, so an edit only moves the boundaries around it and the
+/// chunks before and after keep their fingerprints.
+#[derive(Clone, Copy)]
+pub struct ContentDefined {
+    min_size: usize,
+    avg_size: usize,
+    max_size: usize,
+    mask_small: u64,
+    mask_large: u64,
+}
+
+impl ContentDefined {
+    pub fn new(avg_size: usize) -> ContentDefined {
+        let avg_size = avg_size.max(64);
+        let bits = (usize::BITS - 1 - avg_size.leading_zeros()) as u64;
+        // Normalized chunking: a stricter mask below the average size and a
+        // looser one above it keep chunk sizes close to the average.
+        let mask = |bits: u64| if bits == 0 { 0 } else { u64::MAX << (64 - bits.min(63)) };
+        ContentDefined {
+            min_size: avg_size / 4,
+            avg_size,
+            max_size: avg_size * 2,
+            mask_small: mask(bits + 2),
+            mask_large: mask(bits.saturating_sub(2)),
+        }
+    }
+
+    /// Returns the end of the line holding the first content-defined cut
+    /// point in `buf`, if there is one before `max_size`.
+    fn cut_point(&self, buf: &[u8]) -> Option<usize> {
+        let end = buf.len().min(self.max_size);
+        let mut hash: u64 = 0;
+        let mut cut = None;
+        for i in self.min_size.min(end)..end {
+            hash = (hash << 1).wrapping_add(GEAR[buf[i] as usize]);
+            let mask = if i < self.avg_size { self.mask_small } else { self.mask_large };
+            if hash & mask == 0 {
+                cut = Some(i);
+                break;
+            }
+        }
+        let cut = cut?;
+        memchr::memchr(b'\n', &buf[cut..end]).map(|newline| cut + newline + 1)
+    }
+}
+
+/// Reads a file as consecutive chunks that end on a line boundary: either of
+/// at most `chunk_size` bytes, or at content-defined boundaries averaging
+/// `chunk_size` bytes. A line longer than a chunk is split, but never inside a
+/// UTF-8 sequence. Only the current chunk is held in memory.
+pub struct LineChunks<R> {
+    reader: R,
+    chunk_size: usize,
+    content_defined: Option<ContentDefined>,
+    carry: Vec<u8>,
+    offset: usize,
+    chunk_number: usize,
+    eof: bool,
+}
+
+impl<R: Read> LineChunks<R> {
+    pub fn new(reader: R, chunk_size: usize) -> LineChunks<R> {
+        LineChunks {
+            reader,
+            chunk_size: chunk_size.max(1),
+            content_defined: None,
+            carry: Vec::new(),
+            offset: 0,
+            chunk_number: 0,
+            eof: false,
+        }
+    }
+
+    pub fn content_defined(reader: R, avg_size: usize) -> LineChunks<R> {
+        let content_defined = ContentDefined::new(avg_size);
+        LineChunks {
+            chunk_size: content_defined.max_size,
+            content_defined: Some(content_defined),
+            ..LineChunks::new(reader, avg_size)
+        }
+    }
+
+    fn fill(&mut self, buf: &mut Vec<u8>) -> io::Result<()> {
+        while buf.len() < self.chunk_size && !self.eof {
+            let filled = buf.len();
+            buf.resize(self.chunk_size, 0);
+            match self.reader.read(&mut buf[filled..]) {
+                Ok(n) => {
+                    buf.truncate(filled + n);
+                    self.eof = n == 0;
+                }
+                Err(e) if e.kind() == io::ErrorKind::Interrupted => buf.truncate(filled),
+                Err(e) => {
+                    buf.truncate(filled);
+                    return Err(e);
+                }
+            }
+        }
+        Ok(())
+    }
+
+    fn cut(&self, buf: &[u8]) -> usize {
+        if let Some(cut) = self.content_defined.and_then(|content_defined| content_defined.cut_point(buf)) {
+            return cut;
+        }
+        if self.eof {
+            return buf.len();
+        }
+        if let Some(newline) = memchr::memrchr(b'\n', buf) {
+            return newline + 1;
+        }
+        split_point(buf)
+    }
+}
+
+/// Where to split a chunk that holds no line end: at its end, stepping back
+/// to the start of a UTF-8 sequence that would not fit.
+fn split_point(buf: &[u8]) -> usize {
+    let len = buf.len();
+    let lead = (len.saturating_sub(4)..len).rev().find(|&i| (buf[i] & 0xC0) != 0x80);
+    let cut = match lead {
+        Some(i) if i + utf8_width(buf[i]) > len => i,
+        _ => len,
+    };
+    if cut == 0 { len } else { cut }
+}
+
+fn utf8_width(lead: u8) -> usize {
+    match lead {
+        0xC0..=0xDF => 2,
+        0xE0..=0xEF => 3,
+        0xF0..=0xF7 => 4,
+        _ => 1,
+    }
+}
+
+impl<R: Read> Iterator for LineChunks<R> {
+    type Item = io::Result<(ChunkBounds, Vec<u8>)>;
+
+    fn next(&mut self) -> Option<Self::Item> {
+        let mut buf = std::mem::take(&mut self.carry);
+        if let Err(e) = self.fill(&mut buf) {
+            return Some(Err(e));
+        }
+        if buf.is_empty() {
+            return None;
+        }
+
+        let cut = self.cut(&buf);
+        self.carry = buf.split_off(cut);
+        self.chunk_number += 1;
+        let start = self.offset;
+        self.offset += buf.len();
+        Some(Ok(((self.chunk_number, start, self.offset), buf)))
+    }
+}
+
+/// Reads chunks at boundaries that were found earlier, in order, without
+/// loading more than one chunk at a time.
+pub struct BoundedChunks<R> {
+    reader: R,
+    bounds: std::vec::IntoIter<ChunkBounds>,
+    offset: usize,
+}
+
+impl<R: Read> BoundedChunks<R> {
+    pub fn new(reader: R, bounds: Vec<ChunkBounds>) -> BoundedChunks<R> {
+        BoundedChunks { reader, bounds: bounds.into_iter(), offset: 0 }
+    }
+}
+
+impl<R: Read> Iterator for BoundedChunks<R> {
+    type Item = io::Result<(ChunkBounds, Vec<u8>)>;
+
+    fn next(&mut self) -> Option<Self::Item> {
+        let (chunk_number, start, end) = self.bounds.next()?;
+        let mut read = || -> io::Result<Vec<u8>> {
+            if start > self.offset {
+                io::copy(&mut (&mut self.reader).take((start - self.offset) as u64), &mut io::sink())?;
+            }
+            let mut buf = Vec::with_capacity(end - start);
+            (&mut self.reader).take((end - start) as u64).read_to_end(&mut buf)?;
+            self.offset = start + buf.len();
+            Ok(buf)
+        };
+        Some(read().map(|buf| ((chunk_number, start, end), buf)))
+    }
+}
+
+/// Decodes a chunk without copying it when it is valid UTF-8.
+pub fn decode(buf: Vec<u8>) -> String {
+    String::from_utf8(buf).unwrap_or_else(|e| String::from_utf8_lossy(e.as_bytes()).into_owned())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn line_chunks(data: &[u8], chunk_size: usize) -> Vec<(ChunkBounds, Vec<u8>)> {
+        LineChunks::new(data, chunk_size).map(|chunk| chunk.unwrap()).collect()
+    }
+
+    fn boundaries(data: &[u8], chunk_size: usize) -> Vec<ChunkBounds> {
+        let mut boundaries = ChunkBoundaries::new(chunk_size);
+        for line in data.split_inclusive(|&byte| byte == b'\n') {
+            boundaries.line(line);
+        }
+        boundaries.finish()
+    }
+
+    fn bounded_chunks(data: &[u8], bounds: Vec<ChunkBounds>) -> Vec<(ChunkBounds, Vec<u8>)> {
+        BoundedChunks::new(data, bounds).map(|chunk| chunk.unwrap()).collect()
+    }
+
+    fn assert_covers(data: &[u8], chunks: &[(ChunkBounds, Vec<u8>)], chunk_size: usize) {
+        let mut offset = 0;
+        for (number, ((chunk_number, start, end), buf)) in chunks.iter().enumerate() {
+            assert_eq!(*chunk_number, number + 1);
+            assert_eq!(*start, offset);
+            assert_eq!(&data[*start..*end], buf.as_slice());
+            assert!(buf.len() <= chunk_size, "chunk of {} bytes over {}", buf.len(), chunk_size);
+            offset = *end;
+        }
+        assert_eq!(offset, data.len());
+    }
+
+    #[test]
+    fn newline_free_input_is_cut_at_chunk_size() {
+        let data = vec![b'a'; 1000];
+        let bounds = boundaries(&data, 64);
+        assert_eq!(bounds.len(), 16);
+        assert!(bounds.iter().all(|(_, start, end)| end - start <= 64));
+
+        let chunks = bounded_chunks(&data, bounds);
+        assert_covers(&data, &chunks, 64);
+        assert_eq!(chunks, line_chunks(&data, 64));
+    }
+
+    #[test]
+    fn huge_line_is_split_between_short_lines() {
+        let mut data = b"short line\n".to_vec();
+        data.extend(vec![b'x'; 500]);
+        data.extend(b"\nanother short line\n");
+
+        let chunks = bounded_chunks(&data, boundaries(&data, 100));
+        assert_covers(&data, &chunks, 100);
+        assert_eq!(chunks[0].1, b"short line\n");
+        assert_eq!(chunks, line_chunks(&data, 100));
+    }
+
+    #[test]
+    fn split_never_cuts_a_utf8_sequence() {
+        let data = "żółć".repeat(100).into_bytes();
+        let chunks = bounded_chunks(&data, boundaries(&data, 33));
+        assert_covers(&data, &chunks, 33);
+        for (_, buf) in &chunks {
+            assert!(std::str::from_utf8(buf).is_ok());
+        }
+        assert_eq!(chunks, line_chunks(&data, 33));
+    }
+
+    #[test]
+    fn boundaries_match_line_chunks() {
+        let mut data = Vec::new();
+        for i in 0..500 {
+            data.extend(vec![b'a' + (i % 26) as u8; (i * 37) % 150]);
+            data.push(b'\n');
+        }
+        data.extend(b"no trailing newline");
+
+        for chunk_size in [1, 7, 64, 100, 149, 150, 151, 1000, data.len(), data.len() + 1] {
+            let chunks = bounded_chunks(&data, boundaries(&data, chunk_size));
+            assert_covers(&data, &chunks, chunk_size);
+            assert_eq!(chunks, line_chunks(&data, chunk_size), "chunk_size {}", chunk_size);
+        }
+    }
+
+    #[test]
+    fn full_final_chunk_without_newline_matches_line_chunks() {
+        let data = b"abc\ndefgh".to_vec();
+        let chunks = bounded_chunks(&data, boundaries(&data, data.len()));
+        assert_eq!(chunks, line_chunks(&data, data.len()));
+    }
+
+    #[test]
+    fn content_defined_chunks_stay_within_max_size() {
+        let mut data = Vec::new();
+        let mut state: u64 = 1;
+        for _ in 0..20_000 {
+            state = state.wrapping_mul(6364136223846793005).wrapping_add(1442695040888963407);
+            let len = (state >> 58) as usize;
+            data.extend((0..len).map(|i| b'a' + ((state >> (i % 50)) % 26) as u8));
+            data.push(b'\n');
+        }
+
+        let avg_size = 4096;
+        let chunks: Vec<_> = LineChunks::content_defined(data.as_slice(), avg_size).map(|chunk| chunk.unwrap()).collect();
+        assert_covers(&data, &chunks, avg_size * 2);
+        for (_, buf) in &chunks[..chunks.len() - 1] {
+            assert!(buf.len() >= avg_size / 4, "chunk of {} bytes under the minimum", buf.len());
+            assert_eq!(buf.last(), Some(&b'\n'));
+        }
+    }
+
+    #[test]
+    fn content_defined_boundaries_survive_an_edit() {
+        let mut data = Vec::new();
+        for i in 0..5000 {
+            data.extend(format!("record {} {}\n", i, i * 7919 % 1000).into_bytes());
+        }
+        let mut edited = b"inserted line\n".to_vec();
+        edited.extend(&data);
+
+        let chunks = |data: &[u8]| -> Vec<Vec<u8>> {
+            LineChunks::content_defined(data, 1024).map(|chunk| chunk.unwrap().1).collect()
+        };
+        let original = chunks(&data);
+        let shifted = chunks(&edited);
+        let shared = original.iter().filter(|chunk| shifted.contains(chunk)).count();
+        assert!(shared >= original.len() - 2, "{} of {} chunks kept", shared, original.len());
+    }
+}
@@ -0,0 +1,266 @@
+use regex::bytes::{Regex, RegexSet};
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+
+use crate::prefilter::{self, Prefilter};
+
+pub struct PatternSpec {
+    pub pattern: String,
+    pub class: String,
+    /// Literals every match must contain. `None` extracts them from the pattern.
+    pub literals: Option<Vec<String>>,
+}
+
+impl PatternSpec {
+    pub fn new(pattern: String, class: String) -> PatternSpec {
+        PatternSpec { pattern, class, literals: None }
+    }
+}
+
+pub struct PatternReport {
+    pub pattern: String,
+    pub class: String,
+    pub literals: Vec<String>,
+    pub lines: u64,
+    pub passed: u64,
+    pub matched: u64,
+}
+
+/// Match counts per pattern and per class, the pattern of the first match in
+/// file order and a bounded sample of decoded matches. Memory use does not
+/// grow with the number of matches in a file.
+pub struct Matches {
+    pub counts: Vec<u64>,
+    pub class_scores: Vec<u64>,
+    pub total: u64,
+    pub first: Option<usize>,
+    pub samples: Vec<(String, String)>,
+    max_samples: usize,
+}
+
+impl Matches {
+    pub fn new(patterns: usize, classes: usize, max_samples: usize) -> Matches {
+        Matches {
+            counts: vec![0; patterns],
+            class_scores: vec![0; classes],
+            total: 0,
+            first: None,
+            samples: Vec::new(),
+            max_samples,
+        }
+    }
+
+    /// Appends the matches of a later part of the same file.
+    pub fn merge(&mut self, other: Matches) {
+        for (count, other_count) in self.counts.iter_mut().zip(other.counts) {
+            *count += other_count;
+        }
+        for (score, other_score) in self.class_scores.iter_mut().zip(other.class_scores) {
+            *score += other_score;
+        }
+        self.total += other.total;
+        if self.first.is_none() {
+            self.first = other.first;
+        }
+        let room = self.max_samples.saturating_sub(self.samples.len());
+        self.samples.extend(other.samples.into_iter().take(room));
+    }
+}
+
+/// Per-scan scratch space and counters, so one engine can be shared by
+/// concurrent scans without locking on every line.
+pub struct ScanState {
+    present: Vec<bool>,
+    touched: Vec<usize>,
+    lines: u64,
+    passed: Vec<u64>,
+    matched: Vec<u64>,
+}
+
+pub struct Engine {
+    set: RegexSet,
+    regexes: Vec<Regex>,
+    patterns: Vec<String>,
+    classes: Vec<String>,
+    class_names: Vec<String>,
+    class_ids: Vec<usize>,
+    prefilter: Option<Prefilter>,
+    has_unfiltered: bool,
+    lines: AtomicU64,
+    passed: Vec<AtomicU64>,
+    matched: Vec<AtomicU64>,
+}
+
+impl Engine {
+    pub fn new(specs: &[PatternSpec]) -> Result<Engine, regex::Error> {
+        let set = RegexSet::new(specs.iter().map(|spec| spec.pattern.as_str()))?;
+        let regexes = specs.iter()
+            .map(|spec| Regex::new(&spec.pattern))
+            .collect::<Result<Vec<_>, _>>()?;
+        let patterns = specs.iter().map(|spec| spec.pattern.clone()).collect();
+        let classes: Vec<String> = specs.iter().map(|spec| spec.class.clone()).collect();
+
+        let mut class_names: Vec<String> = Vec::new();
+        let class_ids = classes.iter()
+            .map(|class| match class_names.iter().position(|name| name == class) {
+                Some(id) => id,
+                None => {
+                    class_names.push(class.clone());
+                    class_names.len() - 1
+                }
+            })
+            .collect();
+
+        let literal_groups: Vec<_> = specs.iter()
+            .map(|spec| match &spec.literals {
+                Some(literals) => literals.iter().map(|literal| vec![literal.as_bytes().to_vec()]).collect(),
+                None => prefilter::required_literals(&spec.pattern),
+            })
+            .collect();
+        let prefilter = Prefilter::new(&literal_groups);
+        let has_unfiltered = match &prefilter {
+            Some(prefilter) => (0..specs.len()).any(|index| !prefilter.is_filtered(index)),
+            None => true,
+        };
+
+        Ok(Engine {
+            set,
+            regexes,
+            patterns,
+            classes,
+            class_names,
+            class_ids,
+            prefilter,
+            has_unfiltered,
+            lines: AtomicU64::new(0),
+            passed: specs.iter().map(|_| AtomicU64::new(0)).collect(),
+            matched: specs.iter().map(|_| AtomicU64::new(0)).collect(),
+        })
+    }
+
+    pub fn len(&self) -> usize {
+        self.regexes.len()
+    }
+
+    pub fn state(&self) -> ScanState {
+        let literal_count = self.prefilter.as_ref().map_or(0, Prefilter::literal_count);
+        ScanState {
+            present: vec![false; literal_count],
+            touched: Vec::new(),
+            lines: 0,
+            passed: vec![0; self.len()],
+            matched: vec![0; self.len()],
+        }
+    }
+
+    pub fn class_count(&self) -> usize {
+        self.class_names.len()
+    }
+
+    pub fn matches(&self, max_samples: usize) -> Matches {
+        Matches::new(self.len(), self.class_count(), max_samples)
+    }
+
+    pub fn class_of(&self, index: usize) -> &str {
+        &self.classes[index]
+    }
+
+    pub fn class_name(&self, class_id: usize) -> &str {
+        &self.class_names[class_id]
+    }
+
+    pub fn class_id_of(&self, index: usize) -> usize {
+        self.class_ids[index]
+    }
+
+    pub fn class_counts(&self, matches: &Matches) -> HashMap<String, u64> {
+        matches.class_scores.iter()
+            .enumerate()
+            .filter(|(_, score)| **score > 0)
+            .map(|(class_id, score)| (self.class_names[class_id].clone(), *score))
+            .collect()
+    }
+
+    pub fn scan_line(&self, line: &[u8], state: &mut ScanState, matches: &mut Matches) {
+        state.lines += 1;
+
+        let Some(prefilter) = &self.prefilter else {
+            // The set answers "which patterns hit this line" in a single pass,
+            // so extraction only runs the regexes that are known to match.
+            for index in self.set.matches(line).into_iter() {
+                self.extract(index, line, state, matches);
+            }
+            return;
+        };
+
+        let any_literal = prefilter.mark(line, &mut state.present, &mut state.touched);
+        if !any_literal && !self.has_unfiltered {
+            return;
+        }
+
+        let unfiltered = if self.has_unfiltered { Some(self.set.matches(line)) } else { None };
+        for index in 0..self.regexes.len() {
+            let candidate = if prefilter.is_filtered(index) {
+                any_literal && prefilter.is_candidate(index, &state.present)
+            } else {
+                unfiltered.as_ref().map_or(false, |set| set.matched(index))
+            };
+            if !candidate {
+                continue;
+            }
+            if prefilter.is_filtered(index) {
+                state.passed[index] += 1;
+            }
+            self.extract(index, line, state, matches);
+        }
+
+        for id in state.touched.drain(..) {
+            state.present[id] = false;
+        }
+    }
+
+    fn extract(&self, index: usize, line: &[u8], state: &mut ScanState, matches: &mut Matches) {
+        // Lines are raw bytes; only the sampled spans are decoded.
+        let before = matches.counts[index];
+        for mat in self.regexes[index].find_iter(line) {
+            matches.counts[index] += 1;
+            matches.class_scores[self.class_ids[index]] += 1;
+            matches.total += 1;
+            matches.first.get_or_insert(index);
+            if matches.samples.len() < matches.max_samples {
+                matches.samples.push((String::from_utf8_lossy(mat.as_bytes()).into_owned(), self.classes[index].clone()));
+            }
+        }
+        if matches.counts[index] > before {
+            state.matched[index] += 1;
+        }
+    }
+
+    /// Moves the counters of a scan into the engine totals.
+    pub fn record(&self, state: &mut ScanState) {
+        self.lines.fetch_add(std::mem::take(&mut state.lines), Ordering::Relaxed);
+        for index in 0..self.len() {
+            self.passed[index].fetch_add(std::mem::take(&mut state.passed[index]), Ordering::Relaxed);
+            self.matched[index].fetch_add(std::mem::take(&mut state.matched[index]), Ordering::Relaxed);
+        }
+    }
+
+    /// Reports, for every pattern, how many scanned lines reached its regex.
+    /// Patterns without a prefilter pass every line.
+    pub fn report(&self) -> Vec<PatternReport> {
+        let lines = self.lines.load(Ordering::Relaxed);
+        (0..self.len())
+            .map(|index| {
+                let filtered = self.prefilter.as_ref().map_or(false, |prefilter| prefilter.is_filtered(index));
+                PatternReport {
+                    pattern: self.patterns[index].clone(),
+                    class: self.classes[index].clone(),
+                    literals: self.prefilter.as_ref().map_or_else(Vec::new, |prefilter| prefilter.describe(index)),
+                    lines,
+                    passed: if filtered { self.passed[index].load(Ordering::Relaxed) } else { lines },
+                    matched: self.matched[index].load(Ordering::Relaxed),
+                }
+            })
+            .collect()
+    }
+}
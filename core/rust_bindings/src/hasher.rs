@@ -0,0 +1,68 @@
+use sha2::{Digest, Sha256};
+use xxhash_rust::xxh3::xxh3_64;
+
+/// Buffers at least this large are hashed with BLAKE3 on all cores.
+const PARALLEL_HASH_THRESHOLD: usize = 1024 * 1024;
+
+/// Content hash algorithms a scrap can be stored under.
+#[derive(Clone, Copy, PartialEq, Eq, Debug)]
+pub enum HashAlgorithm {
+    Sha256,
+    Blake3,
+}
+
+impl HashAlgorithm {
+    pub fn parse(name: &str) -> Option<HashAlgorithm> {
+        match name.to_ascii_lowercase().as_str() {
+            "sha256" => Some(HashAlgorithm::Sha256),
+            "blake3" => Some(HashAlgorithm::Blake3),
+            _ => None,
+        }
+    }
+}
+
+/// Incremental hasher over either algorithm. Both produce 64 hex digits.
+pub enum ContentHasher {
+    Sha256(Sha256),
+    Blake3(Box<blake3::Hasher>),
+}
+
+impl ContentHasher {
+    pub fn new(algorithm: HashAlgorithm) -> ContentHasher {
+        match algorithm {
+            HashAlgorithm::Sha256 => ContentHasher::Sha256(Sha256::new()),
+            HashAlgorithm::Blake3 => ContentHasher::Blake3(Box::new(blake3::Hasher::new())),
+        }
+    }
+
+    pub fn update(&mut self, data: &[u8]) {
+        match self {
+            ContentHasher::Sha256(hasher) => hasher.update(data),
+            ContentHasher::Blake3(hasher) if data.len() >= PARALLEL_HASH_THRESHOLD => {
+                hasher.update_rayon(data);
+            }
+            ContentHasher::Blake3(hasher) => {
+                hasher.update(data);
+            }
+        }
+    }
+
+    pub fn finalize_hex(self) -> String {
+        match self {
+            ContentHasher::Sha256(hasher) => format!("{:x}", hasher.finalize()),
+            ContentHasher::Blake3(hasher) => hasher.finalize().to_hex().to_string(),
+        }
+    }
+}
+
+pub fn digest_hex(algorithm: HashAlgorithm, data: &[u8]) -> String {
+    let mut hasher = ContentHasher::new(algorithm);
+    hasher.update(data);
+    hasher.finalize_hex()
+}
+
+/// xxh3 of the first bytes of a file followed by its size. Files with
+/// different fingerprints differ; equal fingerprints still need the full hash.
+pub fn prefix_fingerprint(size: u64, prefix: &[u8]) -> String {
+    format!("{:016x}{:016x}", xxh3_64(prefix), size)
+}
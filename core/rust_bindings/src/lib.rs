@@ -1,136 +1,637 @@
+mod chunker;
+mod engine;
+mod hasher;
+mod prefilter;
+mod scanner;
+
+use memmap2::Mmap;
 use pyo3::prelude::*;
-use pyo3::exceptions::PyIOError;
-use regex::Regex;
+use pyo3::exceptions::{PyIOError, PyValueError};
 use sha2::{Sha256, Digest};
+use std::collections::HashMap;
 use std::fs::File;
-use std::io::{BufReader, Read, BufRead};
+use std::io::{BufReader, Cursor, Read};
+use std::sync::Arc;
 
-#[pyfunction]
-fn calculate_file_hash(file_path: &str) -> PyResult<String> {
-    let file = File::open(file_path).map_err(|e| PyIOError::new_err(format!("Failed to open file: {}", e)))?;
-    let mut reader = BufReader::new(file);
-    let mut hasher = Sha256::new();
-    let mut buffer = [0u8; 8192];
-
-    loop {
-        let n = reader.read(&mut buffer).map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
-        if n == 0 {
-            break;
+use chunker::{BoundedChunks, ChunkBounds, LineChunks};
+use engine::{Engine, Matches, PatternSpec};
+use hasher::{ContentHasher, HashAlgorithm};
+use scanner::{Classification, ClassifyLimits, FileScan, MatchBatches};
+
+type ScrapResult = Option<(String, Vec<(String, String)>)>;
+type PrefilterStats = (String, String, Vec<String>, u64, u64, u64);
+
+#[derive(Clone, Copy)]
+struct ScanOptions {
+    use_mmap: bool,
+    parallel_threshold: usize,
+    workers: usize,
+    max_samples: usize,
+}
+
+impl ScanOptions {
+    fn sequential() -> ScanOptions {
+        ScanOptions { use_mmap: true, parallel_threshold: usize::MAX, workers: 1, max_samples: usize::MAX }
+    }
+
+    fn workers_for(&self, len: usize) -> usize {
+        if len < self.parallel_threshold {
+            return 1;
         }
-        hasher.update(&buffer[..n]);
+        if self.workers > 0 {
+            return self.workers;
+        }
+        std::thread::available_parallelism().map(|n| n.get()).unwrap_or(1)
     }
+}
 
-    let hash = hasher.finalize();
-    Ok(format!("{:x}", hash))
+// Every entry point below releases the GIL around file I/O, hashing and
+// scanning, so other Python threads and the event loop keep running.
+#[pyfunction]
+fn calculate_file_hash(py: Python, file_path: &str) -> PyResult<String> {
+    calculate_content_hash(py, file_path, "sha256")
 }
 
+/// Content hash of a file under `algorithm` ("blake3" or "sha256"). Large
+/// files are mapped and hashed by BLAKE3 on all cores.
 #[pyfunction]
-fn scan_file_for_patterns(file_path: &str, patterns: Vec<(&str, &str)>) -> PyResult<Vec<(String, String)>> {
-    let file = File::open(file_path).map_err(|e| PyIOError::new_err(format!("Failed to open file: {}", e)))?;
-    let reader = BufReader::new(file);
-
-    let regexes: Vec<(Regex, &str)> = patterns.iter()
-        .map(|(pattern, class)| {
-            Regex::new(pattern)
-                .map(|regex| (regex, *class))
-                .map_err(|e| PyErr::new::<PyIOError, _>(format!("Invalid regex pattern: {}", e)))
-        })
-        .collect::<Result<Vec<_>, _>>()?;
+fn calculate_content_hash(py: Python, file_path: &str, algorithm: &str) -> PyResult<String> {
+    let algorithm = hash_algorithm(algorithm)?;
 
-    let mut matches = Vec::new();
+    py.allow_threads(|| {
+        if algorithm == HashAlgorithm::Blake3 {
+            let map = map_file(file_path)?;
+            return Ok(hasher::digest_hex(algorithm, map.as_deref().unwrap_or(&[])));
+        }
 
-    for line in reader.lines() {
-        let line = line.map_err(|e| PyIOError::new_err(format!("Failed to read line: {}", e)))?;
-        
-        for (re, class) in &regexes {
-            for mat in re.find_iter(&line) {
-                matches.push((mat.as_str().to_string(), class.to_string()));
+        let mut file = open_file(file_path)?;
+        let mut hasher = ContentHasher::new(algorithm);
+        let mut buffer = vec![0u8; 1 << 20];
+
+        loop {
+            let n = file.read(&mut buffer).map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
+            if n == 0 {
+                break;
             }
+            hasher.update(&buffer[..n]);
         }
+
+        Ok(hasher.finalize_hex())
+    })
+}
+
+/// xxh3 of the first `prefix_size` bytes plus the size, for cheap negative checks.
+#[pyfunction]
+fn calculate_file_fingerprint(py: Python, file_path: &str, prefix_size: usize) -> PyResult<String> {
+    py.allow_threads(|| {
+        let file = open_file(file_path)?;
+        let size = file_len(&file)? as u64;
+        let mut prefix = Vec::with_capacity(prefix_size.min(size as usize));
+        file.take(prefix_size as u64)
+            .read_to_end(&mut prefix)
+            .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
+        Ok(hasher::prefix_fingerprint(size, &prefix))
+    })
+}
+
+/// `calculate_content_hash` over content held in memory.
+#[pyfunction]
+fn calculate_bytes_hash(py: Python, content: &[u8], algorithm: &str) -> PyResult<String> {
+    let algorithm = hash_algorithm(algorithm)?;
+    py.allow_threads(|| Ok(hasher::digest_hex(algorithm, content)))
+}
+
+/// `calculate_file_fingerprint` over content held in memory.
+#[pyfunction]
+fn calculate_bytes_fingerprint(py: Python, content: &[u8], prefix_size: usize) -> String {
+    py.allow_threads(|| hasher::prefix_fingerprint(content.len() as u64, &content[..prefix_size.min(content.len())]))
+}
+
+fn hash_algorithm(name: &str) -> PyResult<HashAlgorithm> {
+    HashAlgorithm::parse(name).ok_or_else(|| PyValueError::new_err(format!("Unknown hash algorithm: {}", name)))
+}
+
+fn build_engine(specs: &[PatternSpec]) -> PyResult<Engine> {
+    Engine::new(specs).map_err(|e| PyIOError::new_err(format!("Invalid regex pattern: {}", e)))
+}
+
+fn pattern_specs(patterns: Vec<(String, String)>) -> Vec<PatternSpec> {
+    patterns.into_iter().map(|(pattern, class)| PatternSpec::new(pattern, class)).collect()
+}
+
+fn open_file(file_path: &str) -> PyResult<File> {
+    File::open(file_path).map_err(|e| PyIOError::new_err(format!("Failed to open file: {}", e)))
+}
+
+fn file_len(file: &File) -> PyResult<usize> {
+    let metadata = file.metadata().map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
+    Ok(metadata.len() as usize)
+}
+
+fn map_file(file_path: &str) -> PyResult<Option<Mmap>> {
+    let file = open_file(file_path)?;
+    if file_len(&file)? == 0 {
+        return Ok(None);
     }
 
-    Ok(matches)
+    // The mapping is read-only and dropped before the call returns. Upstream
+    // files are not modified while a scrap is being processed.
+    let map = unsafe { Mmap::map(&file) }
+        .map_err(|e| PyIOError::new_err(format!("Failed to map file: {}", e)))?;
+    Ok(Some(map))
+}
+
+// The *_buffer_with_engine helpers serve both mapped files and content that
+// arrived inline with the scrap message.
+fn scan_buffer_with_engine(buffer: &[u8], engine: &Engine, options: ScanOptions) -> Matches {
+    let workers = options.workers_for(buffer.len());
+    if workers > 1 {
+        return scanner::scan_buffer_parallel(engine, buffer, workers, options.max_samples);
+    }
+    scanner::scan_buffer(engine, buffer, options.max_samples)
+}
+
+fn classify_buffer_with_engine(buffer: &[u8], engine: &Engine, limits: ClassifyLimits, options: ScanOptions) -> Classification {
+    let workers = options.workers_for(buffer.len());
+    scanner::classify_buffer(engine, buffer, limits, workers, options.max_samples)
+}
+
+fn process_buffer_with_engine(
+    buffer: &[u8],
+    engine: &Engine,
+    chunk_size: usize,
+    algorithm: HashAlgorithm,
+    options: ScanOptions
+) -> FileScan {
+    let workers = options.workers_for(buffer.len());
+    if workers > 1 {
+        return scanner::process_buffer_parallel(engine, buffer, chunk_size, algorithm, workers, options.max_samples);
+    }
+    scanner::process_buffer(engine, buffer, chunk_size, algorithm, options.max_samples)
+}
+
+fn scan_file_with_engine(file_path: &str, engine: &Engine, options: ScanOptions) -> PyResult<(Matches, usize)> {
+    if options.use_mmap {
+        let map = map_file(file_path)?;
+        let buffer = map.as_deref().unwrap_or(&[]);
+        return Ok((scan_buffer_with_engine(buffer, engine, options), buffer.len()));
+    }
+
+    let file = open_file(file_path)?;
+    let len = file_len(&file)?;
+    let matches = scanner::scan_reader(engine, BufReader::new(file), options.max_samples)
+        .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
+    Ok((matches, len))
+}
+
+fn classify_file_with_engine(file_path: &str, engine: &Engine, limits: ClassifyLimits, options: ScanOptions) -> PyResult<(Classification, usize)> {
+    if options.use_mmap {
+        let map = map_file(file_path)?;
+        let buffer = map.as_deref().unwrap_or(&[]);
+        return Ok((classify_buffer_with_engine(buffer, engine, limits, options), buffer.len()));
+    }
+
+    let file = open_file(file_path)?;
+    let len = file_len(&file)?;
+    let classification = scanner::classify_reader(engine, BufReader::new(file), limits, options.max_samples)
+        .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
+    Ok((classification, len))
+}
+
+fn process_file_with_engine(
+    file_path: &str,
+    engine: &Engine,
+    chunk_size: usize,
+    algorithm: HashAlgorithm,
+    options: ScanOptions
+) -> PyResult<FileScan> {
+    if options.use_mmap {
+        let map = map_file(file_path)?;
+        let buffer = map.as_deref().unwrap_or(&[]);
+        return Ok(process_buffer_with_engine(buffer, engine, chunk_size, algorithm, options));
+    }
+
+    let reader = BufReader::new(open_file(file_path)?);
+    scanner::process_reader(engine, reader, chunk_size, algorithm, options.max_samples)
+        .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))
+}
+
+fn classify_matches(engine: &Engine, matches: Matches) -> ScrapResult {
+    let first = matches.first?;
+    Some((engine.class_of(first).to_string(), matches.samples))
+}
+
+/// Outcome of a scan: per-class match counts, a bounded sample of matches and
+/// how much of the file was read to get there.
+#[pyclass]
+struct ScanResult {
+    #[pyo3(get)]
+    scrap_class: String,
+    #[pyo3(get)]
+    class_counts: HashMap<String, u64>,
+    #[pyo3(get)]
+    match_count: u64,
+    #[pyo3(get)]
+    samples: Vec<(String, String)>,
+    #[pyo3(get)]
+    bytes_scanned: usize,
+    #[pyo3(get)]
+    total_bytes: usize,
+    #[pyo3(get)]
+    complete: bool,
+}
+
+impl ScanResult {
+    fn new(
+        scrap_class: String,
+        engine: &Engine,
+        matches: Matches,
+        bytes_scanned: usize,
+        total_bytes: usize,
+        complete: bool
+    ) -> ScanResult {
+        ScanResult {
+            scrap_class,
+            class_counts: engine.class_counts(&matches),
+            match_count: matches.total,
+            samples: matches.samples,
+            bytes_scanned,
+            total_bytes,
+            complete,
+        }
+    }
+}
+
+// A full scan keeps the class of the first match in the file.
+fn scan_result(engine: &Engine, matches: Matches, total_bytes: usize) -> Option<ScanResult> {
+    let first = matches.first?;
+    let scrap_class = engine.class_of(first).to_string();
+    Some(ScanResult::new(scrap_class, engine, matches, total_bytes, total_bytes, true))
+}
+
+// A classification scan picks the highest scoring class; the class of the
+// first match wins ties. Whether it read everything is decided by the scan,
+// which knows when a reader ran dry.
+fn classification_result(engine: &Engine, classification: Classification, total_bytes: usize) -> Option<ScanResult> {
+    let matches = classification.matches;
+    let first_class = engine.class_id_of(matches.first?);
+    let best_class = (0..engine.class_count())
+        .max_by_key(|&class_id| (matches.class_scores[class_id], class_id == first_class))?;
+    let scrap_class = engine.class_name(best_class).to_string();
+    Some(ScanResult::new(
+        scrap_class,
+        engine,
+        matches,
+        classification.bytes_scanned,
+        total_bytes,
+        classification.complete
+    ))
+}
+
+enum MatchSource {
+    Mapped { map: Option<Mmap>, offset: usize },
+    Reader(BufReader<File>),
+}
+
+/// Iterates over the matches of a file in batches of at most `batch_size`
+/// `(match, class)` pairs, scanning only as far as the consumer has read.
+/// This is the API for consumers that need every match rather than the
+/// counts and capped samples of a `ScanResult`. Each batch is scanned with
+/// the GIL released.
+#[pyclass]
+struct MatchStream {
+    engine: Arc<Engine>,
+    source: MatchSource,
+    batches: MatchBatches,
+}
+
+#[pymethods]
+impl MatchStream {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(mut slf: PyRefMut<'_, Self>) -> PyResult<Option<Vec<(String, String)>>> {
+        let py = slf.py();
+        let stream = &mut *slf;
+        py.allow_threads(|| {
+            let engine = &stream.engine;
+            let source = &mut stream.source;
+            stream.batches
+                .next_batch(engine, |state, matches, wanted| match source {
+                    MatchSource::Mapped { map, offset } => {
+                        let buffer = map.as_deref().unwrap_or(&[]);
+                        *offset = scanner::scan_batch(engine, buffer, *offset, state, matches, wanted);
+                        Ok(*offset >= buffer.len())
+                    }
+                    MatchSource::Reader(reader) => scanner::scan_reader_batch(engine, reader, state, matches, wanted),
+                })
+                .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))
+        })
+    }
+}
+
+#[pyclass]
+struct PatternEngine {
+    engine: Arc<Engine>,
+    #[pyo3(get)]
+    version: String,
+    options: ScanOptions,
+}
+
+#[pymethods]
+impl PatternEngine {
+    #[new]
+    fn new(
+        py: Python,
+        patterns: Vec<(String, String, Option<Vec<String>>)>,
+        version: String,
+        use_mmap: bool,
+        parallel_threshold: usize,
+        workers: usize,
+        max_samples: usize
+    ) -> PyResult<Self> {
+        let specs: Vec<PatternSpec> = patterns.into_iter()
+            .map(|(pattern, class, literals)| PatternSpec { pattern, class, literals })
+            .collect();
+        let engine = Arc::new(py.allow_threads(|| build_engine(&specs))?);
+        let options = ScanOptions { use_mmap, parallel_threshold, workers, max_samples };
+        Ok(PatternEngine { engine, version, options })
+    }
+
+    fn __len__(&self) -> usize {
+        self.engine.len()
+    }
+
+    /// Returns `(pattern, class, literals, lines, passed, matched)` for every
+    /// pattern, counted over all scans made with this engine.
+    fn prefilter_stats(&self) -> Vec<PrefilterStats> {
+        self.engine.report().into_iter()
+            .map(|report| (report.pattern, report.class, report.literals, report.lines, report.passed, report.matched))
+            .collect()
+    }
+
+    fn process_scrap(&self, py: Python, file_path: &str, is_hash_processed: bool) -> PyResult<Option<ScanResult>> {
+        if is_hash_processed {
+            return Ok(None);
+        }
+
+        py.allow_threads(|| {
+            let (matches, total_bytes) = scan_file_with_engine(file_path, &self.engine, self.options)?;
+            Ok(scan_result(&self.engine, matches, total_bytes))
+        })
+    }
+
+    /// Scans only until one class reaches `confidence` matches or
+    /// `match_budget` matches were seen in total; zero disables either limit.
+    fn classify(&self, py: Python, file_path: &str, is_hash_processed: bool, confidence: u64, match_budget: u64) -> PyResult<Option<ScanResult>> {
+        if is_hash_processed {
+            return Ok(None);
+        }
+
+        let limits = ClassifyLimits { confidence, match_budget };
+        py.allow_threads(|| {
+            let (classification, total_bytes) = classify_file_with_engine(file_path, &self.engine, limits, self.options)?;
+            Ok(classification_result(&self.engine, classification, total_bytes))
+        })
+    }
+
+    /// Hashes under `hash_algorithm`, scans and finds line-aligned chunk
+    /// boundaries in a single read.
+    fn process_file(
+        &self,
+        py: Python,
+        file_path: &str,
+        chunk_size: usize,
+        hash_algorithm: &str
+    ) -> PyResult<(String, Option<ScanResult>, Vec<ChunkBounds>)> {
+        let algorithm = self::hash_algorithm(hash_algorithm)?;
+        py.allow_threads(|| {
+            let scan = process_file_with_engine(file_path, &self.engine, chunk_size, algorithm, self.options)?;
+            let total_bytes = scan.chunks.last().map_or(0, |&(_, _, end)| end);
+            Ok((scan.hash, scan_result(&self.engine, scan.matches, total_bytes), scan.chunks))
+        })
+    }
+
+    /// `process_scrap` over content held in memory.
+    fn process_scrap_bytes(&self, py: Python, content: &[u8], is_hash_processed: bool) -> PyResult<Option<ScanResult>> {
+        if is_hash_processed {
+            return Ok(None);
+        }
+
+        py.allow_threads(|| {
+            let matches = scan_buffer_with_engine(content, &self.engine, self.options);
+            Ok(scan_result(&self.engine, matches, content.len()))
+        })
+    }
+
+    /// `classify` over content held in memory.
+    fn classify_bytes(&self, py: Python, content: &[u8], is_hash_processed: bool, confidence: u64, match_budget: u64) -> PyResult<Option<ScanResult>> {
+        if is_hash_processed {
+            return Ok(None);
+        }
+
+        let limits = ClassifyLimits { confidence, match_budget };
+        py.allow_threads(|| {
+            let classification = classify_buffer_with_engine(content, &self.engine, limits, self.options);
+            Ok(classification_result(&self.engine, classification, content.len()))
+        })
+    }
+
+    /// `process_file` over content held in memory.
+    fn process_bytes(
+        &self,
+        py: Python,
+        content: &[u8],
+        chunk_size: usize,
+        hash_algorithm: &str
+    ) -> PyResult<(String, Option<ScanResult>, Vec<ChunkBounds>)> {
+        let algorithm = self::hash_algorithm(hash_algorithm)?;
+        py.allow_threads(|| {
+            let scan = process_buffer_with_engine(content, &self.engine, chunk_size, algorithm, self.options);
+            Ok((scan.hash, scan_result(&self.engine, scan.matches, content.len()), scan.chunks))
+        })
+    }
+
+    fn iter_matches(&self, py: Python, file_path: &str, batch_size: usize) -> PyResult<MatchStream> {
+        let use_mmap = self.options.use_mmap;
+        let source = py.allow_threads(|| -> PyResult<MatchSource> {
+            if use_mmap {
+                Ok(MatchSource::Mapped { map: map_file(file_path)?, offset: 0 })
+            } else {
+                Ok(MatchSource::Reader(BufReader::new(open_file(file_path)?)))
+            }
+        })?;
+
+        Ok(MatchStream {
+            engine: Arc::clone(&self.engine),
+            source,
+            batches: MatchBatches::new(&self.engine, batch_size),
+        })
+    }
+}
+
+#[pyfunction]
+fn scan_file_for_patterns(py: Python, file_path: &str, patterns: Vec<(String, String)>) -> PyResult<Vec<(String, String)>> {
+    py.allow_threads(|| {
+        let engine = build_engine(&pattern_specs(patterns))?;
+        let (matches, _) = scan_file_with_engine(file_path, &engine, ScanOptions::sequential())?;
+        Ok(matches.samples)
+    })
 }
 
 #[pyfunction]
 fn process_scrap_in_rust(
+    py: Python,
     file_path: &str,
-    patterns_and_classes: Vec<(&str, &str)>,
+    patterns_and_classes: Vec<(String, String)>,
     is_hash_processed: bool
-) -> PyResult<Option<(String, Vec<(String, String)>)>> {
+) -> PyResult<ScrapResult> {
     if is_hash_processed {
         return Ok(None);
     }
 
-    let file = File::open(file_path)
-        .map_err(|e| PyIOError::new_err(format!("Failed to open file: {}", e)))?;
-    let reader = BufReader::new(file);
+    py.allow_threads(|| {
+        let engine = build_engine(&pattern_specs(patterns_and_classes))?;
+        let (matches, _) = scan_file_with_engine(file_path, &engine, ScanOptions::sequential())?;
 
-    let regexes: Vec<(Regex, &str)> = patterns_and_classes.iter()
-        .map(|(pattern, class)| {
-            Regex::new(pattern)
-                .map(|regex| (regex, *class))
-                .map_err(|e| PyIOError::new_err(format!("Invalid regex pattern: {}", e)))
-        })
-        .collect::<Result<Vec<_>, _>>()?;
+        Ok(classify_matches(&engine, matches))
+    })
+}
 
-    let mut matches = Vec::new();
+type ChunkReader = Box<dyn Read + Send>;
 
-    for line in reader.lines() {
-        let line = line
-            .map_err(|e| PyIOError::new_err(format!("Failed to read line: {}", e)))?;
-        for (re, class) in &regexes {
-            for mat in re.find_iter(&line) {
-                matches.push((mat.as_str().to_string(), class.to_string()));
-            }
-        }
-    }
+enum ChunkSource {
+    Lines(LineChunks<ChunkReader>),
+    Bounded(BoundedChunks<ChunkReader>),
+}
 
-    if matches.is_empty() {
-        return Ok(None);
+fn chunk_source(reader: ChunkReader, chunk_size: usize, chunk_bounds: Option<Vec<ChunkBounds>>, content_defined: bool) -> ChunkSource {
+    match chunk_bounds {
+        _ if content_defined => ChunkSource::Lines(LineChunks::content_defined(reader, chunk_size)),
+        Some(bounds) => ChunkSource::Bounded(BoundedChunks::new(reader, bounds)),
+        None => ChunkSource::Lines(LineChunks::new(reader, chunk_size)),
     }
+}
 
-    let scrap_class = matches[0].1.clone();
+/// Yields `(chunk_number, start, end, content, fingerprint)` for one chunk at
+/// a time, so only the chunk being consumed is held in memory. The
+/// fingerprint is the SHA-256 of the chunk bytes. The SHA-256 of the whole
+/// content is taken along the way and is available once the stream ends.
+#[pyclass]
+struct ChunkStream {
+    source: ChunkSource,
+    hasher: Option<ContentHasher>,
+    sha256: Option<String>,
+}
 
-    Ok(Some((scrap_class, matches)))
+impl ChunkStream {
+    fn new(source: ChunkSource) -> ChunkStream {
+        ChunkStream { source, hasher: Some(ContentHasher::new(HashAlgorithm::Sha256)), sha256: None }
+    }
 }
 
-#[pyfunction]
-fn split_file_into_chunks(file_path: &str, chunk_size: usize) -> PyResult<Vec<(usize, String)>> {
-    let file = File::open(file_path).map_err(|e| PyIOError::new_err(format!("Failed to open file: {}", e)))?;
-    let mut reader = BufReader::new(file);
-    let mut chunks = Vec::new();
-    let mut buffer = Vec::with_capacity(chunk_size);
-    let mut chunk_number = 1;
-
-    loop {
-        let mut buf = [0u8; 8192];
-        let n = reader.read(&mut buf).map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))?;
-        if n == 0 {
-            break;
-        }
-        buffer.extend_from_slice(&buf[..n]);
-        if buffer.len() >= chunk_size {
-            let chunk_content = String::from_utf8_lossy(&buffer).to_string();
-            chunks.push((chunk_number, chunk_content));
-            buffer.clear();
-            chunk_number += 1;
-        }
+#[pymethods]
+impl ChunkStream {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(mut slf: PyRefMut<'_, Self>) -> PyResult<Option<(usize, usize, usize, String, String)>> {
+        let py = slf.py();
+        let stream = &mut *slf;
+        py.allow_threads(|| {
+            let next = match &mut stream.source {
+                ChunkSource::Lines(chunks) => chunks.next(),
+                ChunkSource::Bounded(chunks) => chunks.next(),
+            };
+            match next {
+                Some(Ok(((chunk_number, start, end), buf))) => {
+                    if let Some(hasher) = stream.hasher.as_mut() {
+                        hasher.update(&buf);
+                    }
+                    let fingerprint = format!("{:x}", Sha256::digest(&buf));
+                    Ok(Some((chunk_number, start, end, chunker::decode(buf), fingerprint)))
+                }
+                Some(Err(e)) => Err(PyIOError::new_err(format!("Failed to read file: {}", e))),
+                None => {
+                    if let Some(hasher) = stream.hasher.take() {
+                        stream.sha256 = Some(hasher.finalize_hex());
+                    }
+                    Ok(None)
+                }
+            }
+        })
     }
 
-    if !buffer.is_empty() {
-        let chunk_content = String::from_utf8_lossy(&buffer).to_string();
-        chunks.push((chunk_number, chunk_content));
+    /// SHA-256 of everything streamed, once the stream is exhausted.
+    #[getter]
+    fn sha256(&self) -> Option<String> {
+        self.sha256.clone()
     }
+}
+
+/// Streams line-aligned chunks: at content-defined boundaries averaging
+/// `chunk_size` bytes when `content_defined` is set, otherwise the chunks at
+/// `chunk_bounds` found by `process_file`, or chunks of at most `chunk_size`.
+#[pyfunction]
+fn iter_file_chunks(
+    file_path: &str,
+    chunk_size: usize,
+    chunk_bounds: Option<Vec<ChunkBounds>>,
+    content_defined: bool
+) -> PyResult<ChunkStream> {
+    let reader: ChunkReader = Box::new(BufReader::new(open_file(file_path)?));
+    Ok(ChunkStream::new(chunk_source(reader, chunk_size, chunk_bounds, content_defined)))
+}
 
-    Ok(chunks)
+/// `iter_file_chunks` over content held in memory. The stream owns a copy of
+/// the content, taken with the GIL released, so callers should create it off
+/// the event loop. Only inline scraps, at most `collector.inline_max_size`
+/// bytes, are chunked from memory, and the copy spares the stream from
+/// holding on to the Python object between calls.
+#[pyfunction]
+fn iter_bytes_chunks(
+    py: Python,
+    content: &[u8],
+    chunk_size: usize,
+    chunk_bounds: Option<Vec<ChunkBounds>>,
+    content_defined: bool
+) -> PyResult<ChunkStream> {
+    let content = py.allow_threads(|| content.to_vec());
+    let reader: ChunkReader = Box::new(Cursor::new(content));
+    Ok(ChunkStream::new(chunk_source(reader, chunk_size, chunk_bounds, content_defined)))
+}
+
+#[pyfunction]
+fn split_file_into_chunks(py: Python, file_path: &str, chunk_size: usize) -> PyResult<Vec<(usize, String)>> {
+    py.allow_threads(|| {
+        let reader = BufReader::new(open_file(file_path)?);
+        LineChunks::new(reader, chunk_size)
+            .map(|chunk| {
+                chunk
+                    .map(|((chunk_number, _, _), buf)| (chunk_number, chunker::decode(buf)))
+                    .map_err(|e| PyIOError::new_err(format!("Failed to read file: {}", e)))
+            })
+            .collect()
+    })
 }
 
 #[pymodule]
 fn rust_bindings(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(calculate_file_hash, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_content_hash, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_file_fingerprint, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_bytes_hash, m)?)?;
+    m.add_function(wrap_pyfunction!(calculate_bytes_fingerprint, m)?)?;
     m.add_function(wrap_pyfunction!(process_scrap_in_rust, m)?)?;
     m.add_function(wrap_pyfunction!(scan_file_for_patterns, m)?)?;
     m.add_function(wrap_pyfunction!(split_file_into_chunks, m)?)?;
+    m.add_function(wrap_pyfunction!(iter_file_chunks, m)?)?;
+    m.add_function(wrap_pyfunction!(iter_bytes_chunks, m)?)?;
+    m.add_class::<PatternEngine>()?;
+    m.add_class::<ScanResult>()?;
+    m.add_class::<MatchStream>()?;
+    m.add_class::<ChunkStream>()?;
     Ok(())
 }
@@ -0,0 +1,606 @@
+use memchr::memchr;
+use std::io::{self, BufRead};
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::Mutex;
+use std::thread;
+
+use crate::chunker::{ChunkBoundaries, ChunkBounds};
+use crate::engine::{Engine, Matches, ScanState};
+use crate::hasher::{digest_hex, ContentHasher, HashAlgorithm};
+
+const HASH_BLOCK_SIZE: usize = 4 * 1024 * 1024;
+const RANGES_PER_WORKER: usize = 4;
+
+/// Stop conditions of a classification scan. Zero disables a condition.
+#[derive(Clone, Copy)]
+pub struct ClassifyLimits {
+    pub confidence: u64,
+    pub match_budget: u64,
+}
+
+pub struct Classification {
+    pub matches: Matches,
+    pub bytes_scanned: usize,
+    pub complete: bool,
+}
+
+/// Class scores shared by all workers of one classification scan. Whichever
+/// worker pushes a score over a limit stops the others.
+struct SharedScores {
+    limits: ClassifyLimits,
+    scores: Vec<AtomicU64>,
+    total: AtomicU64,
+    stop: AtomicBool,
+}
+
+impl SharedScores {
+    fn new(classes: usize, limits: ClassifyLimits) -> SharedScores {
+        SharedScores {
+            limits,
+            scores: (0..classes).map(|_| AtomicU64::new(0)).collect(),
+            total: AtomicU64::new(0),
+            stop: AtomicBool::new(false),
+        }
+    }
+
+    fn add(&self, class_id: usize, delta: u64) {
+        let score = self.scores[class_id].fetch_add(delta, Ordering::Relaxed) + delta;
+        let total = self.total.fetch_add(delta, Ordering::Relaxed) + delta;
+
+        let confident = self.limits.confidence > 0 && score >= self.limits.confidence;
+        let exhausted = self.limits.match_budget > 0 && total >= self.limits.match_budget;
+        if confident || exhausted {
+            self.stop.store(true, Ordering::Relaxed);
+        }
+    }
+
+    fn stopped(&self) -> bool {
+        self.stop.load(Ordering::Relaxed)
+    }
+}
+
+pub struct FileScan {
+    pub hash: String,
+    pub matches: Matches,
+    pub chunks: Vec<ChunkBounds>,
+}
+
+/// Iterates over `(line, end_offset)` pairs of a buffer without copying. The
+/// line has its ending stripped, the offset points just past the newline.
+pub struct Lines<'a> {
+    buffer: &'a [u8],
+    position: usize,
+}
+
+impl<'a> Lines<'a> {
+    pub fn new(buffer: &'a [u8]) -> Lines<'a> {
+        Lines { buffer, position: 0 }
+    }
+}
+
+impl<'a> Iterator for Lines<'a> {
+    type Item = (&'a [u8], usize);
+
+    fn next(&mut self) -> Option<Self::Item> {
+        if self.position >= self.buffer.len() {
+            return None;
+        }
+
+        let start = self.position;
+        let end = match memchr(b'\n', &self.buffer[start..]) {
+            Some(index) => start + index + 1,
+            None => self.buffer.len(),
+        };
+        self.position = end;
+
+        Some((trim_line_ending(&self.buffer[start..end]), end))
+    }
+}
+
+pub fn trim_line_ending(line: &[u8]) -> &[u8] {
+    let line = line.strip_suffix(b"\n").unwrap_or(line);
+    line.strip_suffix(b"\r").unwrap_or(line)
+}
+
+pub fn scan_buffer(engine: &Engine, buffer: &[u8], max_samples: usize) -> Matches {
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    for (line, _) in Lines::new(buffer) {
+        engine.scan_line(line, &mut state, &mut matches);
+    }
+    engine.record(&mut state);
+    matches
+}
+
+/// Scans lines from `offset` until at least `batch_size` matches have been
+/// collected or the buffer ends, and returns the offset to resume from.
+pub fn scan_batch(
+    engine: &Engine,
+    buffer: &[u8],
+    offset: usize,
+    state: &mut ScanState,
+    matches: &mut Matches,
+    batch_size: usize
+) -> usize {
+    let mut position = offset;
+    for (line, end) in Lines::new(&buffer[offset..]) {
+        engine.scan_line(line, state, matches);
+        position = offset + end;
+        if matches.samples.len() >= batch_size {
+            break;
+        }
+    }
+    position
+}
+
+/// Splits a buffer into roughly `parts` byte ranges that start and end on line
+/// boundaries.
+pub fn split_line_ranges(buffer: &[u8], parts: usize) -> Vec<(usize, usize)> {
+    let step = buffer.len() / parts.max(1) + 1;
+    let mut ranges = Vec::with_capacity(parts);
+    let mut start = 0;
+
+    while start < buffer.len() {
+        let target = (start + step).min(buffer.len());
+        let end = match memchr(b'\n', &buffer[target..]) {
+            Some(index) => target + index + 1,
+            None => buffer.len(),
+        };
+        ranges.push((start, end));
+        start = end;
+    }
+
+    ranges
+}
+
+/// Runs `work` over line-aligned ranges of `buffer` on `workers` threads and
+/// returns the results in file order. Ranges are handed out from a shared
+/// counter, so one slow range does not leave the other workers idle.
+pub fn map_line_ranges<T, F>(buffer: &[u8], workers: usize, work: F) -> Vec<T>
+where
+    T: Send,
+    F: Fn(&[u8]) -> T + Sync,
+{
+    let ranges = split_line_ranges(buffer, workers * RANGES_PER_WORKER);
+    let next_range = AtomicUsize::new(0);
+    let results: Mutex<Vec<(usize, T)>> = Mutex::new(Vec::with_capacity(ranges.len()));
+
+    thread::scope(|scope| {
+        for _ in 0..workers.min(ranges.len()) {
+            scope.spawn(|| loop {
+                let index = next_range.fetch_add(1, Ordering::Relaxed);
+                let Some(&(start, end)) = ranges.get(index) else {
+                    break;
+                };
+                let result = work(&buffer[start..end]);
+                results.lock().unwrap().push((index, result));
+            });
+        }
+    });
+
+    let mut results = results.into_inner().unwrap();
+    results.sort_unstable_by_key(|(index, _)| *index);
+    results.into_iter().map(|(_, result)| result).collect()
+}
+
+pub fn scan_buffer_parallel(engine: &Engine, buffer: &[u8], workers: usize, max_samples: usize) -> Matches {
+    let mut matches = engine.matches(max_samples);
+    for range_matches in map_line_ranges(buffer, workers, |range| scan_buffer(engine, range, max_samples)) {
+        matches.merge(range_matches);
+    }
+    matches
+}
+
+fn publish_scores(shared: &SharedScores, matches: &Matches, published: &mut [u64]) {
+    for (class_id, score) in matches.class_scores.iter().enumerate() {
+        if *score > published[class_id] {
+            shared.add(class_id, score - published[class_id]);
+            published[class_id] = *score;
+        }
+    }
+}
+
+fn classify_range(engine: &Engine, buffer: &[u8], shared: &SharedScores, max_samples: usize) -> (Matches, usize) {
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    let mut published = vec![0; engine.class_count()];
+    let mut scanned = 0;
+
+    for (line, end) in Lines::new(buffer) {
+        if shared.stopped() {
+            break;
+        }
+        let before = matches.total;
+        engine.scan_line(line, &mut state, &mut matches);
+        scanned = end;
+        if matches.total > before {
+            publish_scores(shared, &matches, &mut published);
+        }
+    }
+
+    engine.record(&mut state);
+    (matches, scanned)
+}
+
+/// Scans until one class reaches the confidence threshold or the match budget
+/// is spent, and reports how much of the buffer that took.
+pub fn classify_buffer(
+    engine: &Engine,
+    buffer: &[u8],
+    limits: ClassifyLimits,
+    workers: usize,
+    max_samples: usize
+) -> Classification {
+    let shared = SharedScores::new(engine.class_count(), limits);
+
+    if workers <= 1 {
+        let (matches, bytes_scanned) = classify_range(engine, buffer, &shared, max_samples);
+        let complete = bytes_scanned == buffer.len();
+        return Classification { matches, bytes_scanned, complete };
+    }
+
+    let mut matches = engine.matches(max_samples);
+    let mut bytes_scanned = 0;
+    for (range_matches, scanned) in map_line_ranges(buffer, workers, |range| classify_range(engine, range, &shared, max_samples)) {
+        matches.merge(range_matches);
+        bytes_scanned += scanned;
+    }
+
+    Classification { matches, bytes_scanned, complete: bytes_scanned == buffer.len() }
+}
+
+pub fn classify_reader<R: BufRead>(
+    engine: &Engine,
+    mut reader: R,
+    limits: ClassifyLimits,
+    max_samples: usize
+) -> io::Result<Classification> {
+    let shared = SharedScores::new(engine.class_count(), limits);
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    let mut published = vec![0; engine.class_count()];
+    let mut line = Vec::new();
+    let mut bytes_scanned = 0;
+    let mut complete = true;
+
+    loop {
+        if shared.stopped() {
+            complete = reader.fill_buf()?.is_empty();
+            break;
+        }
+        line.clear();
+        let n = reader.read_until(b'\n', &mut line)?;
+        if n == 0 {
+            break;
+        }
+        bytes_scanned += n;
+
+        let before = matches.total;
+        engine.scan_line(trim_line_ending(&line), &mut state, &mut matches);
+        if matches.total > before {
+            publish_scores(&shared, &matches, &mut published);
+        }
+    }
+
+    engine.record(&mut state);
+    Ok(Classification { matches, bytes_scanned, complete })
+}
+
+pub fn scan_reader<R: BufRead>(engine: &Engine, mut reader: R, max_samples: usize) -> io::Result<Matches> {
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    let mut line = Vec::new();
+
+    while reader.read_until(b'\n', &mut line)? > 0 {
+        engine.scan_line(trim_line_ending(&line), &mut state, &mut matches);
+        line.clear();
+    }
+
+    engine.record(&mut state);
+    Ok(matches)
+}
+
+/// Reader counterpart of `scan_batch`. Returns true once the reader is exhausted.
+pub fn scan_reader_batch<R: BufRead>(
+    engine: &Engine,
+    reader: &mut R,
+    state: &mut ScanState,
+    matches: &mut Matches,
+    batch_size: usize
+) -> io::Result<bool> {
+    let mut line = Vec::new();
+
+    while matches.samples.len() < batch_size {
+        line.clear();
+        if reader.read_until(b'\n', &mut line)? == 0 {
+            return Ok(true);
+        }
+        engine.scan_line(trim_line_ending(&line), state, matches);
+    }
+
+    Ok(false)
+}
+
+/// Hands out the matches of one scan in batches of exactly `batch_size`, the
+/// last one possibly smaller. `scan` resumes the scan for about as many
+/// matches as are still missing and returns true once the input is
+/// exhausted; matches beyond a batch, from a line that matched several
+/// patterns, are held back for the next one.
+pub struct MatchBatches {
+    state: ScanState,
+    pending: Vec<(String, String)>,
+    batch_size: usize,
+    done: bool,
+}
+
+impl MatchBatches {
+    pub fn new(engine: &Engine, batch_size: usize) -> MatchBatches {
+        MatchBatches { state: engine.state(), pending: Vec::new(), batch_size: batch_size.max(1), done: false }
+    }
+
+    pub fn next_batch<F>(&mut self, engine: &Engine, mut scan: F) -> io::Result<Option<Vec<(String, String)>>>
+    where
+        F: FnMut(&mut ScanState, &mut Matches, usize) -> io::Result<bool>,
+    {
+        while self.pending.len() < self.batch_size && !self.done {
+            let mut matches = engine.matches(usize::MAX);
+            let result = scan(&mut self.state, &mut matches, self.batch_size - self.pending.len());
+            engine.record(&mut self.state);
+            self.done = result?;
+            self.pending.extend(matches.samples);
+        }
+
+        if self.pending.is_empty() {
+            return Ok(None);
+        }
+        let rest = self.pending.split_off(self.batch_size.min(self.pending.len()));
+        Ok(Some(std::mem::replace(&mut self.pending, rest)))
+    }
+}
+
+pub fn process_buffer(
+    engine: &Engine,
+    buffer: &[u8],
+    chunk_size: usize,
+    algorithm: HashAlgorithm,
+    max_samples: usize
+) -> FileScan {
+    let mut hasher = ContentHasher::new(algorithm);
+    let mut boundaries = ChunkBoundaries::new(chunk_size);
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    let mut hashed = 0;
+    let mut line_start = 0;
+
+    for (line, end) in Lines::new(buffer) {
+        engine.scan_line(line, &mut state, &mut matches);
+        boundaries.line(&buffer[line_start..end]);
+        line_start = end;
+
+        // Hash in blocks right behind the scan, while the pages are still hot.
+        if end - hashed >= HASH_BLOCK_SIZE {
+            hasher.update(&buffer[hashed..end]);
+            hashed = end;
+        }
+    }
+    hasher.update(&buffer[hashed..]);
+    engine.record(&mut state);
+
+    FileScan {
+        hash: hasher.finalize_hex(),
+        matches,
+        chunks: boundaries.finish(),
+    }
+}
+
+pub fn process_buffer_parallel(
+    engine: &Engine,
+    buffer: &[u8],
+    chunk_size: usize,
+    algorithm: HashAlgorithm,
+    workers: usize,
+    max_samples: usize
+) -> FileScan {
+    thread::scope(|scope| {
+        // One thread hashes and finds the chunk boundaries while the workers
+        // scan. SHA-256 is sequential; BLAKE3 fans out over the rayon pool.
+        let digest = scope.spawn(|| {
+            let mut boundaries = ChunkBoundaries::new(chunk_size);
+            let mut line_start = 0;
+            for (_, end) in Lines::new(buffer) {
+                boundaries.line(&buffer[line_start..end]);
+                line_start = end;
+            }
+            let hash = digest_hex(algorithm, buffer);
+            (hash, boundaries.finish())
+        });
+
+        let matches = scan_buffer_parallel(engine, buffer, workers, max_samples);
+        let (hash, chunks) = digest.join().unwrap();
+
+        FileScan { hash, matches, chunks }
+    })
+}
+
+pub fn process_reader<R: BufRead>(
+    engine: &Engine,
+    mut reader: R,
+    chunk_size: usize,
+    algorithm: HashAlgorithm,
+    max_samples: usize
+) -> io::Result<FileScan> {
+    let mut hasher = ContentHasher::new(algorithm);
+    let mut boundaries = ChunkBoundaries::new(chunk_size);
+    let mut state = engine.state();
+    let mut matches = engine.matches(max_samples);
+    let mut line = Vec::new();
+
+    loop {
+        line.clear();
+        let n = reader.read_until(b'\n', &mut line)?;
+        if n == 0 {
+            break;
+        }
+        hasher.update(&line);
+
+        engine.scan_line(trim_line_ending(&line), &mut state, &mut matches);
+        boundaries.line(&line);
+    }
+    engine.record(&mut state);
+
+    Ok(FileScan {
+        hash: hasher.finalize_hex(),
+        matches,
+        chunks: boundaries.finish(),
+    })
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::engine::PatternSpec;
+
+    fn engine() -> Engine {
+        let specs = [
+            (r"(?P<username>[a-z0-9.]+@[a-z0-9.]+\.[a-z]{2,}):(?P<password>\S+)", "CREDENTIAL"),
+            (r"AKIA[0-9A-Z]{16}", "AWS"),
+        ];
+        Engine::new(&specs.map(|(pattern, class)| PatternSpec::new(pattern.into(), class.into()))).unwrap()
+    }
+
+    // Matches spread unevenly over many lines, with invalid UTF-8 in between
+    // and no newline at the end.
+    fn buffer() -> Vec<u8> {
+        let mut buffer = Vec::new();
+        for i in 0..20_000 {
+            if i % 7 == 0 {
+                buffer.extend_from_slice(format!("user{}@example.com:pass{}\n", i, i).as_bytes());
+            } else if i % 501 == 0 {
+                buffer.extend_from_slice(format!("key AKIA{:016}\n", i).as_bytes());
+            } else {
+                buffer.extend_from_slice(b"filler line \xff\xfe here\n");
+            }
+        }
+        buffer.extend_from_slice(b"last@example.org:final");
+        buffer
+    }
+
+    #[test]
+    fn line_ranges_cover_the_buffer_on_line_boundaries() {
+        let buffer = buffer();
+        for parts in [1, 2, 7, 64, 100_000] {
+            let ranges = split_line_ranges(&buffer, parts);
+            assert_eq!(ranges.first().unwrap().0, 0);
+            assert_eq!(ranges.last().unwrap().1, buffer.len());
+            for window in ranges.windows(2) {
+                assert_eq!(window[0].1, window[1].0);
+                assert_eq!(buffer[window[0].1 - 1], b'\n');
+            }
+        }
+        assert!(split_line_ranges(b"", 4).is_empty());
+    }
+
+    #[test]
+    fn ranges_are_mapped_back_in_file_order() {
+        let buffer = buffer();
+        let starts = map_line_ranges(&buffer, 8, |range| range.as_ptr() as usize - buffer.as_ptr() as usize);
+        let expected: Vec<_> = split_line_ranges(&buffer, 8 * RANGES_PER_WORKER).iter().map(|range| range.0).collect();
+        assert_eq!(starts, expected);
+    }
+
+    #[test]
+    fn parallel_scan_merges_in_file_order() {
+        let engine = engine();
+        let buffer = buffer();
+        let sequential = scan_buffer(&engine, &buffer, usize::MAX);
+        assert_eq!(sequential.samples.last().unwrap().0, "last@example.org:final");
+
+        for workers in [1, 2, 3, 8, 64] {
+            let parallel = scan_buffer_parallel(&engine, &buffer, workers, usize::MAX);
+            assert_eq!(parallel.samples, sequential.samples);
+            assert_eq!(parallel.counts, sequential.counts);
+            assert_eq!(parallel.class_scores, sequential.class_scores);
+            assert_eq!(parallel.total, sequential.total);
+            assert_eq!(parallel.first, sequential.first);
+
+            // A bounded sample keeps the first matches of the file.
+            let bounded = scan_buffer_parallel(&engine, &buffer, workers, 5);
+            assert_eq!(bounded.samples[..], sequential.samples[..5]);
+            assert_eq!(bounded.total, sequential.total);
+        }
+
+        assert_eq!(scan_buffer_parallel(&engine, b"", 4, 10).total, 0);
+    }
+
+    fn batches<F>(engine: &Engine, batch_size: usize, mut scan: F) -> Vec<Vec<(String, String)>>
+    where
+        F: FnMut(&mut ScanState, &mut Matches, usize) -> io::Result<bool>,
+    {
+        let mut batches = MatchBatches::new(engine, batch_size);
+        let mut result = Vec::new();
+        while let Some(batch) = batches.next_batch(engine, &mut scan).unwrap() {
+            result.push(batch);
+        }
+        result
+    }
+
+    #[test]
+    fn match_batches_are_bounded_and_in_file_order() {
+        let engine = engine();
+        let buffer = buffer();
+        let all = scan_buffer(&engine, &buffer, usize::MAX).samples;
+
+        for batch_size in [1, 7, 1000, 100_000] {
+            let mut offset = 0;
+            let mapped = batches(&engine, batch_size, |state, matches, wanted| {
+                offset = scan_batch(&engine, &buffer, offset, state, matches, wanted);
+                Ok(offset >= buffer.len())
+            });
+            let mut reader = &buffer[..];
+            let streamed = batches(&engine, batch_size, |state, matches, wanted| {
+                scan_reader_batch(&engine, &mut reader, state, matches, wanted)
+            });
+
+            for result in [&mapped, &streamed] {
+                assert!(result.iter().all(|batch| !batch.is_empty() && batch.len() <= batch_size));
+                assert!(result[..result.len() - 1].iter().all(|batch| batch.len() == batch_size));
+                assert_eq!(result.concat(), all);
+            }
+        }
+    }
+
+    #[test]
+    fn match_batches_hold_back_matches_past_the_batch() {
+        // Every line matches both patterns, so a batch of one ends mid-line.
+        let engine = engine();
+        let buffer = b"a@b.io:AKIA0000000000000001\nc@d.io:AKIA0000000000000002";
+        let mut offset = 0;
+        let result = batches(&engine, 1, |state, matches, wanted| {
+            offset = scan_batch(&engine, buffer, offset, state, matches, wanted);
+            Ok(offset >= buffer.len())
+        });
+
+        assert_eq!(result.len(), 4);
+        assert_eq!(result.concat(), scan_buffer(&engine, buffer, usize::MAX).samples);
+        assert!(batches(&engine, 3, |_, _, _| Ok(true)).is_empty());
+    }
+
+    #[test]
+    fn parallel_process_matches_sequential() {
+        let engine = engine();
+        let buffer = buffer();
+        for algorithm in [HashAlgorithm::Sha256, HashAlgorithm::Blake3] {
+            let sequential = process_buffer(&engine, &buffer, 4096, algorithm, 10);
+            let parallel = process_buffer_parallel(&engine, &buffer, 4096, algorithm, 4, 10);
+            let streamed = process_reader(&engine, &buffer[..], 4096, algorithm, 10).unwrap();
+
+            for scan in [&parallel, &streamed] {
+                assert_eq!(scan.hash, sequential.hash);
+                assert_eq!(scan.chunks, sequential.chunks);
+                assert_eq!(scan.matches.samples, sequential.matches.samples);
+                assert_eq!(scan.matches.total, sequential.matches.total);
+            }
+            assert_eq!(sequential.chunks.last().unwrap().2, buffer.len());
+        }
+    }
+}
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+
+class LatencyStats:
+    # Latency and error samples of one dependency, drained by the limiter at
+    # every adjustment. Only the most recent max_samples latencies are kept.
+    def __init__(self, max_samples: int = 1000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds: float, error: bool = False):
+        self.samples.append(seconds)
+        self.count += 1
+        if error:
+            self.errors += 1
+
+    def drain(self):
+        samples = sorted(self.samples)
+        count, errors = self.count, self.errors
+        self.samples.clear()
+        self.count = 0
+        self.errors = 0
+
+        p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))] if samples else None
+        return count, errors, p90
+
+
+class AdaptiveLimiter:
+    # Bounds in-flight work with a limit that follows the health of the
+    # dependencies behind it (AIMD). Every interval the samples of each
+    # signal are drained: an error rate or p90 latency over its target cuts
+    # the limit by the decrease factor, while a window that stayed within
+    # every target and actually reached the limit raises it by increase.
+    # Signals with too few samples in a window do not vote. Work already
+    # admitted finishes when the limit drops; new work waits until in-flight
+    # falls below it.
+    def __init__(self, name: str, config, signals: dict):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.signals = signals
+        self.min_limit = max(1, config.get('min_limit', 4))
+        self.max_limit = max(self.min_limit, config.get('max_limit', 100))
+        self.limit = float(min(self.max_limit, max(self.min_limit, config.get('initial_limit', 20))))
+        self.interval = config.get('interval', 5)
+        self.increase = config.get('increase', 2)
+        self.decrease = config.get('decrease', 0.7)
+        self.error_rate = config.get('error_rate', 0.05)
+        self.min_samples = config.get('min_samples', 5)
+        self.latency_targets = config.get('latency_targets', {})
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.condition = asyncio.Condition()
+        self.changes = deque(maxlen=config.get('history', 20))
+        self.metrics = {"increases": 0, "decreases": 0}
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.adjust()
+
+    async def adjust(self):
+        overloaded = []
+        for signal, stats in self.signals.items():
+            count, errors, p90 = stats.drain()
+            if count < self.min_samples:
+                continue
+
+            target = self.latency_targets.get(signal)
+            if errors / count > self.error_rate:
+                overloaded.append(f"{signal} error rate {errors / count:.1%} over {self.error_rate:.1%}")
+            elif target and p90 > target:
+                overloaded.append(f"{signal} p90 latency {p90 * 1000:.0f}ms over {target * 1000:.0f}ms")
+
+        saturated = self.peak_in_flight >= self.current_limit
+        self.peak_in_flight = self.in_flight
+
+        if overloaded:
+            await self._set_limit(self.limit * self.decrease, "; ".join(overloaded))
+        elif saturated:
+            await self._set_limit(self.limit + self.increase, "latency and errors within targets at the limit")
+
+    def get_metrics(self):
+        last_change = self.changes[-1] if self.changes else None
+        return {
+            **self.metrics,
+            "limit": self.current_limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "last_reason": last_change["reason"] if last_change else None,
+            "changes": list(self.changes),
+        }
+
+    async def _set_limit(self, limit: float, reason: str):
+        limit = min(self.max_limit, max(self.min_limit, limit))
+        previous = self.current_limit
+        self.limit = limit
+        if self.current_limit == previous:
+            return
+
+        self.metrics["increases" if self.current_limit > previous else "decreases"] += 1
+        self.changes.append({"time": time.time(), "from": previous, "to": self.current_limit, "reason": reason})
+        self.logger.info(f"{self.name} concurrency limit {previous} -> {self.current_limit}: {reason}")
+
+        async with self.condition:
+            self.condition.notify_all()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+
+from elasticsearch import ApiError, AsyncElasticsearch, TransportError
+from core.services.adaptive_limiter import LatencyStats
+
+
+class BulkIndexError(Exception):
+    pass
+
+
+class BulkIndexer:
+    RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        client: AsyncElasticsearch,
+        index: str,
+        max_docs: int = 500,
+        max_bytes: int = 10_000_000,
+        concurrency: int = 4,
+        max_retries: int = 3,
+        flush_interval: float = 1.0,
+        retry_backoff: float = 0.5
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.index = index
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.flush_interval = flush_interval
+        self.retry_backoff = retry_backoff
+
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = []
+        self.pending_bytes = 0
+        self.flush_handle = None
+        self.flush_tasks = set()
+        self.latency = LatencyStats()
+
+    async def index_document(self, document: dict) -> str:
+        future = asyncio.get_running_loop().create_future()
+        self.add(document, future)
+        return await future
+
+    async def index_documents(self, documents) -> list:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for document in documents:
+            future = loop.create_future()
+            self.add(document, future)
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    def add(self, document: dict, future: asyncio.Future):
+        self.pending.append((document, future))
+        self.pending_bytes += self._document_size(document)
+
+        if len(self.pending) >= self.max_docs or self.pending_bytes >= self.max_bytes:
+            self.flush_nowait()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush_nowait)
+
+    async def flush(self):
+        self.flush_nowait()
+        if self.flush_tasks:
+            await asyncio.gather(*self.flush_tasks, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        await self.client.close()
+
+    def flush_nowait(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        if not self.pending:
+            return
+
+        batch = self.pending
+        self.pending = []
+        self.pending_bytes = 0
+
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def _send(self, batch):
+        async with self.semaphore:
+            attempt = 0
+            while batch:
+                try:
+                    batch = await self._send_once(batch, attempt)
+                except (ApiError, TransportError) as e:
+                    if not self._is_retryable(e) or attempt >= self.max_retries:
+                        self.logger.error(f"Bulk request of {len(batch)} documents to {self.index} failed: {e}")
+                        self._fail(batch, e)
+                        return
+                    self.logger.warning(f"Bulk request to {self.index} failed, retrying {len(batch)} documents: {e}")
+                except Exception as e:
+                    self.logger.error(f"Bulk request of {len(batch)} documents to {self.index} failed: {e}")
+                    self._fail(batch, e)
+                    return
+
+                if batch:
+                    attempt += 1
+                    await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    async def _send_once(self, batch, attempt):
+        operations = []
+        for document, _ in batch:
+            operations.append({"index": {"_index": self.index}})
+            operations.append(document)
+
+        # Failed requests and documents rejected with a retryable status are
+        # both reported as errors, as either means the cluster is pushing back.
+        started = time.perf_counter()
+        try:
+            response = await self.client.bulk(operations=operations)
+        except Exception:
+            self.latency.record(time.perf_counter() - started, error=True)
+            raise
+
+        retry = []
+        for (document, future), item in zip(batch, response['items']):
+            result = item['index']
+            status = result.get('status', 500)
+
+            if status < 300:
+                if not future.done():
+                    future.set_result(result['_id'])
+            elif status in self.RETRYABLE_STATUSES and attempt < self.max_retries:
+                retry.append((document, future))
+            elif not future.done():
+                future.set_exception(BulkIndexError(f"Indexing into {self.index} failed with status {status}: {result.get('error')}"))
+
+        self.latency.record(time.perf_counter() - started, error=bool(retry))
+        if retry:
+            self.logger.warning(f"Retrying {len(retry)} of {len(batch)} documents rejected by {self.index}.")
+
+        return retry
+
+    def _is_retryable(self, error) -> bool:
+        if isinstance(error, ApiError):
+            return error.meta.status in self.RETRYABLE_STATUSES
+        return True
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(BulkIndexError(f"Bulk request to {self.index} failed: {error}"))
+
+    def _document_size(self, document: dict) -> int:
+        return sum(len(value) if isinstance(value, str) else 16 for value in document.values())
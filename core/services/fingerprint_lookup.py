@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+from core.repositories.postgres_repository import PostgresRepository
+
+
+class FingerprintLookup:
+    # Coalesces the fingerprint lookups of every chunk in flight, across all
+    # scraps of the worker, into one query per batch. Only fingerprints wait
+    # here; a lookup is sent once max_batch fingerprints are queued or
+    # max_wait seconds after the first one. Resolves to the elastic ID of the
+    # indexed chunk, or None.
+    def __init__(self, repository: PostgresRepository, max_batch: int = 1000, max_wait: float = 0.005):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+
+        self.pending = {}
+        self.flush_handle = None
+        self.flush_tasks = set()
+        self.metrics = {"lookups": 0, "queries": 0}
+
+    async def find(self, fingerprint: str):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(fingerprint, []).append(future)
+        self.metrics["lookups"] += 1
+
+        if len(self.pending) >= self.max_batch:
+            self.flush_nowait()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self.flush_nowait)
+        return await future
+
+    def flush_nowait(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        if not self.pending:
+            return
+
+        batch = self.pending
+        self.pending = {}
+
+        task = asyncio.get_running_loop().create_task(self._lookup(batch))
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def _lookup(self, batch):
+        self.metrics["queries"] += 1
+        try:
+            found = await self.repository.find_elastic_ids_by_fingerprints(list(batch))
+        except Exception as e:
+            self.logger.error(f"Failed to look up {len(batch)} chunk fingerprints: {e}")
+            found = {}
+
+        for fingerprint, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(fingerprint))
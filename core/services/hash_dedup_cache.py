@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from core.repositories.postgres_repository import PostgresRepository
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: bytearray = None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    @staticmethod
+    def size_for(capacity: int, error_rate: float):
+        num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return num_bits, num_hashes
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def _positions(self, value: str):
+        # Both base hashes come from one digest of the value, so positions do
+        # not depend on how uniform the value itself is.
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        second |= 1
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
+
+
+class HashDedupCache:
+    SNAPSHOT_MAGIC = b'BRDD'
+    SNAPSHOT_VERSION = 3
+    SNAPSHOT_HEADER = struct.Struct('>4sBQIQd16s?')
+
+    def __init__(self, repository: PostgresRepository, config, hashing_config=None):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.enabled = config.get('enabled', True)
+        self.capacity = config.get('capacity', 10_000_000)
+        self.error_rate = config.get('error_rate', 0.001)
+        self.lru_size = config.get('lru_size', 100_000)
+        self.refresh_interval = config.get('refresh_interval', 30)
+        self.snapshot_path = config.get('snapshot_path')
+        self.snapshot_interval = config.get('snapshot_interval', 300)
+
+        # Only hashes of the configured algorithm are loaded. Prefix
+        # fingerprints go into a second filter of the same size: a fingerprint
+        # that is not in it rules the content out before the hash is checked.
+        hashing_config = hashing_config or {}
+        self.hash_algorithm = hashing_config.get('algorithm', 'sha256')
+        self.use_fingerprints = hashing_config.get('prefix_fingerprint', False)
+
+        self.bloom = None
+        self.fingerprints = None
+        self.confirmed = OrderedDict()
+        self.watermark = None
+        self.refreshed_at = 0.0
+        self.snapshot_at = 0.0
+        self.refresh_lock = asyncio.Lock()
+        self.metrics = {
+            "lookups": 0,
+            "lru_hits": 0,
+            "bloom_negatives": 0,
+            "fingerprint_negatives": 0,
+            "database_checks": 0,
+            "false_positives": 0,
+        }
+
+    async def warm(self):
+        if not self.enabled:
+            return
+
+        try:
+            if not await asyncio.to_thread(self._load_snapshot):
+                self.bloom = BloomFilter(*BloomFilter.size_for(self.capacity, self.error_rate))
+                self.fingerprints = self._new_fingerprint_filter()
+                self.watermark = None
+
+            async with self.refresh_lock:
+                added = await self._refresh()
+            self.logger.info(
+                f"Dedup cache warmed with {self.bloom.count} hashes ({added} loaded from Postgres)."
+            )
+            await self._save_snapshot_if_due(force=added > 0)
+        except Exception as e:
+            self.bloom = None
+            self.fingerprints = None
+            self.logger.error(f"Failed to warm dedup cache, falling back to Postgres lookups: {e}")
+
+    async def is_processed(self, file_hash: str, prefix_fingerprint: str = None) -> bool:
+        if not file_hash:
+            return False
+
+        if self.bloom is None:
+            return await self.repository.is_hash_processed(file_hash, self.hash_algorithm)
+
+        self.metrics["lookups"] += 1
+        await self._refresh_if_due()
+
+        if prefix_fingerprint and self.fingerprints is not None and prefix_fingerprint not in self.fingerprints:
+            self.metrics["fingerprint_negatives"] += 1
+            return False
+
+        if file_hash in self.confirmed:
+            self.confirmed.move_to_end(file_hash)
+            self.metrics["lru_hits"] += 1
+            return True
+
+        if file_hash not in self.bloom:
+            self.metrics["bloom_negatives"] += 1
+            return False
+
+        self.metrics["database_checks"] += 1
+        exists = await self.repository.is_hash_processed(file_hash, self.hash_algorithm)
+        if exists:
+            self._confirm(file_hash)
+        else:
+            self.metrics["false_positives"] += 1
+        return exists
+
+    async def is_new(self, prefix_fingerprint: str) -> bool:
+        # True only when the fingerprint filter proves the content was never
+        # processed, which is decided before the content is hashed.
+        if self.bloom is None or self.fingerprints is None or not prefix_fingerprint:
+            return False
+
+        await self._refresh_if_due()
+        if self.fingerprints is None or prefix_fingerprint in self.fingerprints:
+            return False
+        self.metrics["fingerprint_negatives"] += 1
+        return True
+
+    def add(self, file_hash: str, prefix_fingerprint: str = None):
+        if self.bloom is None or not file_hash:
+            return
+        self.bloom.add(file_hash)
+        self._add_fingerprint(prefix_fingerprint)
+        self._confirm(file_hash)
+
+    def get_metrics(self):
+        return {
+            **self.metrics,
+            "hashes": self.bloom.count if self.bloom else 0,
+            "confirmed": len(self.confirmed),
+        }
+
+    def _new_fingerprint_filter(self):
+        if not self.use_fingerprints:
+            return None
+        return BloomFilter(*BloomFilter.size_for(self.capacity, self.error_rate))
+
+    def _add_fingerprint(self, prefix_fingerprint: str):
+        if self.fingerprints is None:
+            return
+        if prefix_fingerprint:
+            self.fingerprints.add(prefix_fingerprint)
+            return
+        # A processed hash without a fingerprint would read as certainly new,
+        # so the filter is switched off instead.
+        self.logger.warning("Processed hash without a prefix fingerprint, disabling fingerprint checks.")
+        self.fingerprints = None
+
+    def _confirm(self, file_hash: str):
+        self.confirmed[file_hash] = True
+        self.confirmed.move_to_end(file_hash)
+        while len(self.confirmed) > self.lru_size:
+            self.confirmed.popitem(last=False)
+
+    async def _refresh_if_due(self):
+        # Other workers mark hashes as processed too; a bloom miss is only as
+        # fresh as the last refresh.
+        if time.monotonic() - self.refreshed_at < self.refresh_interval or self.refresh_lock.locked():
+            return
+
+        async with self.refresh_lock:
+            try:
+                await self._refresh()
+            except Exception as e:
+                self.logger.error(f"Failed to refresh dedup cache: {e}")
+                self.refreshed_at = time.monotonic()
+                return
+        await self._save_snapshot_if_due()
+
+    async def _refresh(self):
+        # Rows committed shortly after a newer processed_at was read are picked
+        # up by re-reading a small overlap; adding a hash twice is harmless.
+        since = self.watermark - timedelta(seconds=60) if self.watermark else None
+        added = 0
+        async for file_hash, prefix_fingerprint, processed_at in self.repository.iter_processed_hashes(since, self.hash_algorithm):
+            self.bloom.add(file_hash)
+            self._add_fingerprint(prefix_fingerprint)
+            added += 1
+            if processed_at and (self.watermark is None or processed_at > self.watermark):
+                self.watermark = processed_at
+        self.refreshed_at = time.monotonic()
+        return added
+
+    async def _save_snapshot_if_due(self, force=False):
+        if not self.snapshot_path or self.bloom is None:
+            return
+        if not force and time.monotonic() - self.snapshot_at < self.snapshot_interval:
+            return
+
+        self.snapshot_at = time.monotonic()
+        try:
+            fingerprint_bits = bytes(self.fingerprints.bits) if self.fingerprints is not None else b''
+            await asyncio.to_thread(
+                self._save_snapshot,
+                bytes(self.bloom.bits),
+                fingerprint_bits,
+                self.bloom.count,
+                self.watermark
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to save dedup snapshot to {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self, bits: bytes, fingerprint_bits: bytes, count: int, watermark):
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        header = self.SNAPSHOT_HEADER.pack(
+            self.SNAPSHOT_MAGIC,
+            self.SNAPSHOT_VERSION,
+            self.bloom.num_bits,
+            self.bloom.num_hashes,
+            count,
+            watermark.timestamp() if watermark else 0.0,
+            self.hash_algorithm.encode(),
+            bool(fingerprint_bits)
+        )
+        # Every worker process saves snapshots, so each writes its own
+        # temporary file and the last rename wins.
+        temporary_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(header)
+            file.write(bits)
+            file.write(fingerprint_bits)
+        os.replace(temporary_path, self.snapshot_path)
+        self.logger.info(f"Saved dedup snapshot with {count} hashes to {self.snapshot_path}.")
+
+    def _load_snapshot(self) -> bool:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+
+        with open(self.snapshot_path, 'rb') as file:
+            header = file.read(self.SNAPSHOT_HEADER.size)
+            if len(header) < self.SNAPSHOT_HEADER.size:
+                self.logger.warning(f"Ignoring truncated dedup snapshot {self.snapshot_path}.")
+                return False
+
+            magic, version, num_bits, num_hashes, count, watermark, algorithm, has_fingerprints = \
+                self.SNAPSHOT_HEADER.unpack(header)
+            if magic != self.SNAPSHOT_MAGIC or version != self.SNAPSHOT_VERSION \
+                    or algorithm.rstrip(b'\0').decode() != self.hash_algorithm \
+                    or (has_fingerprints and not self.use_fingerprints) \
+                    or (num_bits, num_hashes) != BloomFilter.size_for(self.capacity, self.error_rate):
+                self.logger.warning(f"Ignoring dedup snapshot {self.snapshot_path} built with other settings.")
+                return False
+
+            size = (num_bits + 7) // 8
+            bits = bytearray(file.read())
+            if len(bits) != size * (2 if has_fingerprints else 1):
+                self.logger.warning(f"Ignoring truncated dedup snapshot {self.snapshot_path}.")
+                return False
+
+        self.bloom = BloomFilter(num_bits, num_hashes, bits[:size])
+        self.bloom.count = count
+        self.fingerprints = BloomFilter(num_bits, num_hashes, bits[size:]) if has_fingerprints else None
+        self.watermark = datetime.fromtimestamp(watermark) if watermark else None
+        self.logger.info(f"Loaded dedup snapshot with {count} hashes from {self.snapshot_path}.")
+        return True
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from rust_bindings import (
+    calculate_bytes_fingerprint,
+    calculate_bytes_hash,
+    calculate_content_hash,
+    calculate_file_fingerprint
+)
+
+
+class HashingService:
+    # The native hash releases the GIL, so files hashed on this pool run in
+    # parallel with each other and with the event loop. The pool size bounds
+    # how many files are read at once.
+    def __init__(self, workers: int = 4, config=None):
+        self.logger = logging.getLogger(__name__)
+        config = config or {}
+        self.workers = max(1, workers)
+        self.algorithm = config.get('algorithm', 'sha256')
+        self.prefix_fingerprint = config.get('prefix_fingerprint', True)
+        self.prefix_size = config.get('prefix_size', 64 * 1024)
+        self.report_sha256 = config.get('report_sha256', True)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+
+    async def hash_file(self, file_path: str) -> str:
+        return await self._run(calculate_content_hash, file_path, self.algorithm)
+
+    async def fingerprint_file(self, file_path: str):
+        # xxh3 of the first prefix_size bytes plus the file size. A fingerprint
+        # that was never processed proves the content is new.
+        if not self.prefix_fingerprint:
+            return None
+        return await self._run(calculate_file_fingerprint, file_path, self.prefix_size)
+
+    # Inline scraps arrive with their content in the message and have no file.
+    async def hash_content(self, content: bytes) -> str:
+        return await self._run(calculate_bytes_hash, content, self.algorithm)
+
+    async def fingerprint_content(self, content: bytes):
+        if not self.prefix_fingerprint:
+            return None
+        return await self._run(calculate_bytes_fingerprint, content, self.prefix_size)
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+from aiokafka import AIOKafkaProducer
+
+
+class KafkaPublisher:
+    # One producer shared by the collector and processing systems. publish()
+    # returns once the message is in the producer's batch; the broker
+    # acknowledgement is awaited in the background, so the sender is never
+    # held for a round trip. publish_max_in_flight bounds the unacknowledged
+    # messages and makes publish() wait when the broker falls behind.
+    def __init__(self, config):
+        self.logger = logging.getLogger(__name__)
+        self.producer = AIOKafkaProducer(
+            bootstrap_servers=config['bootstrap_servers'],
+            compression_type=config.get('compression_type'),
+            linger_ms=config.get('linger_ms', 5),
+            max_batch_size=config.get('max_batch_size', 65536)
+        )
+        self.semaphore = asyncio.Semaphore(config.get('publish_max_in_flight', 10000))
+
+        self.users = 0
+        self.start_lock = asyncio.Lock()
+        self.deliveries = set()
+        self.metrics = {
+            "published": 0,
+            "failed": 0,
+            "last_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "total_latency_ms": 0.0,
+        }
+
+    async def start(self):
+        async with self.start_lock:
+            if self.users == 0:
+                await self.producer.start()
+            self.users += 1
+
+    async def stop(self):
+        async with self.start_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+
+            await self.flush()
+            await self.producer.stop()
+            self.logger.info(f"Kafka publisher stopped: {self.get_metrics()}")
+
+    async def publish(self, topic: str, value: bytes, key: bytes = None, on_delivery=None):
+        # on_delivery(error) is called with None once the broker has the
+        # message, or with the exception that failed it.
+        await self.semaphore.acquire()
+        started = time.perf_counter()
+        try:
+            delivery = await self.producer.send(topic, value, key=key)
+        except Exception as e:
+            self.semaphore.release()
+            self._record_failure(topic, e, on_delivery)
+            return
+
+        self.deliveries.add(delivery)
+        delivery.add_done_callback(lambda future: self._delivered(future, topic, started, on_delivery))
+
+    async def flush(self):
+        await self.producer.flush()
+        if self.deliveries:
+            await asyncio.gather(*list(self.deliveries), return_exceptions=True)
+
+    def get_metrics(self):
+        published = self.metrics["published"]
+        return {
+            **self.metrics,
+            "in_flight": len(self.deliveries),
+            "avg_latency_ms": self.metrics["total_latency_ms"] / published if published else 0.0,
+        }
+
+    def _delivered(self, future, topic, started, on_delivery):
+        self.deliveries.discard(future)
+        self.semaphore.release()
+
+        error = future.exception() if not future.cancelled() else asyncio.CancelledError()
+        if error is not None:
+            self._record_failure(topic, error, on_delivery)
+            return
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.metrics["published"] += 1
+        self.metrics["last_latency_ms"] = latency_ms
+        self.metrics["max_latency_ms"] = max(self.metrics["max_latency_ms"], latency_ms)
+        self.metrics["total_latency_ms"] += latency_ms
+        self._notify(on_delivery, None)
+
+    def _record_failure(self, topic, error, on_delivery):
+        self.metrics["failed"] += 1
+        self.logger.error(f"Failed to publish message to {topic}: {error}")
+        self._notify(on_delivery, error)
+
+    def _notify(self, on_delivery, error):
+        if on_delivery is None:
+            return
+        try:
+            on_delivery(error)
+        except Exception as e:
+            self.logger.exception(f"Error in Kafka delivery callback: {e}")
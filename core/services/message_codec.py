@@ -0,0 +1,116 @@
+import json
+import logging
+
+import msgpack
+import zstandard as zstd
+
+from core.entities.scrap import Scrap
+
+
+class MessageDecodeError(Exception):
+    pass
+
+
+class MessageCodec:
+    # Binary messages are a 3 byte header (magic, version) followed by a
+    # msgpack map. Messages from older producers are JSON objects, and a JSON
+    # object never starts with the magic, so both are read side by side until
+    # every producer writes the binary format.
+    #
+    # JSON messages keep what consumers from before the binary format read:
+    # scrap_data holds only the fields their Scrap knows, and fields added
+    # since travel next to it in scrap_fields, which they ignore.
+    #
+    # Small scraps carry their content as a zstd compressed payload instead
+    # of upstream paths. Older consumers cannot read those, so payloads are
+    # only inlined in binary messages.
+    MAGIC = b'BR'
+    VERSION = 1
+    PAYLOAD_ENCODING = 'zstd'
+    LEGACY_SCRAP_FIELDS = (
+        'id', 'hash', 'source', 'filename', 'file_path', 'state', 'timestamp', 'occurrence_time', 'attachments'
+    )
+
+    def __init__(self, message_format: str = 'msgpack', compression_level: int = 3):
+        self.logger = logging.getLogger(__name__)
+        self.message_format = message_format
+        self.compression_level = compression_level
+
+    @property
+    def inline_payloads(self) -> bool:
+        return self.message_format != 'json'
+
+    def encode_scrap(self, scrap: Scrap, smb_paths: dict) -> bytes:
+        if scrap.content is not None:
+            if not self.inline_payloads:
+                raise ValueError("Inline payloads need the msgpack message format.")
+            return self._encode_inline_scrap(scrap)
+
+        paths = {
+            "content_path": smb_paths.get("content_path"),
+            "mounted_path": smb_paths.get("mounted_path"),
+            "unc_path": smb_paths.get("unc_path"),
+            "duplicate": smb_paths.get("duplicate", False)
+        }
+
+        if self.message_format == 'json':
+            return json.dumps({**self._legacy_scrap(scrap), **paths}).encode('utf-8')
+
+        scrap_data = {key: value for key, value in scrap.to_dict().items() if value is not None and value != []}
+        return self._pack({"scrap": scrap_data, **paths})
+
+    def decode_scrap(self, value: bytes):
+        message = self._unpack(value)
+        if "scrap_data" in message:
+            scrap_data = json.loads(message.pop("scrap_data"))
+            scrap = Scrap.from_dict({**scrap_data, **message.pop("scrap_fields", {})})
+        else:
+            scrap = Scrap.from_dict(message.pop("scrap"))
+
+        if "payload" in message:
+            scrap.content = self._decode_payload(message.pop("payload"), message.pop("payload_encoding", None))
+        return scrap, message
+
+    def _encode_inline_scrap(self, scrap: Scrap) -> bytes:
+        payload = zstd.ZstdCompressor(level=self.compression_level).compress(scrap.content)
+        scrap_data = {key: value for key, value in scrap.to_dict().items() if value is not None and value != []}
+        return self._pack({
+            "scrap": scrap_data,
+            "payload": payload,
+            "duplicate": False,
+            "payload_encoding": self.PAYLOAD_ENCODING
+        })
+
+    def _legacy_scrap(self, scrap: Scrap) -> dict:
+        scrap_dict = scrap.to_dict()
+        scrap_data = {key: scrap_dict[key] for key in self.LEGACY_SCRAP_FIELDS}
+        scrap_fields = {
+            key: value for key, value in scrap_dict.items()
+            if key not in self.LEGACY_SCRAP_FIELDS and value is not None
+        }
+        return {"scrap_data": json.dumps(scrap_data), "scrap_fields": scrap_fields}
+
+    def _decode_payload(self, payload, encoding) -> bytes:
+        if encoding != self.PAYLOAD_ENCODING:
+            raise MessageDecodeError(f"Unsupported payload encoding {encoding}")
+        return zstd.ZstdDecompressor().decompress(payload)
+
+    def encode_notification(self, notification: dict) -> bytes:
+        if self.message_format == 'json':
+            return json.dumps(notification).encode('utf-8')
+        return self._pack(notification)
+
+    def decode_notification(self, value: bytes) -> dict:
+        return self._unpack(value)
+
+    def _pack(self, message: dict) -> bytes:
+        return self.MAGIC + bytes([self.VERSION]) + msgpack.packb(message, use_bin_type=True)
+
+    def _unpack(self, value: bytes) -> dict:
+        if value[:2] != self.MAGIC:
+            return json.loads(value.decode('utf-8'))
+
+        version = value[2] if len(value) > 2 else None
+        if version != self.VERSION:
+            raise MessageDecodeError(f"Unsupported message version {version}")
+        return msgpack.unpackb(value[3:], raw=False)
@@ -0,0 +1,54 @@
+import logging
+from collections import deque
+
+
+class OffsetTracker:
+    # Offsets of one partition are read in order but finish in any order. Per
+    # partition the read offsets wait in a queue; the committable position is
+    # the first offset that has not finished yet, or one past the last offset
+    # when all have finished. A message is never committed before every
+    # earlier one of its partition has been processed.
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.in_flight = {}
+        self.completed = {}
+        self.positions = {}
+        self.committed = {}
+
+    def track(self, partition, offset: int):
+        self.in_flight.setdefault(partition, deque()).append(offset)
+        self.completed.setdefault(partition, set())
+
+    def complete(self, partition, offset: int):
+        # Completions of forgotten partitions belong to another consumer now.
+        if partition not in self.in_flight:
+            return
+
+        offsets = self.in_flight[partition]
+        completed = self.completed[partition]
+        completed.add(offset)
+
+        while offsets and offsets[0] in completed:
+            finished = offsets.popleft()
+            completed.discard(finished)
+            self.positions[partition] = offsets[0] if offsets else finished + 1
+
+    def committable(self):
+        return {
+            partition: position
+            for partition, position in self.positions.items()
+            if self.committed.get(partition) != position
+        }
+
+    def mark_committed(self, offsets):
+        self.committed.update(offsets)
+
+    def forget(self, partitions):
+        for partition in partitions:
+            self.in_flight.pop(partition, None)
+            self.completed.pop(partition, None)
+            self.positions.pop(partition, None)
+            self.committed.pop(partition, None)
+
+    def pending(self) -> int:
+        return sum(len(offsets) for offsets in self.in_flight.values())
@@ -76,23 +76,52 @@ def mount_smb_servers(smb_servers):
         except Exception as e:
             logging.error(f"Unexpected error while mounting SMB share {share}: {e}")
 
-def move_file_to_upstream_smb(filepath, filename, upstream_smb_config):
+def content_addressed_path(file_hash):
+    return os.path.join(file_hash[:2], file_hash[2:4], file_hash)
+
+def upstream_smb_paths(file_hash, upstream_smb_config):
+    smb_mount_point = upstream_smb_config.get('mount_point')
+    smb_share_path = upstream_smb_config.get('share_path') or upstream_smb_config.get('share', '').replace('/', '\\')
+
+    content_path = content_addressed_path(file_hash)
+    return {
+        "content_path": content_path.replace(os.sep, '/'),
+        "mounted_path": os.path.join(smb_mount_point, content_path),
+        "unc_path": f"{smb_share_path}\\{file_hash[:2]}\\{file_hash[2:4]}\\{file_hash}",
+    }
+
+def move_file_to_upstream_smb(filepath, file_hash, upstream_smb_config):
+    # Upstream files are stored under their content hash, so a file that is
+    # already there is never copied again and same-named files cannot collide.
     try:
-        smb_mount_point = upstream_smb_config.get('mount_point')
-        smb_share_path = upstream_smb_config.get('share_path')
+        smb_paths = upstream_smb_paths(file_hash, upstream_smb_config)
+        mounted_path = smb_paths["mounted_path"]
 
-        mounted_path = os.path.join(smb_mount_point, filename)
-        unc_path = f"{smb_share_path}\\{filename}"
+        if os.path.exists(mounted_path):
+            os.remove(filepath)
+            logging.info(f"File {filepath} is already upstream at {mounted_path}, dropped the local copy.")
+            return {**smb_paths, "duplicate": True}
 
-        os.makedirs(smb_mount_point, exist_ok=True)
-        shutil.move(filepath, mounted_path)
+        os.makedirs(os.path.dirname(mounted_path), exist_ok=True)
+        temporary_path = f"{mounted_path}.{os.getpid()}.tmp"
+        shutil.move(filepath, temporary_path)
+        os.replace(temporary_path, mounted_path)
 
-        logging.info(f"Moved file {filepath} to {mounted_path} (UNC path: {unc_path})")
-        return {"mounted_path": mounted_path, "unc_path": unc_path}
+        logging.info(f"Moved file {filepath} to {mounted_path} (UNC path: {smb_paths['unc_path']})")
+        return {**smb_paths, "duplicate": False}
     except Exception as e:
         logging.error(f"Failed to move file {filepath} to SMB upstream: {e}")
         return None
-    
+
+def drop_duplicate_file(filepath, file_hash, upstream_smb_config):
+    try:
+        os.remove(filepath)
+        logging.info(f"File {filepath} was already processed, dropped it without copying.")
+        return {**upstream_smb_paths(file_hash, upstream_smb_config), "duplicate": True}
+    except Exception as e:
+        logging.error(f"Failed to drop duplicate file {filepath}: {e}")
+        return None
+
 def remove_file_from_smb(filepath):
     try:
         os.remove(filepath)
@@ -1,23 +1,29 @@
 import asyncio
-import json
 import logging
+import os
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer
 from core.entities.scrap import Scrap
-from core.services.smb_service import move_file_to_upstream_smb
+from core.services.hash_dedup_cache import HashDedupCache
+from core.services.hashing_service import HashingService
+from core.services.kafka_publisher import KafkaPublisher
+from core.services.lanes import LaneRouter
+from core.services.message_codec import MessageCodec
+from core.services.smb_service import drop_duplicate_file, move_file_to_upstream_smb
 
 class CollectorSystem:
-    def __init__(self, app, collectors):
+    def __init__(self, app, collectors, dedup_cache: HashDedupCache = None):
         self.logger = logging.getLogger(__name__)
         self.collectors = collectors
+        self.dedup_cache = dedup_cache
+        self.hashing_service: HashingService = app.make('HashingService')
+        self.message_codec: MessageCodec = app.make('MessageCodec')
         self.kafka_config = app.configuration.get_kafka_config()
         self.upstream_smb_config = app.configuration.get_upstream_smb_config()
         self.loop = asyncio.get_event_loop()
 
-        self.producer = AIOKafkaProducer(
-            loop=self.loop,
-            bootstrap_servers=self.kafka_config['bootstrap_servers']
-        )
+        self.publisher: KafkaPublisher = app.make('KafkaPublisher')
+        self.lane_router: LaneRouter = app.make('LaneRouter')
 
         self.notification_consumer = AIOKafkaConsumer(
             self.kafka_config['notification_topic'],
@@ -26,22 +32,34 @@ class CollectorSystem:
             group_id="notification_group"
         )
 
-        self.topic = self.kafka_config['topic']
+        # Collectors hand scraps to a bounded queue drained by the publishers.
+        # When upstream storage or Kafka fall behind the queue fills up and
+        # collectors are paused at their next yield.
+        collector_config = app.configuration.get_collector_config()
         self.processing_scraps = set()
-        self.max_concurrent_collectors = 10
+        self.max_concurrent_collectors = collector_config['max_concurrent_collectors']
         self.semaphore = asyncio.Semaphore(self.max_concurrent_collectors)
+        self.publish_workers = collector_config['publish_workers']
+        self.scrap_queue = asyncio.Queue(maxsize=collector_config['queue_size'])
+        self.inline_max_size = collector_config['inline_max_size']
 
     async def run(self):
-        await self.producer.start()
+        await self.publisher.start()
         await self.notification_consumer.start()
 
         try:
             await asyncio.gather(
                 self._run_collectors(),
+                self._run_publishers(),
                 self._consume_notifications()
             )
         finally:
-            await self.producer.stop()
+            for collector in self.collectors:
+                try:
+                    await collector.close()
+                except Exception as e:
+                    self.logger.exception(f"Error closing collector {collector}: {e}")
+            await self.publisher.stop()
             await self.notification_consumer.stop()
 
     async def _run_collectors(self):
@@ -56,48 +74,116 @@ class CollectorSystem:
     async def _collect_scraps(self, collector):
         async with self.semaphore:
             try:
-                scraps = await collector.collect()
-                if not scraps:
-                    return
+                async for scrap in collector.stream():
+                    if not scrap.hash:
+                        scrap.hash = await self.hashing_service.hash_file(scrap.file_path)
+                        scrap.hash_algorithm = self.hashing_service.algorithm
+
+                    if scrap.size is None:
+                        scrap.size = await asyncio.to_thread(os.path.getsize, scrap.file_path)
+
+                    if not scrap.prefix_fingerprint:
+                        scrap.prefix_fingerprint = await self.hashing_service.fingerprint_file(scrap.file_path)
 
-                for scrap in scraps:
                     if scrap.hash in self.processing_scraps:
                         continue
 
                     self.processing_scraps.add(scrap.hash)
-                    smb_paths = move_file_to_upstream_smb(scrap.file_path, scrap.filename, self.upstream_smb_config)
-
-                    if smb_paths:
-                        await self._handle_new_scrap(scrap, smb_paths)
+                    await self.scrap_queue.put(scrap)
 
             except Exception as e:
                 self.logger.exception(f"Error running collector {collector}: {e}")
 
+    async def _run_publishers(self):
+        await asyncio.gather(*[self._run_publisher() for _ in range(self.publish_workers)])
+
+    async def _run_publisher(self):
+        while True:
+            scrap = await self.scrap_queue.get()
+            try:
+                smb_paths = await self._ship_to_upstream(scrap)
+
+                if smb_paths:
+                    await self._handle_new_scrap(scrap, smb_paths)
+                else:
+                    self.processing_scraps.discard(scrap.hash)
+            except Exception as e:
+                self.processing_scraps.discard(scrap.hash)
+                self.logger.exception(f"Error shipping scrap {scrap.filename}: {e}")
+            finally:
+                self.scrap_queue.task_done()
+
+    async def _ship_to_upstream(self, scrap: Scrap):
+        # Already processed content is only announced, so the processing side
+        # can record the duplicate without the file being copied again.
+        if self.dedup_cache is not None and scrap.hash_algorithm == self.dedup_cache.hash_algorithm \
+                and await self.dedup_cache.is_processed(scrap.hash, scrap.prefix_fingerprint):
+            return await asyncio.to_thread(drop_duplicate_file, scrap.file_path, scrap.hash, self.upstream_smb_config)
+
+        # Small scraps travel inside the message itself; the local file is
+        # kept until the broker has it and never touches the share.
+        if self.message_codec.inline_payloads and scrap.size is not None and scrap.size <= self.inline_max_size:
+            scrap.content = await asyncio.to_thread(self._read_inline_content, scrap.file_path)
+            if scrap.content is not None:
+                return {"duplicate": False}
+
+        return await asyncio.to_thread(move_file_to_upstream_smb, scrap.file_path, scrap.hash, self.upstream_smb_config)
+
+    def _read_inline_content(self, file_path: str):
+        try:
+            with open(file_path, 'rb') as file:
+                content = file.read(self.inline_max_size + 1)
+        except Exception as e:
+            self.logger.error(f"Failed to read {file_path} for inlining: {e}")
+            return None
+
+        # The file grew since it was hashed; let the share take it.
+        if len(content) > self.inline_max_size:
+            return None
+        return content
+
+    def _drop_inlined_file(self, file_path: str):
+        try:
+            os.remove(file_path)
+            self.logger.info(f"File {file_path} was published inline, dropped the local copy.")
+        except Exception as e:
+            self.logger.error(f"Failed to drop inlined file {file_path}: {e}")
+
     async def _handle_new_scrap(self, scrap: Scrap, smb_paths: dict):
         try:
             await self._publish_scrap(scrap, smb_paths)
         except Exception as e:
+            self.processing_scraps.discard(scrap.hash)
             self.logger.exception(f"Error handling new scrap {scrap.filename}: {e}")
-        finally:
-            self.processing_scraps.remove(scrap.hash)
 
     async def _publish_scrap(self, scrap: Scrap, smb_paths: dict):
-        try:
-            message = {
-                "scrap_data": scrap.to_json(),
-                "mounted_path": smb_paths.get("mounted_path"),
-                "unc_path": smb_paths.get("unc_path")
-            }
-
-            await self.producer.send_and_wait(self.topic, json.dumps(message).encode('utf-8'))
-            self.logger.info(f"Published scrap {scrap.filename} to Kafka.")
-        except Exception as e:
-            self.logger.exception(f"Error publishing scrap {scrap.filename} to Kafka: {e}")
+        inline = scrap.content is not None
+
+        # The hash stays claimed until the broker has the message, so the same
+        # content is not published twice while the send is in flight.
+        def on_delivery(error):
+            self.processing_scraps.discard(scrap.hash)
+            if error is None:
+                self.logger.info(f"Published scrap {scrap.filename} to Kafka.")
+                if inline:
+                    self.loop.run_in_executor(None, self._drop_inlined_file, scrap.file_path)
+
+        # Each size lane has its own topic, so small scraps never queue behind
+        # large ones. Keyed by hash so every message for the same content lands
+        # on one partition and is processed in publish order.
+        message = self.message_codec.encode_scrap(scrap, smb_paths)
+        scrap.content = None
+        await self.publisher.publish(
+            self.lane_router.lane_for(scrap.size).topic,
+            message,
+            key=scrap.hash.encode('utf-8'),
+            on_delivery=on_delivery
+        )
 
     async def _consume_notifications(self):
         try:
             async for msg in self.notification_consumer:
-                notification = json.loads(msg.value.decode('utf-8'))
+                notification = self.message_codec.decode_notification(msg.value)
                 scrap_hash = notification.get("hash")
                 if notification.get("status") == "PROCESSED" and scrap_hash in self.processing_scraps:
                     self.processing_scraps.remove(scrap_hash)
@@ -1,67 +1,228 @@
 import asyncio
 import logging
-import json
 import os
 import platform
+import time
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener
 from core.entities.scrap import Scrap
+from core.repositories.elastic_repository import ElasticRepository
 from core.repositories.postgres_repository import PostgresRepository
+from core.services.adaptive_limiter import AdaptiveLimiter
+from core.services.kafka_publisher import KafkaPublisher
+from core.services.lanes import LaneLimiter, LaneRouter
+from core.services.message_codec import MessageCodec
+from core.services.offset_tracker import OffsetTracker
 from core.services.smb_service import remove_file_from_smb
 
+class _OffsetCommitListener(ConsumerRebalanceListener):
+    def __init__(self, processing_system):
+        self.processing_system = processing_system
+
+    async def on_partitions_revoked(self, revoked):
+        # Offsets finished so far are committed while the partitions are still
+        # ours; messages still in flight are redelivered to the new owner.
+        await self.processing_system.commit_offsets(revoked)
+        self.processing_system.offset_tracker.forget(revoked)
+
+    async def on_partitions_assigned(self, assigned):
+        pass
+
+
 class ProcessingSystem:
     def __init__(self, app, processors, repository: PostgresRepository):
         self.logger = logging.getLogger(__name__)
         self.processors = processors
         self.repository = repository
         self.kafka_config = app.configuration.get_kafka_config()
-        self.processing_scraps = set()
-        self.max_concurrent_scraps = 100
+        self.message_codec: MessageCodec = app.make('MessageCodec')
+        # Hash -> event set once the scrap with that content is processed.
+        self.processing_scraps = {}
+        self.commit_interval = self.kafka_config['commit_interval']
 
         self.consumer = AIOKafkaConsumer(
-            self.kafka_config['topic'],
             bootstrap_servers=self.kafka_config['bootstrap_servers'],
             group_id="processing_group",
             enable_auto_commit=False,
-            max_poll_records=100
+            max_poll_records=self.kafka_config['max_poll_records']
         )
         
-        self.producer = AIOKafkaProducer(
-            bootstrap_servers=self.kafka_config['bootstrap_servers']
-        )
+        self.publisher: KafkaPublisher = app.make('KafkaPublisher')
+        self.lane_router: LaneRouter = app.make('LaneRouter')
+        self.lane_limiters = {lane.name: LaneLimiter(lane) for lane in self.lane_router.lanes}
 
-        self.semaphore = asyncio.Semaphore(self.max_concurrent_scraps)
+        # Scraps in flight are bounded by a limit that follows Postgres and
+        # Elasticsearch latency and errors, between the configured floor and
+        # ceiling.
+        self.elastic_repository: ElasticRepository = app.make('ElasticRepository')
+        self.limiter = AdaptiveLimiter(
+            'Processing',
+            app.configuration.get_adaptive_concurrency_config(),
+            {"postgres": repository.latency, "elasticsearch": self.elastic_repository.indexer.latency}
+        )
+        self.offset_tracker = OffsetTracker()
+        self.commit_lock = asyncio.Lock()
+        self.tasks = set()
+        self.processed = 0
+        self.failed = 0
 
     async def run(self):
+        # The plain topic is still read so messages published before lanes
+        # were configured are drained.
+        topics = list(dict.fromkeys(self.lane_router.topics() + [self.kafka_config['topic']]))
+        self.consumer.subscribe(topics, listener=_OffsetCommitListener(self))
         await self.consumer.start()
-        await self.producer.start()
+        await self.publisher.start()
 
+        commit_task = asyncio.create_task(self._commit_periodically())
+        limiter_task = asyncio.create_task(self.limiter.run())
         try:
-            while True:
-                msgs = await self.consumer.getmany(timeout_ms=1000)
-                tasks = []
-                for topic_partition, batch in msgs.items():
-                    for msg in batch:
-                        scrap_data = json.loads(msg.value.decode('utf-8'))
-                        scrap = Scrap.from_json(scrap_data['scrap_data'])
-
-                        if scrap.hash in self.processing_scraps:
-                            continue
-
-                        self.processing_scraps.add(scrap.hash)
-                        
-                        file_path = self._get_platform_specific_path(scrap_data)
-
-                        scrap.file_path = file_path
-                        
-                        tasks.append(self.process_with_semaphore(scrap))
-                        remove_file_from_smb(file_path)
-
-                await asyncio.gather(*tasks)
-                await self.consumer.commit()
+            await self._consume()
         finally:
+            commit_task.cancel()
+            limiter_task.cancel()
+            # The last partial bulk request is sent before offsets are
+            # committed for the scraps waiting on it.
+            await self.elastic_repository.close()
+            await self.commit_offsets()
+            await self.repository.flush_updates()
             await self.consumer.stop()
-            await self.producer.stop()
+            await self.publisher.stop()
+
+    async def _consume(self):
+        # Messages are handed to workers as soon as a slot frees up instead of
+        # batch by batch, so one large scrap does not hold back the rest.
+        while True:
+            free_slots = self.limiter.current_limit - len(self.tasks)
+            self._apply_backpressure(free_slots)
+
+            msgs = await self.consumer.getmany(
+                timeout_ms=1000 if free_slots > 0 else 100,
+                max_records=max(1, free_slots)
+            )
+            for topic_partition, batch in msgs.items():
+                lane = self.lane_router.lane_for_topic(topic_partition.topic)
+                limiter = self.lane_limiters[lane.name] if lane is not None else None
+                for msg in batch:
+                    # The fetch is sized by the free global slots, not by the
+                    # lane; what the lane has no room for is fetched again once
+                    # it has, instead of waiting in a task that holds a slot.
+                    if limiter is not None and limiter.is_full():
+                        self.consumer.seek(topic_partition, msg.offset)
+                        break
+                    self._dispatch(topic_partition, msg, limiter)
+
+    def _apply_backpressure(self, free_slots: int):
+        # Paused partitions are still polled, which keeps the consumer in its
+        # group while every worker is busy, but nothing new is fetched. A lane
+        # at its concurrency or memory budget only pauses its own topic.
+        assignment = self.consumer.assignment()
+        if free_slots <= 0:
+            paused = set(assignment)
+        else:
+            paused = {tp for tp in assignment if self._lane_is_full(tp.topic)}
+
+        if paused:
+            self.consumer.pause(*paused)
+        resumed = self.consumer.paused() - paused
+        if resumed:
+            self.consumer.resume(*resumed)
+
+    def _lane_is_full(self, topic: str) -> bool:
+        lane = self.lane_router.lane_for_topic(topic)
+        return lane is not None and self.lane_limiters[lane.name].is_full()
+
+    def _dispatch(self, topic_partition, msg, limiter: LaneLimiter = None):
+        self.offset_tracker.track(topic_partition, msg.offset)
+        task = asyncio.create_task(self._process_message(topic_partition, msg))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if limiter is not None:
+            limiter.dispatch()
+            task.add_done_callback(lambda _: limiter.done())
+
+    async def _process_message(self, topic_partition, msg):
+        try:
+            scrap, scrap_data = self.message_codec.decode_scrap(msg.value)
+
+            # A redelivered message for content still being processed, e.g.
+            # after a rebalance handed its partition back, only completes
+            # once the original has, so its offset is not committed early.
+            # Scraps without a hash cannot be told apart and are never held.
+            running = self.processing_scraps.get(scrap.hash) if scrap.hash else None
+            if running is not None:
+                await running.wait()
+                return
+
+            done = asyncio.Event()
+            if scrap.hash:
+                self.processing_scraps[scrap.hash] = done
+            try:
+                # Inline scraps keep the collector's path for reference only;
+                # their content came with the message.
+                if scrap.content is None:
+                    scrap.file_path = self._get_platform_specific_path(scrap_data)
+
+                lane = self.lane_router.lane_for_topic(msg.topic) or self.lane_router.lane_for(scrap.size)
+                await self.process_in_lane(lane, scrap, scrap_data.get('duplicate', False), msg.timestamp)
+            finally:
+                if scrap.hash:
+                    del self.processing_scraps[scrap.hash]
+                done.set()
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            self.logger.exception(f"Error processing message {topic_partition}@{msg.offset}: {e}")
+        finally:
+            self.offset_tracker.complete(topic_partition, msg.offset)
+
+    async def process_in_lane(self, lane, scrap: Scrap, duplicate: bool, published_at_ms):
+        limiter = self.lane_limiters[lane.name]
+        size = scrap.size or 0
+
+        await limiter.acquire(size)
+        started_at = time.time()
+        try:
+            await self.process_with_semaphore(scrap, duplicate)
+        finally:
+            await limiter.release(size)
+            limiter.record(published_at_ms / 1000 if published_at_ms else None, started_at)
+
+    async def _commit_periodically(self):
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            await self.commit_offsets()
+
+    async def commit_offsets(self, partitions=None):
+        async with self.commit_lock:
+            offsets = self.offset_tracker.committable()
+            if partitions is not None:
+                offsets = {tp: offset for tp, offset in offsets.items() if tp in partitions}
+            if not offsets:
+                return
+
+            # Buffered state updates must reach Postgres before the offsets
+            # are committed, or a crash would drop them with the messages.
+            if not await self.repository.flush_updates():
+                return
+
+            try:
+                await self.consumer.commit(offsets)
+                self.offset_tracker.mark_committed(offsets)
+            except Exception as e:
+                self.logger.error(f"Failed to commit offsets {offsets}: {e}")
+
+    def get_health(self):
+        return {
+            "in_flight": len(self.tasks),
+            "uncommitted": self.offset_tracker.pending(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "publisher": self.publisher.get_metrics(),
+            "write_buffer": self.repository.get_flush_metrics(),
+            "lanes": {name: limiter.get_metrics() for name, limiter in self.lane_limiters.items()},
+            "concurrency": self.limiter.get_metrics(),
+        }
 
     def _get_platform_specific_path(self, scrap_data):
         if platform.system() == 'Windows':
@@ -69,10 +230,19 @@ class ProcessingSystem:
         else:
             return scrap_data.get('mounted_path')
 
-    async def process_with_semaphore(self, scrap):
-        async with self.semaphore:
-            await self.process_scrap(scrap)
-            self.processing_scraps.remove(scrap.hash)
+    async def process_with_semaphore(self, scrap, duplicate=False):
+        inline = scrap.content is not None
+        async with self.limiter:
+            try:
+                await self.process_scrap(scrap)
+            finally:
+                scrap.content = None
+
+            # The upstream copy is removed once processed, not when the message
+            # is read. Duplicates only point at a copy owned by another message,
+            # and inline scraps never had one.
+            if not duplicate and not inline:
+                await asyncio.to_thread(remove_file_from_smb, scrap.file_path)
 
     async def process_scrap(self, scrap: Scrap):
         applicable_processors = [p for p in self.processors if p.can_process(scrap)]
@@ -82,14 +252,17 @@ class ProcessingSystem:
         await self.notify_producer_scrap_processed(scrap)
 
     async def notify_producer_scrap_processed(self, scrap: Scrap):
+        def on_delivery(error):
+            if error is None:
+                self.logger.info(f"Notified producer that scrap {scrap.id} has been processed.")
+
         try:
             message = {
                 "scrap_id": scrap.id,
                 "hash": scrap.hash,
                 "status": "PROCESSED"
             }
-            message_data = json.dumps(message).encode('utf-8')
-            await self.producer.send_and_wait(self.kafka_config['notification_topic'], message_data)
-            self.logger.info(f"Notified producer that scrap {scrap.id} has been processed.")
+            message_data = self.message_codec.encode_notification(message)
+            await self.publisher.publish(self.kafka_config['notification_topic'], message_data, on_delivery=on_delivery)
         except Exception as e:
             self.logger.exception(f"Error notifying producer for scrap {scrap.id}: {e}")
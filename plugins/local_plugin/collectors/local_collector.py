@@ -1,59 +1,92 @@
+import asyncio
 import logging
 import os
 from datetime import datetime
 from core.collectors.plugin_collector_interface import PluginCollectorInterface
 from core.entities.scrap import Scrap
 from core.repositories.postgres_repository import PostgresRepository
+from core.services.hashing_service import HashingService
 from plugins.local_plugin.services.local_service import LocalService
-from rust_bindings import calculate_file_hash
 
 class LocalCollector(PluginCollectorInterface):
     def __init__(self, app):
         self.logger = logging.getLogger(__name__)
         self.local_service: LocalService = app.make('LocalService')
         self.repository: PostgresRepository = app.make('PostgresRepository')
+        self.hashing_service: HashingService = app.make('HashingService')
 
-    async def collect(self):
+    async def stream(self):
         scrape_files = await self.local_service.fetch_scrape_files()
-        new_scraps = []
         if not scrape_files:
             self.logger.info("No new files to process.")
-            return new_scraps
+            return
 
+        processing_filenames = set(await self.repository.get_processing_filenames())
+
+        # Files with a known hash are yielded right away; the rest are hashed
+        # on the bounded pool and yielded in completion order.
+        hashing = set()
         for file_info in scrape_files:
-            filename = file_info['filename']
-            file_path = file_info['file_path']
-            
-            if filename in await self.repository.get_processing_filenames():
-                return
+            if file_info['filename'] in processing_filenames:
+                continue
 
-            try:
-                file_hash = calculate_file_hash(file_path)
-            except Exception as e:
-                self.logger.exception(f"Error processing file {file_path}: {e}")
+            # Hashes recorded under another algorithm are recomputed.
+            if file_info.get('hash') and file_info.get('hash_algorithm') == self.hashing_service.algorithm:
+                yield self._scrap_for(file_info, file_info['hash'])
                 continue
 
-            occurrence_time = self._get_file_modification_time(file_path)
-            creation_time = self._get_file_creation_time(file_path)
+            hashing.add(asyncio.create_task(self._hash_file(file_info)))
+            if len(hashing) >= self.hashing_service.workers:
+                done, hashing = await asyncio.wait(hashing, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        yield task.result()
+
+        while hashing:
+            done, hashing = await asyncio.wait(hashing, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result():
+                    yield task.result()
 
-            scrap = self.create_scrap(
-                file_hash,
-                filename,
-                file_path,
-                creation_time,
-                occurrence_time
-            )
+    async def _hash_file(self, file_info):
+        file_path = file_info['file_path']
+        try:
+            file_hash = await self.hashing_service.hash_file(file_path)
+        except Exception as e:
+            self.logger.exception(f"Error processing file {file_path}: {e}")
+            return None
 
-            new_scraps.append(scrap)
-            
-        return new_scraps
+        self.local_service.record_file_hash(file_info, file_hash, self.hashing_service.algorithm)
+        return self._scrap_for(file_info, file_hash)
+
+    async def close(self):
+        # Joins the watcher thread and saves the journal, so a restart does
+        # not report the files of the last journal_interval again.
+        await asyncio.to_thread(self.local_service.stop)
+
+    def _scrap_for(self, file_info, file_hash):
+        file_path = file_info['file_path']
+        occurrence_time = self._get_file_modification_time(file_path)
+        creation_time = self._get_file_creation_time(file_path)
+
+        # The stat fingerprint is (size, mtime, inode).
+        return self.create_scrap(
+            file_hash,
+            file_info['filename'],
+            file_path,
+            creation_time,
+            occurrence_time,
+            file_info['fingerprint'][0]
+        )
 
-    def create_scrap(self, file_hash, filename, file_path, creation_time, occurrence_time):
+    def create_scrap(self, file_hash, filename, file_path, creation_time, occurrence_time, size=None):
         return Scrap(
             hash=file_hash,
+            hash_algorithm=self.hashing_service.algorithm,
             source='local',
             filename=filename,
             file_path=file_path,
+            size=size,
             timestamp=creation_time,
             occurrence_time=occurrence_time
         )
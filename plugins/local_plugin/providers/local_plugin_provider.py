@@ -1,13 +1,24 @@
 from core.providers.plugin_provider import PluginProvider
 from plugins.local_plugin.collectors.local_collector import LocalCollector
 from plugins.local_plugin.processors.local_processor import LocalProcessor
+from plugins.local_plugin.services.directory_watcher import DirectoryWatcher
 from plugins.local_plugin.services.local_service import LocalService
 
 class LocalPluginProvider(PluginProvider):
     def register(self):
+        config = self.app.configuration
+        watch_directory = config.get('local_plugin.watch_directory', './data/local_ingest')
+
         self.app.bind('LocalService', lambda: LocalService(
-            self.app.configuration.get('local_plugin.watch_directory', './data/local_ingest'),
-            self.app.configuration.get('local_plugin.processed_directory', './data/local_ingest_processed'),
+            watch_directory,
+            config.get('local_plugin.processed_directory', './data/local_ingest_processed'),
+            DirectoryWatcher(
+                watch_directory,
+                journal_path=config.get('local_plugin.journal_path', './data/local_ingest_journal.json'),
+                watch_mode=config.get('local_plugin.watch_mode', 'auto'),
+                stable_seconds=float(config.get('local_plugin.stable_seconds', 2)),
+                scan_interval=float(config.get('local_plugin.scan_interval', 10)),
+            )
         ))
 
         local_collector = LocalCollector(self.app)
@@ -17,4 +28,7 @@ class LocalPluginProvider(PluginProvider):
         self.processors.append(local_processor)
 
     def boot(self):
-        pass
\ No newline at end of file
+        # Only the main process collects; processing workers leave the
+        # directory and its journal alone.
+        if self.app.worker_id is None:
+            self.app.make('LocalService').start()
\ No newline at end of file
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            if event.event_type in ('created', 'moved'):
+                self.watcher.request_rescan()
+            return
+
+        self.watcher.mark_changed(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.watcher.mark_changed(dest_path)
+
+
+class DirectoryWatcher:
+    # Files are tracked by a stat fingerprint (size, mtime, inode) in a journal
+    # that survives restarts. Change notifications (inotify on Linux) name the
+    # paths to re-stat; without them, or with watch_mode scan, the tree is
+    # re-stated against the journal every scan_interval. Either way a file is
+    # reported once its fingerprint has stayed the same for stable_seconds,
+    # and its hash is kept until the fingerprint changes. A reported file that
+    # is still there reemit_interval later, because it was skipped or failed
+    # downstream, is reported again. poll() runs off the event loop; the other
+    # methods only touch state guarded by changed_lock.
+    def __init__(
+        self,
+        directory: str,
+        journal_path: str = None,
+        watch_mode: str = 'auto',
+        stable_seconds: float = 2.0,
+        rescan_interval: float = 3600,
+        scan_interval: float = 10,
+        reemit_interval: float = 300,
+        journal_interval: float = 30
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.journal_path = journal_path
+        self.watch_mode = watch_mode
+        self.stable_seconds = stable_seconds
+        self.rescan_interval = rescan_interval
+        self.scan_interval = scan_interval
+        self.reemit_interval = reemit_interval
+        self.journal_interval = journal_interval
+
+        self.journal = {}
+        self.pending = set()
+        self.emitted = set()
+        self.changed = set()
+        self.hashes = {}
+        self.changed_lock = threading.Lock()
+        self.rescan_due = True
+        self.rescanned_at = 0.0
+        self.journal_dirty = False
+        self.journal_saved_at = 0.0
+        self.observer = None
+
+    def start(self):
+        self._load_journal()
+
+        if self.watch_mode == 'scan':
+            return
+        if Observer is None:
+            self.logger.warning("watchdog is not installed, falling back to stat journal scans.")
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.observer = Observer()
+            self.observer.schedule(_ChangeHandler(self), self.directory, recursive=True)
+            self.observer.start()
+            self.logger.info(f"Watching {self.directory} for changes with {type(self.observer).__name__}.")
+        except Exception as e:
+            self.observer = None
+            self.logger.warning(f"Failed to watch {self.directory}, falling back to stat journal scans: {e}")
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        self._save_journal()
+
+    def mark_changed(self, path: str):
+        with self.changed_lock:
+            self.changed.add(path)
+
+    def request_rescan(self):
+        self.rescan_due = True
+
+    def poll(self):
+        now = time.time()
+
+        rescan_interval = self.scan_interval if self.observer is None else self.rescan_interval
+        if self.rescan_due or now - self.rescanned_at >= rescan_interval:
+            self._rescan(now)
+        else:
+            with self.changed_lock:
+                changed, self.changed = self.changed, set()
+            for path in changed:
+                self._observe(path, now)
+
+        with self.changed_lock:
+            hashes, self.hashes = self.hashes, {}
+        for path, (fingerprint, file_hash, hash_algorithm) in hashes.items():
+            entry = self.journal.get(path)
+            if entry is not None and entry['fingerprint'] == fingerprint:
+                entry['hash'] = file_hash
+                entry['hash_algorithm'] = hash_algorithm
+                self.journal_dirty = True
+
+        for path in list(self.emitted):
+            entry = self.journal.get(path)
+            if entry is None:
+                self.emitted.discard(path)
+            elif now - entry['emitted_at'] >= self.reemit_interval:
+                self.emitted.discard(path)
+                self.pending.add(path)
+
+        ready = []
+        for path in list(self.pending):
+            self._observe(path, now)
+            entry = self.journal.get(path)
+            if entry is None:
+                continue
+            if now - entry['changed_at'] < self.stable_seconds:
+                continue
+            if entry.get('emitted_at') and now - entry['emitted_at'] < self.reemit_interval:
+                continue
+
+            entry['emitted_at'] = now
+            self.journal_dirty = True
+            self.pending.discard(path)
+            self.emitted.add(path)
+            ready.append({
+                "file_path": path,
+                "filename": os.path.basename(path),
+                "hash": entry.get('hash'),
+                "hash_algorithm": entry.get('hash_algorithm', 'sha256'),
+                "fingerprint": entry['fingerprint'],
+            })
+
+        if self.journal_dirty and now - self.journal_saved_at >= self.journal_interval:
+            self._save_journal()
+
+        return ready
+
+    def record_hash(self, path: str, fingerprint, file_hash: str, hash_algorithm: str):
+        with self.changed_lock:
+            self.hashes[path] = (fingerprint, file_hash, hash_algorithm)
+
+    def _rescan(self, now):
+        self.rescan_due = False
+        self.rescanned_at = now
+        with self.changed_lock:
+            self.changed = set()
+
+        seen = set()
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                seen.add(path)
+                self._observe(path, now)
+
+        for path in set(self.journal) - seen:
+            self._forget(path)
+
+    def _observe(self, path, now):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._forget(path)
+            return
+
+        fingerprint = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        entry = self.journal.get(path)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            emitted_at = entry.get('emitted_at')
+            if not emitted_at or now - emitted_at >= self.reemit_interval:
+                self.pending.add(path)
+            else:
+                self.emitted.add(path)
+            return
+
+        self.journal[path] = {"fingerprint": fingerprint, "changed_at": now}
+        self.emitted.discard(path)
+        self.pending.add(path)
+        self.journal_dirty = True
+
+    def _forget(self, path):
+        self.pending.discard(path)
+        self.emitted.discard(path)
+        if self.journal.pop(path, None) is not None:
+            self.journal_dirty = True
+
+    def _load_journal(self):
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return
+
+        try:
+            with open(self.journal_path, 'r') as file:
+                self.journal = json.load(file)
+            self.logger.info(f"Loaded stat journal with {len(self.journal)} files from {self.journal_path}.")
+        except Exception as e:
+            self.journal = {}
+            self.logger.error(f"Failed to load stat journal {self.journal_path}: {e}")
+
+    def _save_journal(self):
+        self.journal_saved_at = time.time()
+        if not self.journal_path or not self.journal_dirty:
+            return
+
+        try:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary_path = f"{self.journal_path}.tmp"
+            with open(temporary_path, 'w') as file:
+                json.dump(self.journal, file)
+            os.replace(temporary_path, self.journal_path)
+            self.journal_dirty = False
+        except Exception as e:
+            self.logger.error(f"Failed to save stat journal {self.journal_path}: {e}")
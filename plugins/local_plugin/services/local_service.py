@@ -3,32 +3,34 @@ import logging
 import os
 import shutil
 import zstandard as zstd
+from plugins.local_plugin.services.directory_watcher import DirectoryWatcher
 
 
 class LocalService:
-    def __init__(self, directory: str, processed_directory: str):
+    def __init__(self, directory: str, processed_directory: str, watcher: DirectoryWatcher = None):
         self.logger = logging.getLogger(__name__)
         self.directory = directory
         self.processed_directory = processed_directory
+        self.watcher = watcher or DirectoryWatcher(directory)
 
         os.makedirs(self.processed_directory, exist_ok=True)
 
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stop()
+
     async def fetch_scrape_files(self):
-        scrape_files = []
         try:
-            loop = asyncio.get_running_loop()
-            for root, _, files in await loop.run_in_executor(None, os.walk, self.directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    scrape_files.append({
-                        "file_path": file_path,
-                        "filename": os.path.basename(file_path),
-                    })
-            return scrape_files
+            return await asyncio.to_thread(self.watcher.poll)
         except Exception as e:
             self.logger.exception(f"Error fetching scrape files: {e}")
             return []
-        
+
+    def record_file_hash(self, file_info, file_hash: str, hash_algorithm: str):
+        self.watcher.record_hash(file_info['file_path'], file_info['fingerprint'], file_hash, hash_algorithm)
+
     def read_file_content(self, file_path: str) -> bytes:
         try:
             if file_path.endswith('.zst'):
@@ -49,21 +51,6 @@ class LocalService:
             self.logger.exception(f"Error decompressing file {file_path}: {e}")
             raise
 
-    async def fetch_scrape_files(self):
-            scrape_files = []
-            try:
-                for root, _, files in os.walk(self.directory):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        scrape_files.append({
-                            "file_path": file_path,
-                            "filename": os.path.basename(file_path),
-                        })
-                return scrape_files
-            except Exception as e:
-                self.logger.exception(f"Error fetching scrape files: {e}")
-                return []
-
     def move_file_to_processed(self, file_path: str):
         try:
             if os.path.exists(file_path):
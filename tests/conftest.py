@@ -0,0 +1,22 @@
+import asyncio
+import inspect
+import os
+import sys
+
+import pytest
+
+# Tests import the application packages (core, plugins) from the repo root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # Coroutine tests run to completion on a fresh event loop of their own,
+    # so test modules write `async def test_...` instead of wrapping each
+    # body in asyncio.run.
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+
+    parameters = inspect.signature(pyfuncitem.obj).parameters
+    asyncio.run(pyfuncitem.obj(**{name: pyfuncitem.funcargs[name] for name in parameters}))
+    return True
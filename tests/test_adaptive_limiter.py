@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from core.services.adaptive_limiter import AdaptiveLimiter, LatencyStats
+
+CONFIG = {
+    "min_limit": 2,
+    "max_limit": 10,
+    "initial_limit": 4,
+    "increase": 2,
+    "decrease": 0.5,
+    "error_rate": 0.1,
+    "min_samples": 5,
+    "latency_targets": {"postgres": 0.1},
+}
+
+
+def make_limiter(**overrides):
+    stats = LatencyStats()
+    return AdaptiveLimiter("test", {**CONFIG, **overrides}, {"postgres": stats}), stats
+
+
+def record(stats, count, seconds=0.01, errors=0):
+    for i in range(count):
+        stats.record(seconds, error=i < errors)
+
+
+async def saturate(limiter):
+    for _ in range(limiter.current_limit):
+        await limiter.acquire()
+    for _ in range(limiter.current_limit):
+        await limiter.release()
+
+
+def test_latency_stats_drain():
+    stats = LatencyStats()
+    for i in range(1, 11):
+        stats.record(i / 10, error=i == 10)
+
+    assert stats.drain() == (10, 1, 1.0)
+    assert stats.drain() == (0, 0, None)
+
+
+async def test_limit_grows_when_healthy_and_saturated():
+    limiter, stats = make_limiter()
+    await saturate(limiter)
+    record(stats, 10)
+    await limiter.adjust()
+
+    assert limiter.current_limit == 6
+    assert limiter.get_metrics()["increases"] == 1
+
+
+async def test_limit_holds_when_not_saturated():
+    limiter, stats = make_limiter()
+    record(stats, 10)
+    await limiter.adjust()
+
+    assert limiter.current_limit == 4
+
+
+@pytest.mark.parametrize("seconds, errors, reason", [(0.5, 0, "p90 latency"), (0.01, 5, "error rate")])
+async def test_limit_drops_on_slow_or_failing_dependency(seconds, errors, reason):
+    limiter, stats = make_limiter(initial_limit=8)
+    record(stats, 10, seconds=seconds, errors=errors)
+    await limiter.adjust()
+
+    assert limiter.current_limit == 4
+    assert reason in limiter.get_metrics()["last_reason"]
+
+
+async def test_too_few_samples_do_not_vote():
+    limiter, stats = make_limiter(initial_limit=8)
+    record(stats, 4, seconds=1.0, errors=4)
+    await limiter.adjust()
+
+    assert limiter.current_limit == 8
+
+
+async def test_limit_stays_within_bounds():
+    limiter, stats = make_limiter()
+    for _ in range(5):
+        record(stats, 10, seconds=1.0)
+        await limiter.adjust()
+    assert limiter.current_limit == 2
+
+    for _ in range(10):
+        await saturate(limiter)
+        record(stats, 10)
+        await limiter.adjust()
+    assert limiter.current_limit == 10
+
+
+async def test_acquire_waits_below_limit():
+    limiter, _ = make_limiter(initial_limit=2)
+    await limiter.acquire()
+    await limiter.acquire()
+
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    await limiter.release()
+    await asyncio.wait_for(waiting, 1)
+    assert limiter.in_flight == 2
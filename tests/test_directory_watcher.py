@@ -0,0 +1,98 @@
+import os
+
+from plugins.local_plugin.services.directory_watcher import DirectoryWatcher
+
+
+def make_watcher(directory, **overrides):
+    options = {"watch_mode": "scan", "stable_seconds": 0, "scan_interval": 0, "reemit_interval": 300}
+    watcher = DirectoryWatcher(str(directory), **{**options, **overrides})
+    watcher.start()
+    return watcher
+
+
+def write(path, content=b'user@example.com:hunter2\n'):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def paths(ready):
+    return sorted(os.path.basename(file_info['file_path']) for file_info in ready)
+
+
+def test_files_are_reported_once_stable(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path, stable_seconds=3600)
+    assert watcher.poll() == []
+
+    watcher.stable_seconds = 0
+    ready = watcher.poll()
+    assert paths(ready) == ['a.txt']
+    assert ready[0]['fingerprint'][0] == os.path.getsize(tmp_path / 'a.txt')
+
+
+def test_unchanged_files_are_not_reported_again(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path)
+    assert paths(watcher.poll()) == ['a.txt']
+
+    write(tmp_path / 'b.txt')
+    assert paths(watcher.poll()) == ['b.txt']
+    assert watcher.poll() == []
+
+
+def test_changed_files_are_reported_again(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path)
+    assert paths(watcher.poll()) == ['a.txt']
+
+    write(tmp_path / 'a.txt', b'changed and longer content\n')
+    assert paths(watcher.poll()) == ['a.txt']
+
+
+def test_files_still_there_are_reemitted(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path, reemit_interval=300)
+    assert paths(watcher.poll()) == ['a.txt']
+    assert watcher.poll() == []
+
+    watcher.reemit_interval = 0
+    assert paths(watcher.poll()) == ['a.txt']
+
+
+def test_removed_files_are_forgotten(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path)
+    watcher.poll()
+
+    os.remove(tmp_path / 'a.txt')
+    assert watcher.poll() == []
+    assert watcher.journal == {}
+    assert watcher.emitted == set()
+
+
+def test_recorded_hashes_are_reported(tmp_path):
+    write(tmp_path / 'a.txt')
+    watcher = make_watcher(tmp_path)
+    file_info = watcher.poll()[0]
+
+    watcher.record_hash(file_info['file_path'], file_info['fingerprint'], 'abcd', 'blake3')
+    watcher.reemit_interval = 0
+    file_info = watcher.poll()[0]
+    assert (file_info['hash'], file_info['hash_algorithm']) == ('abcd', 'blake3')
+
+
+def test_journal_survives_restarts(tmp_path):
+    directory = tmp_path / 'ingest'
+    directory.mkdir()
+    write(directory / 'a.txt')
+    journal_path = str(tmp_path / 'journal.json')
+
+    watcher = make_watcher(directory, journal_path=journal_path, journal_interval=0)
+    assert paths(watcher.poll()) == ['a.txt']
+    watcher.stop()
+
+    restarted = make_watcher(directory, journal_path=journal_path)
+    assert restarted.poll() == []
+
+    restarted.reemit_interval = 0
+    assert paths(restarted.poll()) == ['a.txt']
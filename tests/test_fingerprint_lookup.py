@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from core.services.fingerprint_lookup import FingerprintLookup
+
+
+class FakeRepository:
+    def __init__(self, indexed, fail=False):
+        self.indexed = indexed
+        self.fail = fail
+        self.queries = []
+
+    async def find_elastic_ids_by_fingerprints(self, fingerprints):
+        self.queries.append(sorted(fingerprints))
+        if self.fail:
+            raise ConnectionError("database is gone")
+        return {fingerprint: self.indexed[fingerprint] for fingerprint in fingerprints if fingerprint in self.indexed}
+
+
+async def test_concurrent_lookups_share_one_query():
+    repository = FakeRepository({"a": "es-a", "c": "es-c"})
+    lookup = FingerprintLookup(repository, max_batch=100, max_wait=0.01)
+    results = await asyncio.gather(*(lookup.find(fingerprint) for fingerprint in ["a", "b", "c", "a"]))
+
+    assert results == ["es-a", None, "es-c", "es-a"]
+    assert repository.queries == [["a", "b", "c"]]
+
+
+async def test_full_batches_are_sent_right_away():
+    repository = FakeRepository({})
+    lookup = FingerprintLookup(repository, max_batch=2, max_wait=60)
+    await asyncio.wait_for(asyncio.gather(*(lookup.find(str(i)) for i in range(4))), 1)
+
+    assert repository.queries == [["0", "1"], ["2", "3"]]
+
+
+async def test_failed_lookup_reads_as_not_indexed():
+    lookup = FingerprintLookup(FakeRepository({"a": "es-a"}, fail=True), max_wait=0)
+
+    assert await lookup.find("a") is None
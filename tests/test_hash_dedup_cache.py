@@ -0,0 +1,110 @@
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from core.services.hash_dedup_cache import BloomFilter, HashDedupCache
+
+
+class FakeRepository:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.since = []
+
+    async def iter_processed_hashes(self, since, hash_algorithm):
+        self.since.append(since)
+        for row in self.rows:
+            yield row
+
+    async def is_hash_processed(self, file_hash, hash_algorithm=None):
+        return any(row[0] == file_hash for row in self.rows)
+
+
+def content_hash(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def processed_rows(count):
+    return [(content_hash(i), f"fp-{i}", datetime(2024, 10, 1, 12, i % 60)) for i in range(count)]
+
+
+def make_cache(repository, snapshot_path=None, **config):
+    config = {"capacity": 1000, "error_rate": 0.01, "snapshot_path": snapshot_path, **config}
+    return HashDedupCache(repository, config, {"algorithm": "sha256", "prefix_fingerprint": True})
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(*BloomFilter.size_for(1000, 0.01))
+    values = [content_hash(i) for i in range(500)] + [f"fp-{i}" for i in range(500)]
+    for value in values:
+        bloom.add(value)
+
+    assert all(value in bloom for value in values)
+    false_positives = sum(content_hash(i) in bloom for i in range(1000, 11000))
+    assert false_positives < 300
+
+
+async def test_snapshot_round_trip(tmp_path):
+    snapshot_path = str(tmp_path / "dedup.snapshot")
+    rows = processed_rows(100)
+    cache = make_cache(FakeRepository(rows), snapshot_path)
+    await cache.warm()
+
+    assert os.path.exists(snapshot_path)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+    repository = FakeRepository()
+    restored = make_cache(repository, snapshot_path)
+    await restored.warm()
+
+    assert restored.bloom.count == 100
+    assert restored.bloom.bits == cache.bloom.bits
+    assert restored.fingerprints.bits == cache.fingerprints.bits
+    assert restored.watermark == cache.watermark
+    # Only rows from shortly before the snapshot's watermark are read again.
+    assert repository.since[0] is not None and repository.since[0] < cache.watermark
+    assert all(file_hash in restored.bloom for file_hash, _, _ in rows)
+
+
+async def test_snapshot_with_other_settings_is_ignored(tmp_path):
+    snapshot_path = str(tmp_path / "dedup.snapshot")
+    await make_cache(FakeRepository(processed_rows(10)), snapshot_path).warm()
+
+    resized = make_cache(FakeRepository(), snapshot_path, capacity=5000)
+    assert resized._load_snapshot() is False
+
+
+async def test_snapshot_of_other_version_is_ignored(tmp_path):
+    snapshot_path = str(tmp_path / "dedup.snapshot")
+    await make_cache(FakeRepository(processed_rows(10)), snapshot_path).warm()
+
+    with open(snapshot_path, 'r+b') as file:
+        file.seek(len(HashDedupCache.SNAPSHOT_MAGIC))
+        file.write(bytes([HashDedupCache.SNAPSHOT_VERSION - 1]))
+
+    assert make_cache(FakeRepository(), snapshot_path)._load_snapshot() is False
+
+
+async def test_truncated_snapshot_is_ignored(tmp_path):
+    snapshot_path = str(tmp_path / "dedup.snapshot")
+    await make_cache(FakeRepository(processed_rows(10)), snapshot_path).warm()
+
+    with open(snapshot_path, 'r+b') as file:
+        file.truncate(os.path.getsize(snapshot_path) - 1)
+
+    assert make_cache(FakeRepository(), snapshot_path)._load_snapshot() is False
+
+
+async def test_processed_hashes_and_fingerprints():
+    rows = processed_rows(50)
+    cache = make_cache(FakeRepository(rows))
+    await cache.warm()
+
+    file_hash, fingerprint, _ = rows[0]
+    assert await cache.is_processed(file_hash, fingerprint) is True
+    assert await cache.is_processed(content_hash(10_000)) is False
+    assert await cache.is_new(fingerprint) is False
+    assert await cache.is_new("fp-unknown") is True
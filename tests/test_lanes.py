@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from core.services.lanes import Lane, LaneLimiter, LaneRouter
+
+
+@pytest.fixture
+def router():
+    return LaneRouter.from_config([
+        {"name": "bulk", "topic": "scraps-bulk", "concurrency": 2},
+        {"name": "small", "topic": "scraps-small", "max_size": 1024, "concurrency": 20},
+        {"name": "medium", "topic": "scraps-medium", "max_size": 1024 * 1024, "concurrency": 8},
+    ])
+
+
+@pytest.mark.parametrize('size, lane', [
+    (0, 'small'),
+    (1024, 'small'),
+    (1025, 'medium'),
+    (1024 * 1024, 'medium'),
+    (1024 * 1024 + 1, 'bulk'),
+    (None, 'bulk'),
+])
+def test_scraps_go_to_the_first_lane_they_fit(router, size, lane):
+    assert router.lane_for(size).name == lane
+
+
+def test_lanes_are_found_by_topic(router):
+    assert router.topics() == ["scraps-small", "scraps-medium", "scraps-bulk"]
+    assert router.lane_for_topic("scraps-medium").name == "medium"
+    assert router.lane_for_topic("scraps-unknown") is None
+
+
+def test_dispatch_is_bounded_by_concurrency():
+    limiter = LaneLimiter(Lane("small", "scraps-small", concurrency=2))
+    limiter.dispatch()
+    assert not limiter.is_full()
+
+    limiter.dispatch()
+    assert limiter.is_full()
+
+    limiter.done()
+    assert not limiter.is_full()
+
+
+async def test_memory_budget_admits_oversized_scrap_when_idle():
+    limiter = LaneLimiter(Lane("bulk", "scraps-bulk", concurrency=4, memory_budget=100))
+    await asyncio.wait_for(limiter.acquire(500), 1)
+    assert limiter.is_full()
+
+    waiting = asyncio.create_task(limiter.acquire(10))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    await limiter.release(500)
+    await asyncio.wait_for(waiting, 1)
+    assert limiter.bytes_in_flight == 10
+
+
+async def test_memory_budget_bounds_bytes_in_flight():
+    limiter = LaneLimiter(Lane("medium", "scraps-medium", concurrency=4, memory_budget=100))
+    await limiter.acquire(60)
+
+    waiting = asyncio.create_task(limiter.acquire(50))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    await limiter.acquire(40)
+    await limiter.release(60)
+    await asyncio.wait_for(waiting, 1)
+    assert limiter.in_flight == 2
+    assert limiter.bytes_in_flight == 90
+
+
+def test_slo_breaches_are_counted():
+    limiter = LaneLimiter(Lane("small", "scraps-small", latency_slo=1))
+    limiter.record(published_at=100.0, started_at=200.0)
+    limiter.record(published_at=None, started_at=time.time())
+
+    metrics = limiter.get_metrics()
+    assert metrics["processed"] == 2
+    assert metrics["slo_breaches"] == 1
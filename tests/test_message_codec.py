@@ -0,0 +1,135 @@
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+import pytest
+
+pytest.importorskip('msgpack')
+pytest.importorskip('zstandard')
+
+from core.entities.scrap import Scrap
+from core.services.message_codec import MessageCodec, MessageDecodeError
+
+SMB_PATHS = {
+    "content_path": "scrapes/ab/cd/abcd",
+    "mounted_path": "/mnt/scrapes/ab/cd/abcd",
+    "unc_path": "\\\\share\\scrapes\\ab\\cd\\abcd",
+    "duplicate": True,
+}
+
+
+def make_scrap(**overrides):
+    scrap = Scrap(
+        hash='abcd',
+        hash_algorithm='blake3',
+        source='local',
+        filename='dump.txt',
+        file_path='/data/dump.txt',
+        size=12,
+        timestamp=datetime(2024, 10, 1, 12, 30),
+        occurrence_time=datetime(2024, 9, 30, 8, 0),
+    )
+    for key, value in overrides.items():
+        setattr(scrap, key, value)
+    return scrap
+
+
+@pytest.mark.parametrize('message_format', ['msgpack', 'json'])
+def test_scrap_round_trip(message_format):
+    codec = MessageCodec(message_format)
+    scrap = make_scrap()
+
+    decoded, paths = codec.decode_scrap(codec.encode_scrap(scrap, SMB_PATHS))
+
+    assert decoded == scrap
+    assert paths == SMB_PATHS
+
+
+def test_inline_scrap_round_trip():
+    codec = MessageCodec('msgpack')
+    content = b'user@example.com:hunter2\n' * 100
+    scrap = make_scrap(content=content, size=len(content))
+
+    decoded, paths = codec.decode_scrap(codec.encode_scrap(scrap, {}))
+
+    assert decoded.content == content
+    assert decoded.filename == scrap.filename
+    assert paths == {"duplicate": False}
+
+
+@dataclass
+class BaselineScrap:
+    # The Scrap of consumers from before the msgpack format.
+    id: Optional[int] = None
+    hash: Optional[str] = None
+    source: Optional[str] = None
+    filename: Optional[str] = None
+    file_path: Optional[str] = None
+    state: str = 'PROCESSING'
+    timestamp: Optional[datetime] = None
+    occurrence_time: Optional[datetime] = None
+    attachments: List = field(default_factory=list)
+
+    @staticmethod
+    def from_json(data):
+        dict_data = json.loads(data)
+        if dict_data.get('timestamp'):
+            dict_data['timestamp'] = datetime.fromisoformat(dict_data['timestamp'])
+        if dict_data.get('occurrence_time'):
+            dict_data['occurrence_time'] = datetime.fromisoformat(dict_data['occurrence_time'])
+        return BaselineScrap(**dict_data)
+
+
+def test_json_messages_are_read_by_baseline_consumers():
+    scrap = make_scrap(prefix_fingerprint='fp', sha256='ef01')
+    value = MessageCodec('json').encode_scrap(scrap, SMB_PATHS)
+
+    baseline = BaselineScrap.from_json(json.loads(value.decode('utf-8'))['scrap_data'])
+
+    assert (baseline.hash, baseline.filename, baseline.file_path) == (scrap.hash, scrap.filename, scrap.file_path)
+    assert baseline.timestamp == scrap.timestamp
+
+
+def test_json_mode_never_inlines():
+    codec = MessageCodec('json')
+    assert not codec.inline_payloads
+    assert MessageCodec('msgpack').inline_payloads
+    with pytest.raises(ValueError):
+        codec.encode_scrap(make_scrap(content=b'data'), {})
+
+
+def test_msgpack_messages_carry_the_header():
+    codec = MessageCodec('msgpack')
+    value = codec.encode_scrap(make_scrap(), SMB_PATHS)
+    assert value[:3] == MessageCodec.MAGIC + bytes([MessageCodec.VERSION])
+
+
+def test_json_and_msgpack_are_read_side_by_side():
+    reader = MessageCodec('msgpack')
+    scrap = make_scrap(prefix_fingerprint='fp', sha256='ef01')
+
+    for message_format in ('msgpack', 'json'):
+        value = MessageCodec(message_format).encode_scrap(scrap, SMB_PATHS)
+        assert reader.decode_scrap(value)[0] == scrap
+
+
+def test_notification_round_trip():
+    notification = {"scrap_id": 1, "class": "CREDENTIAL", "matches": 3}
+    for message_format in ('msgpack', 'json'):
+        codec = MessageCodec(message_format)
+        assert codec.decode_notification(codec.encode_notification(notification)) == notification
+
+
+def test_unknown_version_is_rejected():
+    codec = MessageCodec('msgpack')
+    value = codec.encode_notification({"scrap_id": 1})
+    with pytest.raises(MessageDecodeError):
+        codec.decode_notification(MessageCodec.MAGIC + bytes([MessageCodec.VERSION + 1]) + value[3:])
+
+
+def test_unknown_payload_encoding_is_rejected():
+    codec = MessageCodec('msgpack')
+    value = codec.encode_scrap(make_scrap(content=b'data'), {})
+    with pytest.raises(MessageDecodeError):
+        codec.decode_scrap(value.replace(b'zstd', b'lz4x'))
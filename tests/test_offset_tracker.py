@@ -0,0 +1,62 @@
+from core.services.offset_tracker import OffsetTracker
+
+
+def test_position_waits_for_earlier_offsets():
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.track('p0', offset)
+
+    tracker.complete('p0', 12)
+    tracker.complete('p0', 11)
+    assert tracker.committable() == {}
+
+    tracker.complete('p0', 10)
+    assert tracker.committable() == {'p0': 13}
+    assert tracker.pending() == 0
+
+
+def test_position_is_first_unfinished_offset():
+    tracker = OffsetTracker()
+    for offset in (0, 1, 2, 3):
+        tracker.track('p0', offset)
+
+    tracker.complete('p0', 0)
+    tracker.complete('p0', 2)
+    assert tracker.committable() == {'p0': 1}
+    assert tracker.pending() == 3
+
+
+def test_partitions_are_independent():
+    tracker = OffsetTracker()
+    tracker.track('p0', 5)
+    tracker.track('p1', 7)
+    tracker.track('p1', 8)
+
+    tracker.complete('p1', 7)
+    assert tracker.committable() == {'p1': 8}
+
+    tracker.complete('p0', 5)
+    assert tracker.committable() == {'p0': 6, 'p1': 8}
+
+
+def test_committed_positions_are_not_repeated():
+    tracker = OffsetTracker()
+    tracker.track('p0', 0)
+    tracker.complete('p0', 0)
+
+    tracker.mark_committed(tracker.committable())
+    assert tracker.committable() == {}
+
+    tracker.track('p0', 1)
+    tracker.complete('p0', 1)
+    assert tracker.committable() == {'p0': 2}
+
+
+def test_forgotten_partitions_ignore_late_completions():
+    tracker = OffsetTracker()
+    tracker.track('p0', 0)
+    tracker.forget(['p0'])
+
+    tracker.complete('p0', 0)
+    assert tracker.committable() == {}
+    assert tracker.pending() == 0
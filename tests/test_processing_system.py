@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aiokafka')
+pytest.importorskip('elasticsearch')
+pytest.importorskip('asyncpg')
+pytest.importorskip('rust_bindings')
+
+from core.entities.scrap import Scrap
+from core.services.lanes import Lane, LaneRouter
+from core.services.offset_tracker import OffsetTracker
+from core.systems.processing_system import ProcessingSystem
+
+
+class FakeCodec:
+    def decode_scrap(self, value):
+        hash_value, content = value
+        return Scrap(hash=hash_value, size=len(content), content=content), {}
+
+
+def make_system():
+    # Only the state _process_message touches; no Kafka, Postgres or Elastic.
+    system = ProcessingSystem.__new__(ProcessingSystem)
+    system.logger = logging.getLogger(__name__)
+    system.message_codec = FakeCodec()
+    system.processing_scraps = {}
+    system.lane_router = LaneRouter([Lane('default', 'scrapes')])
+    system.offset_tracker = OffsetTracker()
+    system.processed = 0
+    system.failed = 0
+
+    system.release = asyncio.Event()
+    system.started = []
+
+    async def process_in_lane(lane, scrap, duplicate, published_at_ms):
+        system.started.append(scrap)
+        await system.release.wait()
+
+    system.process_in_lane = process_in_lane
+    return system
+
+
+def message(offset, hash_value, content=b'user:pass'):
+    return SimpleNamespace(topic='scrapes', offset=offset, timestamp=None, value=(hash_value, content))
+
+
+async def deliver(system, *messages):
+    tasks = []
+    for msg in messages:
+        system.offset_tracker.track('p0', msg.offset)
+        tasks.append(asyncio.create_task(system._process_message('p0', msg)))
+    await asyncio.sleep(0)
+    return tasks
+
+
+async def test_scraps_without_hash_are_processed_concurrently():
+    system = make_system()
+    tasks = await deliver(system, message(0, None, b'first'), message(1, None, b'second'))
+
+    assert [scrap.content for scrap in system.started] == [b'first', b'second']
+    assert system.processing_scraps == {}
+
+    system.release.set()
+    await asyncio.gather(*tasks)
+    assert system.processed == 2
+    assert system.offset_tracker.committable() == {'p0': 2}
+
+
+async def test_redelivered_scrap_waits_for_the_original():
+    system = make_system()
+    tasks = await deliver(system, message(0, 'abcd'), message(1, 'abcd'))
+
+    assert len(system.started) == 1
+    assert system.offset_tracker.committable() == {}
+
+    system.release.set()
+    await asyncio.gather(*tasks)
+    assert system.processed == 1
+    assert system.processing_scraps == {}
+    assert system.offset_tracker.committable() == {'p0': 2}